@@ -1,5 +1,6 @@
 # app.py
 import os
+import click
 from flask import Flask
 from config import Config
 from extensions import db, bcrypt, login_manager, misaka, mail # NOUVEL IMPORT
@@ -21,10 +22,11 @@ def create_app(config_class=Config):
 
     # Importer les modèles APRES l'initialisation des extensions
     from models import User, Prompt, AIProvider
+    from cache_config import utilisateur, invalider_config
 
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return utilisateur(int(user_id))
 
     # Importer et enregistrer les blueprints
     from main import main as main_blueprint
@@ -34,8 +36,9 @@ def create_app(config_class=Config):
     @app.cli.command("init-db")
     def init_db_command():
         """Crée les tables et un utilisateur admin par défaut."""
+        from migrations import mettre_a_jour
         with app.app_context():
-            db.create_all()
+            mettre_a_jour()
             if not User.query.first():
                 admin_username = os.getenv('APP_USERNAME', 'admin')
                 admin_email = os.getenv('APP_EMAIL', 'admin@example.com')
@@ -61,7 +64,26 @@ def create_app(config_class=Config):
                     is_active=True)
                 db.session.add(default_provider)
                 
+            invalider_config()
             db.session.commit()
             print("Tables de la BDD créées et valeurs par défaut assurées.")
 
+    @app.cli.command("db-upgrade")
+    def db_upgrade_command():
+        """Met à jour le schéma d'une base existante (index, colonnes ajoutés depuis sa création)."""
+        from migrations import mettre_a_jour, version_courante
+        with app.app_context():
+            print(f"Schéma en version {version_courante()}.")
+            print(f"Schéma à jour (version {mettre_a_jour()}).")
+
+    @app.cli.command("run-worker")
+    @click.option('--intervalle', default=1.0, help="Secondes d'attente quand la file est vide.")
+    @click.option('--une-fois', is_flag=True, help="S'arrête dès que la file est vide.")
+    def run_worker_command(intervalle, une_fois):
+        """Lance le worker qui exécute les tâches de fond (générations IA)."""
+        from jobs import boucle_worker
+        with app.app_context():
+            print("Worker démarré, en attente de tâches...")
+            boucle_worker(intervalle=intervalle, une_fois=une_fois)
+
     return app
\ No newline at end of file
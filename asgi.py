@@ -0,0 +1,284 @@
+# asgi.py
+import asyncio
+import io
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+from asgiref.sync import AsyncToSync, sync_to_async
+from asgiref.wsgi import WsgiToAsgi
+from flask import url_for
+from flask_login import current_user
+from app import create_app
+from jobs import abandonner_flux, conclure_flux, echec_flux, preparer_flux, reserver
+from main import sse
+from models import db, Job
+from ordonnanceur import aouvrir_flux, candidats, config_reprises, preparer_participants
+from pipeline import DecoupeurFlux
+
+# Second point d'entrée, à côté de wsgi.py, pour un serveur ASGI :
+#
+#     uvicorn asgi:application --host 0.0.0.0 --port $PORT --workers 2
+#
+# Le flux d'une analyse (/jobs/<id>/flux), qui passe presque tout son temps à attendre le
+# fournisseur d'IA, est servi en asynchrone : client SDK asynchrone, attente de l'ordonnanceur
+# sans bloquer de thread. Un processus tient ainsi des centaines de générations simultanées
+# (PROVIDER_POOL_MAX_CONNECTIONS borne les connexions ouvertes vers chaque fournisseur).
+# Les étapes en base (réservation, cache, enregistrement de l'Analyse) sont courtes et passent
+# par un pool de ASGI_THREADS_BASE threads. Toutes les autres routes sont l'application Flask
+# habituelle, exécutée dans les threads de la boucle.
+app = create_app()
+
+RE_FLUX = re.compile(r'^/jobs/(\d+)/flux$')
+_pool_base = ThreadPoolExecutor(max_workers=app.config['ASGI_THREADS_BASE'], thread_name_prefix='asgi-base')
+
+
+def environ_wsgi(scope, corps=None):
+    """
+    Environnement WSGI (PEP 3333) d'une requête ASGI. Sans corps, il sert à ouvrir un contexte
+    de requête Flask pour le flux d'une analyse.
+    """
+    racine, chemin = scope.get('root_path', ''), scope['path']
+    if chemin.startswith(racine):
+        chemin = chemin[len(racine):]
+    serveur = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': racine.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': chemin.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': serveur[0],
+        'SERVER_PORT': str(serveur[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': corps or io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for nom, valeur in scope.get('headers', []):
+        nom, valeur = nom.decode('latin-1').upper().replace('-', '_'), valeur.decode('latin-1')
+        cle = nom if nom in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{nom}'
+        environ[cle] = f"{environ[cle]},{valeur}" if cle in environ else valeur
+    return environ
+
+
+class ReponseWsgi:
+    """
+    Réponse d'une requête WSGI relayée en messages ASGI, selon la PEP 3333 : les en-têtes
+    attendent le premier bloc non vide, start_response renvoie write et, avec exc_info,
+    remplace les en-têtes tant qu'ils ne sont pas partis (sinon l'exception est relancée).
+    """
+
+    def __init__(self, envoyer):
+        self.envoyer = envoyer
+        self.debut = None
+        self.commencee = False
+
+    def start_response(self, statut, entetes, exc_info=None):
+        if exc_info:
+            try:
+                if self.commencee:
+                    raise exc_info[1].with_traceback(exc_info[2])
+            finally:
+                exc_info = None
+        elif self.debut is not None:
+            raise AssertionError("start_response appelé deux fois sans exc_info")
+        self.debut = {
+            'type': 'http.response.start', 'status': int(statut.split(' ', 1)[0]),
+            'headers': [(nom.lower().encode('latin-1'), valeur.encode('latin-1')) for nom, valeur in entetes],
+        }
+        return self.write
+
+    def commencer(self):
+        if not self.commencee:
+            if self.debut is None:
+                raise AssertionError("réponse envoyée avant start_response")
+            self.envoyer(self.debut)
+            self.commencee = True
+
+    def write(self, donnees):
+        if donnees:
+            self.commencer()
+            self.envoyer({'type': 'http.response.body', 'body': bytes(donnees), 'more_body': True})
+
+    def terminer(self):
+        self.commencer()
+        self.envoyer({'type': 'http.response.body', 'body': b''})
+
+
+class FlaskAsgi(WsgiToAsgi):
+    """
+    Application Flask servie en ASGI. WsgiToAsgi exécute toutes les requêtes dans un thread
+    unique (thread_sensitive), ce qui les sérialise, et ce thread casse sur les connexions
+    keep-alive (« CurrentThreadExecutor already quit ») : chaque requête passe ici par le pool
+    de threads de la boucle, avec sync_to_async(..., thread_sensitive=False). Le départ du
+    client (http.disconnect) interrompt la production de la réponse.
+    """
+
+    async def __call__(self, scope, receive, send):
+        with SpooledTemporaryFile(max_size=65536) as corps:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                corps.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            corps.seek(0)
+            parti = threading.Event()
+            surveillance = asyncio.ensure_future(self.surveiller(receive, parti))
+            try:
+                await sync_to_async(self.executer, thread_sensitive=False)(scope, corps, AsyncToSync(send), parti)
+            finally:
+                surveillance.cancel()
+
+    @staticmethod
+    async def surveiller(receive, parti):
+        """Signale au thread de la requête que le client est parti."""
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        parti.set()
+
+    def executer(self, scope, corps, envoyer, parti):
+        reponse = ReponseWsgi(envoyer)
+        iterable = self.wsgi_application(environ_wsgi(scope, corps), reponse.start_response)
+        try:
+            for morceau in iterable:
+                if parti.is_set():
+                    return  # inutile de produire la suite pour personne
+                reponse.write(morceau)
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+        if not parti.is_set():
+            reponse.terminer()
+
+
+application_flask = FlaskAsgi(app)
+
+
+async def en_base(fonction, *arguments):
+    """Exécute une étape synchrone (SQLAlchemy) dans le pool de threads dédié."""
+    return await asyncio.get_running_loop().run_in_executor(_pool_base, fonction, *arguments)
+
+
+class FluxJob:
+    """Une requête /jobs/<id>/flux servie en asynchrone : même déroulé que main.flux_job."""
+
+    def __init__(self, scope, job_id):
+        self.environ = environ_wsgi(scope)
+        self.job_id = job_id
+        self.reserve = False
+        self.erreur = None
+
+    def ouvrir(self):
+        """
+        Réserve la tâche et prépare l'appel. Retourne False si la requête doit être laissée
+        à Flask (session absente, tâche inconnue ou qui n'est pas une analyse en flux :
+        redirection vers la connexion, 404).
+        """
+        with app.request_context(self.environ):
+            if not current_user.is_authenticated or not Job.query.filter_by(id=self.job_id, type='analyse_flux').first():
+                return False
+            job = reserver(self.job_id, 'analyse_flux')
+            if not job:
+                return True
+            self.reserve = True
+            try:
+                provider, self.cle, self.reponse_ia, self.nom_fournisseur = preparer_flux(job)
+                self.prompts = (job.payload['prompt_systeme'], job.payload['prompt_utilisateur'])
+                if self.reponse_ia is None:
+                    # Le fournisseur de la tâche puis, avec PROVIDER_BASCULE, ceux de secours
+                    self.participants = preparer_participants(candidats(provider), *self.prompts)
+                    self.config = config_reprises()
+            except Exception as e:
+                echec_flux(job, e)
+                self.erreur = str(e)
+            return True
+
+    def conclure(self, reponse_ia, generee):
+        with app.request_context(self.environ):
+            analyse_id = conclure_flux(db.session.get(Job, self.job_id), self.nom_fournisseur, self.cle, reponse_ia, generee)
+            return url_for('main.voir_analyse', analyse_id=analyse_id)
+
+    def echouer(self, erreur):
+        with app.request_context(self.environ):
+            echec_flux(db.session.get(Job, self.job_id), erreur)
+
+    def abandonner(self):
+        with app.request_context(self.environ):
+            abandonner_flux(db.session.get(Job, self.job_id))
+
+    async def evenements(self):
+        if not self.reserve:
+            yield sse('attente', None)
+            return
+        if self.erreur:
+            yield sse('erreur', self.erreur)
+            return
+        try:
+            decoupeur = DecoupeurFlux()
+            reponse_ia, generee = self.reponse_ia, self.reponse_ia is None
+            if not generee:
+                for evenement, donnees in decoupeur.ajouter(reponse_ia):
+                    yield sse(evenement, donnees)
+            else:
+                self.nom_fournisseur, fragments = await aouvrir_flux(self.participants, *self.prompts, self.config, app.logger)
+                morceaux = []
+                try:
+                    async for fragment in fragments:
+                        morceaux.append(fragment)
+                        for evenement, donnees in decoupeur.ajouter(fragment):
+                            yield sse(evenement, donnees)
+                finally:
+                    await fragments.aclose()
+                reponse_ia = "".join(morceaux)
+            for evenement, donnees in decoupeur.terminer():
+                yield sse(evenement, donnees)
+            yield sse('fin', await en_base(self.conclure, reponse_ia, generee))
+        except Exception as e:
+            await en_base(self.echouer, e)
+            yield sse('erreur', str(e))
+
+    async def servir(self, send):
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]})
+        try:
+            async for message in self.evenements():
+                await send({'type': 'http.response.body', 'body': message.encode('utf-8'), 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            # Requête annulée (arrêt du serveur, client parti) : la tâche ne reste pas 'en_cours'
+            if self.reserve:
+                await en_base(self.abandonner)
+
+
+async def cycle_de_vie(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            _pool_base.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await cycle_de_vie(receive, send)
+    correspondance = RE_FLUX.match(scope['path']) if scope['type'] == 'http' and scope['method'] == 'GET' else None
+    if correspondance:
+        flux = FluxJob(scope, int(correspondance.group(1)))
+        if await en_base(flux.ouvrir):
+            return await flux.servir(send)
+    await application_flask(scope, receive, send)
@@ -0,0 +1 @@
+# benchmarks : outils de mesure et de test de charge de l'application (hors production)
@@ -0,0 +1,95 @@
+# benchmarks/bench_memoire.py
+"""
+Mémoire de pointe (RSS) de la réception et de l'extraction d'un export PDF de classe,
+selon sa taille, sur des bulletins synthétiques (benchmarks.bulletins).
+
+    python -m benchmarks.bench_memoire --pages 50,200,800 --backend pdfplumber
+
+Chaque mesure tourne dans un processus neuf (ru_maxrss ne redescend jamais) et compare :
+  - en mémoire : fichier.read(), BytesIO et toutes les pages pdfplumber gardées jusqu'à la fin
+    (comportement d'origine d'analyser) ;
+  - en flux : recevoir() (copie par blocs sur disque) puis iterer_pages() page par page.
+Le RSS rapporté est la pointe du processus moins celle mesurée juste avant le traitement.
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+from benchmarks.bulletins import NOMS, PRENOMS, classe_synthetique, lignes_bulletin, pdf_depuis_pages
+
+
+def _en_memoire(chemin, backend):
+    import pdfplumber
+    with open(chemin, 'rb') as fichier:
+        pdf_bytes = fichier.read()
+    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+        return len([texte for texte in (page.extract_text() for page in pdf.pages) if texte])
+
+
+def _en_flux(chemin, backend):
+    from flask import Flask
+    from werkzeug.datastructures import FileStorage
+    from config import Config
+    from extraction import iterer_pages
+    from televersement import recevoir
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config.update(PDF_BACKEND=backend, PDF_PROCESSUS=1)
+    with app.app_context(), open(chemin, 'rb') as flux:
+        with recevoir(FileStorage(stream=flux, filename='classe.pdf')) as televersement:
+            return sum(1 for _ in iterer_pages(televersement.chemin))
+
+
+VARIANTES = {'en mémoire': _en_memoire, 'en flux': _en_flux}
+
+
+def _mesurer(variante, chemin, backend, resultats):
+    # Imports faits avant la mesure de référence : seul le traitement est compté
+    import pdfplumber, pypdfium2, flask  # noqa: F401
+    import extraction, televersement, config  # noqa: F401
+    avant = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    debut = time.perf_counter()
+    nb_pages = VARIANTES[variante](chemin, backend)
+    duree = time.perf_counter() - debut
+    resultats.put((nb_pages, (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - avant) / 1024, duree))
+
+
+def mesurer(variante, chemin, backend):
+    contexte = multiprocessing.get_context('spawn')
+    resultats = contexte.Queue()
+    processus = contexte.Process(target=_mesurer, args=(variante, chemin, backend, resultats))
+    processus.start()
+    resultat = resultats.get()
+    processus.join()
+    return resultat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', default='50,200,800')
+    parser.add_argument('--backend', default='pdfplumber', choices=('pdfplumber', 'pypdfium2'))
+    parser.add_argument('--graine', type=int, default=42)
+    args = parser.parse_args()
+
+    alea = random.Random(args.graine)
+    with tempfile.TemporaryDirectory() as dossier:
+        for nb_pages in (int(n) for n in args.pages.split(',')):
+            chemin = os.path.join(dossier, f"classe_{nb_pages}.pdf")
+            # Un bulletin synthétique tient sur une page ; au-delà des noms disponibles, un export d'établissement
+            # contient plusieurs classes et les mêmes noms reviennent
+            eleves = classe_synthetique(min(nb_pages, len(NOMS) * len(PRENOMS)), alea)
+            with open(chemin, 'wb') as fichier:
+                fichier.write(pdf_depuis_pages([lignes_bulletin(eleves[i % len(eleves)], alea=alea) for i in range(nb_pages)]))
+            print(f"{nb_pages} pages ({os.path.getsize(chemin) // 1024} Ko), backend {args.backend}")
+            for variante in VARIANTES:
+                pages, rss, duree = mesurer(variante, chemin, args.backend)
+                print(f"  {variante:<11} RSS de pointe +{rss:7.1f} Mo   {duree:6.2f} s   ({pages} pages lues)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# benchmarks/bench_parser.py
+"""
+Micro-benchmark du parser de bulletins sur des classes synthétiques de 35 élèves.
+
+    python -m benchmarks.bench_parser --classes 20 --matieres 14
+
+Compare, par bulletin :
+  - analyser_texte_bulletin : parser construit à chaque appel (motifs recompilés) ;
+  - alternance simple : ParserBulletin réutilisé, motif « A|B|C » non factorisé ;
+  - ParserBulletin (trie) : parser de la classe réutilisé via analyser_lot.
+"""
+import argparse
+import random
+import re
+import statistics
+import time
+from parser import ParserBulletin, analyser_texte_bulletin
+
+MATIERES = [
+    "FRANCAIS", "MATHEMATIQUES", "HISTOIRE-GEOGRAPHIE", "HISTOIRE-GEO. EMC", "ANGLAIS LV1", "ESPAGNOL LV2",
+    "ALLEMAND LV2", "PHYSIQUE-CHIMIE", "SCIENCES VIE & TERRE", "SC. ECONO.& SOCIALES", "ED.PHYSIQUE & SPORT.",
+    "ENS. MORAL & CIVIQUE", "SCIENCES NUMERIQUES", "PHILOSOPHIE", "MATHS EXPERTES", "MUSIQUE", "ARTS PLASTIQUES",
+]
+COMMENTAIRES = [
+    "Bon travail, continuez ainsi.", "Des efforts à poursuivre, l'oral doit progresser.",
+    "Trimestre sérieux mais des résultats irréguliers.", "Excellent trimestre, élève moteur en classe.",
+    "Travail insuffisant, il faut se mettre au travail rapidement.",
+]
+
+
+def bulletin_synthetique(nom, matieres, alea):
+    """Texte au format de l'extraction PDF d'un bulletin (tableau des appréciations puis bilan)."""
+    lignes = ["Bulletin du 1er trimestre", f"Eleve : {nom}", "Appréciations"]
+    for matiere in matieres:
+        if alea.random() < 0.05:
+            lignes += [matiere, "Mme LEROY N.Not non évalué"]
+        else:
+            note = f"{alea.uniform(4, 19):.2f}".replace('.', ',')
+            lignes += [matiere, f"M. DUPONT-MARTIN {note} 11,20 / 3 {alea.choice(COMMENTAIRES)}"]
+    lignes += [
+        f"Moyenne générale {alea.uniform(8, 17):.2f}".replace('.', ','),
+        f"Appréciation globale : {alea.choice(COMMENTAIRES)}", "Mentions",
+    ]
+    return "\n".join(lignes)
+
+
+def classe_synthetique(nb_eleves, nb_matieres, alea):
+    matieres = alea.sample(MATIERES, nb_matieres)
+    bulletins = [(f"ELEVE{i:02d} Prénom", bulletin_synthetique(f"ELEVE{i:02d} Prénom", matieres, alea)) for i in range(nb_eleves)]
+    return matieres, bulletins
+
+
+def mesurer(fonction, repetitions):
+    """Meilleur temps (s) sur plusieurs répétitions, pour limiter le bruit."""
+    temps = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        fonction()
+        temps.append(time.perf_counter() - debut)
+    return min(temps)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--classes', type=int, default=20)
+    parser.add_argument('--eleves', type=int, default=35)
+    parser.add_argument('--matieres', type=int, default=14)
+    parser.add_argument('--repetitions', type=int, default=5)
+    parser.add_argument('--graine', type=int, default=42)
+    args = parser.parse_args()
+
+    alea = random.Random(args.graine)
+    classes = [classe_synthetique(args.eleves, args.matieres, alea) for _ in range(args.classes)]
+    nb_bulletins = args.classes * args.eleves
+
+    def sans_cache():
+        for matieres, bulletins in classes:
+            for nom, texte in bulletins:
+                analyser_texte_bulletin(texte, nom, matieres)
+
+    parsers_simples = []
+    for matieres, _ in classes:
+        simple = ParserBulletin(matieres)
+        simple.re_matieres = re.compile("|".join(re.escape(m) for m in matieres))
+        parsers_simples.append(simple)
+    parsers = [ParserBulletin(matieres) for matieres, _ in classes]
+
+    # Les deux variantes doivent produire exactement le même résultat
+    for simple, trie, (_, bulletins) in zip(parsers_simples, parsers, classes):
+        assert simple.analyser_lot(bulletins) == trie.analyser_lot(bulletins)
+
+    resultats = [
+        ("analyser_texte_bulletin", mesurer(sans_cache, args.repetitions)),
+        ("alternance simple", mesurer(lambda: [p.analyser_lot(b) for p, (_, b) in zip(parsers_simples, classes)], args.repetitions)),
+        ("ParserBulletin (trie)", mesurer(lambda: [p.analyser_lot(b) for p, (_, b) in zip(parsers, classes)], args.repetitions)),
+    ]
+    construction = statistics.mean(
+        mesurer(lambda: ParserBulletin(matieres), args.repetitions) for matieres, _ in classes
+    )
+
+    print(f"{args.classes} classes x {args.eleves} élèves, {args.matieres} matières ({nb_bulletins} bulletins)")
+    print(f"Construction d'un ParserBulletin : {construction * 1e6:.0f} µs (une fois par classe)")
+    reference = resultats[0][1]
+    for nom, duree in resultats:
+        print(f"  {nom:<26} {duree / nb_bulletins * 1e6:8.1f} µs/bulletin   x{reference / duree:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# benchmarks/bench_prompt.py
+"""
+Micro-benchmark de budget_prompt.compacter sur des bulletins synthétiques (benchmarks.bulletins,
+analysés par ParserBulletin), avec les appréciations des deux trimestres précédents.
+
+    python -m benchmarks.bench_prompt --eleves 35 --budgets 0,500,450,400
+
+Pour chaque budget : tokens du prompt avant et après (moyenne par élève, estimation à
+4 caractères par token comme l'ordonnanceur), part économisée, élèves hors budget et
+durée de construction du prompt. Le budget 0 ne fait que retirer les espaces superflus.
+"""
+import argparse
+import random
+import time
+from types import SimpleNamespace
+from flask import Flask
+from budget_prompt import compacter
+from config import Config
+from parser import ParserBulletin
+from benchmarks.bulletins import COMMENTAIRES, MATIERES, classe_synthetique, lignes_bulletin
+
+GABARIT = """Rédige une appréciation pour l'élève {nom_eleve} pour le trimestre {trimestre}.
+Contexte important : {contexte_trimestre}
+
+{appreciations_precedentes}
+
+Voici les données BRUTES du trimestre actuel :
+{liste_appreciations}
+
+Ta réponse doit être en DEUX parties, séparées par "--- JUSTIFICATIONS ---"."""
+
+
+def precedentes_synthetiques(alea):
+    """Appréciations de T1 et T2, avec les espaces et retours à la ligne d'un copier-coller."""
+    return {
+        t: "  \n".join(f"{phrase}   " for phrase in alea.sample(COMMENTAIRES, 5))
+        for t in (1, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--eleves', type=int, default=35)
+    parser.add_argument('--budgets', default='0,500,450,400')
+    parser.add_argument('--repetitions', type=int, default=5)
+    parser.add_argument('--graine', type=int, default=42)
+    args = parser.parse_args()
+
+    alea = random.Random(args.graine)
+    analyseur = ParserBulletin(MATIERES)
+    eleves = [
+        (nom, analyseur.analyser("\n".join(lignes_bulletin(nom, MATIERES, 3, alea)), nom), precedentes_synthetiques(alea))
+        for nom in classe_synthetique(args.eleves, alea)
+    ]
+    prompt = SimpleNamespace(system_message="Tu es un professeur principal.", user_message_template=GABARIT)
+    provider = SimpleNamespace(name='Bench', model_name='mistral-large-latest')
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.logger.setLevel('ERROR')  # avertissements « hors budget » comptés dans le tableau
+    with app.app_context():
+        print(f"{args.eleves} élèves, {len(MATIERES)} matières, trimestre 3 avec T1 et T2")
+        for budget in (int(b) for b in args.budgets.split(',')):
+            app.config['PROMPT_BUDGET_TOKENS'] = budget
+            durees, resultats = [], []
+            for _ in range(args.repetitions):
+                debut = time.perf_counter()
+                resultats = [compacter(prompt, provider, nom, 3, donnees, precedentes) for nom, donnees, precedentes in eleves]
+                durees.append(time.perf_counter() - debut)
+            avant = sum(r.tokens_initiaux for r in resultats) / len(resultats)
+            apres = sum(r.tokens for r in resultats) / len(resultats)
+            hors_budget = sum(1 for r in resultats if budget and r.tokens > budget)
+            print(f"  budget {budget or '—':>5} : {avant:6.0f} -> {apres:6.0f} tokens/élève "
+                  f"(-{(1 - apres / avant) * 100:4.1f} %), hors budget {hors_budget}, "
+                  f"{min(durees) / len(eleves) * 1e6:7.1f} µs/élève")
+
+
+if __name__ == '__main__':
+    main()
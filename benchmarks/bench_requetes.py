@@ -0,0 +1,166 @@
+# benchmarks/bench_requetes.py
+"""
+Latence des requêtes sur la table analyse, sans puis avec les index composites
+(migration 1), sur une base remplie de plusieurs dizaines de milliers d'analyses.
+
+    python -m benchmarks.bench_requetes --classes 40 --generations 7
+    python -m benchmarks.bench_requetes --base postgresql://localhost/bench
+
+Sans --base, une base SQLite temporaire est utilisée. ATTENTION : la base est vidée.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from flask import Flask
+from sqlalchemy import insert, text
+from extensions import db
+from models import Analyse, Classe, Eleve, TexteBulletin, compresser_json
+from migrations import _index_analyse
+from pipeline import appreciations_precedentes
+from requetes import dernieres_analyses
+
+TEXTE_BULLETIN = "Appréciations\n" + "MATHEMATIQUES\nM. DUPONT 12,50 Bon travail, continuez ainsi.\n" * 60
+
+
+def remplir(nb_classes, nb_eleves, generations, alea):
+    db.session.execute(insert(Classe), [
+        {'id': c, 'annee_scolaire': '2024-2025', 'nom_classe': f'C{c}'}
+        for c in range(1, nb_classes + 1)
+    ])
+    db.session.execute(insert(Eleve), [
+        {'id': id_eleve(c, e, nb_eleves), 'classe_id': c, 'nom': nom_eleve(e), 'position': e, 'actif': True}
+        for c in range(1, nb_classes + 1) for e in range(nb_eleves)
+    ])
+    debut = datetime(2024, 9, 1)
+    texte_id = TexteBulletin.enregistrer(TEXTE_BULLETIN)
+    donnees = compresser_json({'appreciations_matieres': [{'matiere': 'MATHEMATIQUES', 'moyenne': '12.50', 'commentaire': 'Bon travail'}] * 12})
+    lignes = []
+    for classe_id in range(1, nb_classes + 1):
+        for e in range(nb_eleves):
+            for trimestre in (1, 2, 3):
+                for g in range(generations):
+                    lignes.append({
+                        'classe_id': classe_id, 'nom_eleve': nom_eleve(e), 'eleve_id': id_eleve(classe_id, e, nb_eleves),
+                        'trimestre': trimestre,
+                        'appreciation_principale': "Élève sérieux. " * 20, 'justifications': "- **Sérieux**",
+                        'donnees': donnees, 'texte_id': texte_id,
+                        'prompt_name': 'Défaut', 'provider_name': 'Mistral',
+                        'created_at': debut + timedelta(days=90 * trimestre, minutes=alea.randrange(10000)),
+                    })
+    alea.shuffle(lignes)  # ordre d'insertion réaliste : les classes sont analysées en parallèle
+    for i in range(0, len(lignes), 5000):
+        db.session.execute(insert(Analyse), lignes[i:i + 5000])
+    db.session.commit()
+    return len(lignes)
+
+
+def nom_eleve(e):
+    return f'ELEVE{e:02d} Prénom'
+
+
+def id_eleve(classe_id, e, nb_eleves):
+    return (classe_id - 1) * nb_eleves + e + 1
+
+
+def ancien_rappel(classe_id, nom_eleve, trimestre):
+    """Version d'origine : une requête par trimestre précédent, sur le nom de l'élève."""
+    texte = ""
+    for t in range(1, trimestre):
+        analyse = Analyse.query.filter_by(classe_id=classe_id, nom_eleve=nom_eleve, trimestre=t).first()
+        if analyse:
+            texte += f"Appréciation du Trimestre {t}:\n{analyse.appreciation_principale}\n\n"
+    return texte
+
+
+def ancien_export(classe_id, trimestre):
+    """Version d'origine de download_bulk_pdf : toutes les analyses puis une requête par élève."""
+    noms = sorted({a.nom_eleve for a in Analyse.query.filter_by(classe_id=classe_id, trimestre=trimestre).all()})
+    return [
+        Analyse.query.filter_by(classe_id=classe_id, trimestre=trimestre, nom_eleve=nom).order_by(Analyse.created_at.desc()).first()
+        for nom in noms
+    ]
+
+
+def mesurer(fonction, echantillons, alea):
+    """Médiane en millisecondes, la session étant vidée avant chaque appel (pas de cache d'identité)."""
+    durees = []
+    for _ in range(echantillons):
+        arguments = fonction.arguments(alea)
+        db.session.expunge_all()
+        debut = time.perf_counter()
+        fonction(*arguments)
+        durees.append((time.perf_counter() - debut) * 1000)
+    return statistics.median(durees)
+
+
+def scenarios(nb_classes, nb_eleves):
+    def eleve(alea):
+        return alea.randint(1, nb_classes), nom_eleve(alea.randrange(nb_eleves)), 3
+
+    def eleve_id(alea):
+        return id_eleve(alea.randint(1, nb_classes), alea.randrange(nb_eleves), nb_eleves), 3
+
+    def classe(alea):
+        return alea.randint(1, nb_classes), alea.randint(1, 3)
+
+    def historique(classe_id, trimestre):
+        return Analyse.query.filter_by(classe_id=classe_id).with_entities(Analyse.id, Analyse.trimestre).all()
+
+    resultat = [
+        ("rappel T3 : une requête par trimestre", ancien_rappel, eleve),
+        ("rappel T3 : appreciations_precedentes", appreciations_precedentes, eleve_id),
+        ("export classe : N+1 d'origine", ancien_export, classe),
+        ("export classe : dernieres_analyses", dernieres_analyses, classe),
+        ("historique d'une classe (ids)", historique, classe),
+    ]
+    for _, fonction, arguments in resultat:
+        fonction.arguments = arguments
+    return [(nom, fonction) for nom, fonction, _ in resultat]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base', help="URL SQLAlchemy de la base de test (défaut : SQLite temporaire).")
+    parser.add_argument('--classes', type=int, default=40)
+    parser.add_argument('--eleves', type=int, default=35)
+    parser.add_argument('--generations', type=int, default=7, help="Analyses par élève et par trimestre.")
+    parser.add_argument('--echantillons', type=int, default=50)
+    parser.add_argument('--graine', type=int, default=42)
+    args = parser.parse_args()
+
+    dossier = tempfile.mkdtemp()
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.base or f"sqlite:///{os.path.join(dossier, 'bench.db')}"
+    db.init_app(app)
+    alea = random.Random(args.graine)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        for index in Analyse.__table__.indexes:
+            index.drop(db.engine)
+        debut = time.perf_counter()
+        nb = remplir(args.classes, args.eleves, args.generations, alea)
+        print(f"{nb} analyses insérées en {time.perf_counter() - debut:.1f} s ({app.config['SQLALCHEMY_DATABASE_URI']})")
+
+        mesures = {}
+        for etape in ("sans index", "avec index"):
+            if etape == "avec index":
+                _index_analyse()
+            db.session.execute(text("ANALYZE"))
+            db.session.commit()
+            for nom, fonction in scenarios(args.classes, args.eleves):
+                mesures.setdefault(nom, []).append(mesurer(fonction, args.echantillons, random.Random(args.graine)))
+
+        print(f"\n{'requête':<42} {'sans index':>12} {'avec index':>12}")
+        for nom, (avant, apres) in mesures.items():
+            print(f"{nom:<42} {avant:>9.2f} ms {apres:>9.2f} ms")
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+# benchmarks/bulletins.py
+"""
+Bulletins PDF synthétiques, à la mise en page attendue par parser.py
+(« Appréciations » ... matière, professeur, moyenne, commentaire ... « Moyenne générale »,
+« Appréciation globale : ... Mentions »). Aucune dépendance : le PDF est écrit à la main.
+
+    python -m benchmarks.bulletins --eleves 30 --sortie /tmp/classe.pdf
+    python -m benchmarks.bulletins --eleves 30 --zip --sortie /tmp/classe.zip
+"""
+import argparse
+import io
+import random
+import textwrap
+import zipfile
+
+MATIERES = [
+    'MATHEMATIQUES', 'FRANCAIS', 'HISTOIRE-GEOGRAPHIE', 'ANGLAIS LV1', 'ESPAGNOL LV2',
+    'PHYSIQUE-CHIMIE', 'SCIENCES VIE & TERRE', 'TECHNOLOGIE', 'EDUCATION PHYSIQUE & SPORTIVE',
+    'ARTS PLASTIQUES', 'EDUCATION MUSICALE',
+]
+NOMS = ['MARTIN', 'BERNARD', 'THOMAS', 'PETIT', 'ROBERT', 'RICHARD', 'DURAND', 'DUBOIS', 'MOREAU', 'LAURENT',
+        'SIMON', 'MICHEL', 'LEFEBVRE', 'LEROY', 'ROUX', 'DAVID', 'BERTRAND', 'MOREL', 'FOURNIER', 'GIRARD']
+PRENOMS = ['Léa', 'Hugo', 'Chloé', 'Louis', 'Emma', 'Jules', 'Inès', 'Gabriel', 'Zoé', 'Arthur',
+           'Manon', 'Raphaël', 'Jade', 'Nathan', 'Camille', 'Noé', 'Lina', 'Adam', 'Élise', 'Théo']
+PROFESSEURS = ['M. DUPONT', 'Mme LEBLANC', 'M. GARNIER', 'Mme FAURE', 'M. ROUSSEL', 'Mme BLANC-MERCIER']
+COMMENTAIRES = [
+    "Bon travail, continuez ainsi.", "Des efforts à poursuivre, notamment à l'oral.",
+    "Trimestre solide, participation active et pertinente.", "Résultats fragiles, le travail personnel doit s'intensifier.",
+    "Élève sérieux et appliqué, de réels progrès.", "Ensemble correct mais un manque de rigueur dans les rendus.",
+    "Très bon trimestre, bravo.", "Bavardages trop fréquents qui nuisent aux résultats.",
+]
+
+LIGNES_PAR_PAGE = 60
+LARGEUR_LIGNE = 95
+
+
+def classe_synthetique(nb_eleves, alea=None):
+    """Noms d'élèves distincts « NOM Prénom » pour une classe de nb_eleves."""
+    alea = alea or random.Random(0)
+    noms = set()
+    while len(noms) < nb_eleves:
+        noms.add(f"{alea.choice(NOMS)} {alea.choice(PRENOMS)}")
+    return sorted(noms)
+
+
+def lignes_bulletin(nom_eleve, matieres=MATIERES, trimestre=1, alea=None):
+    """Lignes de texte d'un bulletin, dans l'ordre où pdfplumber les restitue."""
+    alea = alea or random.Random(nom_eleve)
+    lignes = [
+        "Collège Jean Moulin - Année scolaire 2024-2025",
+        f"Bulletin du trimestre {trimestre}",
+        f"Élève : {nom_eleve}",
+        "Appréciations",
+    ]
+    for matiere in matieres:
+        moyenne = f"{alea.uniform(6, 19):.2f}".replace('.', ',')
+        notes = " ".join(f"{alea.randint(5, 20)}/20" for _ in range(alea.randint(2, 4)))
+        commentaire = " ".join(alea.sample(COMMENTAIRES, 2))
+        lignes.append(matiere)
+        lignes += textwrap.wrap(f"{alea.choice(PROFESSEURS)} {moyenne} {notes} {commentaire}", LARGEUR_LIGNE)
+    lignes.append(f"Moyenne générale {alea.uniform(8, 17):.2f}".replace('.', ','))
+    lignes += textwrap.wrap(f"Appréciation globale : {' '.join(alea.sample(COMMENTAIRES, 3))}", LARGEUR_LIGNE)
+    lignes += ["Mentions", "Le chef d'établissement"]
+    return lignes
+
+
+def _echapper(ligne):
+    return ligne.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def pdf_depuis_pages(pages):
+    """PDF minimal (Helvetica, WinAnsiEncoding) : une page par liste de lignes, coupée à LIGNES_PAR_PAGE."""
+    decoupees = [page[i:i + LIGNES_PAR_PAGE] for page in pages for i in range(0, max(len(page), 1), LIGNES_PAR_PAGE)]
+    objets = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+              b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"]
+    enfants = []
+    for lignes in decoupees:
+        numero_page, numero_contenu = len(objets) + 1, len(objets) + 2
+        enfants.append(f"{numero_page} 0 R")
+        flux = ("BT /F1 9 Tf 12 TL 40 800 Td " + " ".join(f"({_echapper(l)}) Tj T*" for l in lignes) + " ET").encode('cp1252', 'replace')
+        objets.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {numero_contenu} 0 R "
+                      f"/Resources << /Font << /F1 3 0 R >> >> >>".encode())
+        objets.append(b"<< /Length %d >>\nstream\n" % len(flux) + flux + b"\nendstream")
+    objets[1] = f"<< /Type /Pages /Kids [{' '.join(enfants)}] /Count {len(enfants)} >>".encode()
+
+    sortie = io.BytesIO()
+    sortie.write(b"%PDF-1.4\n")
+    positions = []
+    for numero, objet in enumerate(objets, start=1):
+        positions.append(sortie.tell())
+        sortie.write(b"%d 0 obj\n" % numero + objet + b"\nendobj\n")
+    xref = sortie.tell()
+    sortie.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objets) + 1))
+    sortie.write(b"".join(b"%010d 00000 n \n" % p for p in positions))
+    sortie.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objets) + 1, xref))
+    return sortie.getvalue()
+
+
+def pdf_eleve(nom_eleve, matieres=MATIERES, trimestre=1, alea=None):
+    """Bulletin PDF d'un élève."""
+    return pdf_depuis_pages([lignes_bulletin(nom_eleve, matieres, trimestre, alea)])
+
+
+def pdf_classe(eleves, matieres=MATIERES, trimestre=1, alea=None):
+    """Export PDF d'une classe : les bulletins des élèves à la suite, comme le produit Pronote."""
+    return pdf_depuis_pages([lignes_bulletin(nom, matieres, trimestre, alea) for nom in eleves])
+
+
+def zip_classe(eleves, matieres=MATIERES, trimestre=1, alea=None):
+    """Archive ZIP d'un bulletin PDF par élève, nommé d'après l'élève."""
+    sortie = io.BytesIO()
+    with zipfile.ZipFile(sortie, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for nom in eleves:
+            archive.writestr(f"{nom}.pdf", pdf_eleve(nom, matieres, trimestre, alea))
+    return sortie.getvalue()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--eleves', type=int, default=30)
+    parser.add_argument('--trimestre', type=int, default=1)
+    parser.add_argument('--graine', type=int, default=42)
+    parser.add_argument('--zip', action='store_true', help="Une archive de bulletins individuels plutôt qu'un export unique.")
+    parser.add_argument('--sortie', required=True)
+    args = parser.parse_args()
+    alea = random.Random(args.graine)
+    eleves = classe_synthetique(args.eleves, alea)
+    contenu = (zip_classe if args.zip else pdf_classe)(eleves, MATIERES, args.trimestre, alea)
+    with open(args.sortie, 'wb') as fichier:
+        fichier.write(contenu)
+    print(f"{args.sortie} : {len(eleves)} élèves, {len(contenu) // 1024} Ko")
+    print("Élèves (à coller dans la fiche de la classe) :\n" + "\n".join(eleves))
+    print("Matières : " + ",".join(MATIERES))
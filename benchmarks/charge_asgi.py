@@ -0,0 +1,148 @@
+# benchmarks/charge_asgi.py
+"""
+Test de charge du flux d'analyse (/jobs/<id>/flux) avec N professeurs simultanés :
+gunicorn synchrone (wsgi:app, un flux par worker) contre uvicorn (asgi:application,
+flux asynchrones). Le fournisseur d'IA est le faux fournisseur local (benchmarks.faux_fournisseur).
+
+    python -m benchmarks.charge_asgi --utilisateurs 50,200 --latence 2 --workers 4
+
+Chaque utilisateur se connecte, puis ouvre le flux d'une analyse en attente et le lit
+jusqu'à l'événement 'fin'. Les serveurs tournent dans des processus séparés, sur la même
+base SQLite temporaire. ATTENTION : gunicorn et uvicorn doivent être installés.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+from app import create_app
+from config import Config
+from jobs import creer_job
+from metriques import percentile
+from models import AIProvider, Prompt
+from benchmarks.bulletins import classe_synthetique
+from benchmarks.faux_fournisseur import demarrer
+from benchmarks.scenarios import IDENTIFIANTS, preparer
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def serveurs(options, port):
+    return {
+        f'gunicorn sync x{options.workers}': [
+            sys.executable, '-m', 'gunicorn', '--workers', str(options.workers), '--worker-class', 'sync',
+            '--timeout', '600', '--bind', f'127.0.0.1:{port}', 'wsgi:app'
+        ],
+        f'uvicorn asgi x{options.workers_asgi}': [
+            sys.executable, '-m', 'uvicorn', 'asgi:application', '--workers', str(options.workers_asgi),
+            '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning'
+        ],
+    }
+
+
+def creer_jobs(app, nb):
+    """Analyses en flux en attente, toutes différentes (pas de réponse en cache)."""
+    with app.app_context():
+        prompt = Prompt.query.filter_by(is_active=True).one()
+        provider = AIProvider.query.filter_by(is_active=True).one()
+        return [creer_job('analyse_flux', {
+            'nom_eleve': f"Élève {i}", 'trimestre': 1, 'classe_id': 1,
+            'donnees_structurees': {'appreciations_matieres': []},
+            'prompt_systeme': prompt.system_message,
+            'prompt_utilisateur': f"Charge {time.time_ns()} n°{i}",
+            'prompt_name': prompt.name, 'provider_id': provider.id, 'forcer': True,
+        }).id for i in range(nb)]
+
+
+async def lire_flux(client, job_id):
+    """Lit le flux d'une analyse jusqu'à la fin. Retourne (durée, succès)."""
+    debut = time.perf_counter()
+    fin = False
+    async with client.stream('GET', f'/jobs/{job_id}/flux') as reponse:
+        async for ligne in reponse.aiter_lines():
+            if ligne.startswith('event: '):
+                fin = ligne == 'event: fin'
+    return time.perf_counter() - debut, fin
+
+
+async def charge(adresse, jobs):
+    clients = [httpx.AsyncClient(base_url=adresse, timeout=600) for _ in jobs]
+    try:
+        # Connexions (bcrypt) faites avant le départ commun : seuls les flux sont mesurés
+        await asyncio.gather(*(client.post('/login', data=IDENTIFIANTS) for client in clients))
+        debut = time.perf_counter()
+        resultats = await asyncio.gather(*(lire_flux(client, job_id) for client, job_id in zip(clients, jobs)), return_exceptions=True)
+        total = time.perf_counter() - debut
+    finally:
+        await asyncio.gather(*(client.aclose() for client in clients))
+    durees = [r[0] * 1000 for r in resultats if not isinstance(r, Exception) and r[1]]
+    return {
+        'nb': len(jobs), 'reussis': len(durees),
+        'p50_ms': percentile(durees, 50), 'p95_ms': percentile(durees, 95),
+        'debit': round(len(durees) / total, 2) if total else None,
+    }
+
+
+def attendre_serveur(adresse, processus, delai=30):
+    limite = time.monotonic() + delai
+    while time.monotonic() < limite:
+        if processus.poll() is not None:
+            raise RuntimeError("Le serveur s'est arrêté au démarrage.")
+        try:
+            httpx.get(adresse + '/login', timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError("Le serveur ne répond pas.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--utilisateurs', default='50,200', help="Nombres d'utilisateurs simultanés, séparés par des virgules.")
+    parser.add_argument('--latence', type=float, default=2.0, help="Latence moyenne du faux fournisseur (s).")
+    parser.add_argument('--workers', type=int, default=4, help="Workers gunicorn synchrones.")
+    parser.add_argument('--workers-asgi', type=int, default=1, help="Processus uvicorn.")
+    parser.add_argument('--port', type=int, default=8765)
+    options = parser.parse_args()
+    paliers = [int(n) for n in options.utilisateurs.split(',')]
+
+    dossier = tempfile.mkdtemp(prefix='charge-asgi-')
+    fournisseur = demarrer(latence=options.latence, gigue=options.latence / 10)
+    environnement = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(dossier, 'charge.db')}",
+        LOCAL_PROVIDER_URL=f"http://127.0.0.1:{fournisseur.server_address[1]}/v1",
+        PROVIDER_POOL_MAX_CONNECTIONS=str(max(paliers) + 10),
+        JOBS_FLUX_DELAI='3600',
+    )
+
+    class ConfigCharge(Config):
+        SQLALCHEMY_DATABASE_URI = environnement['DATABASE_URL']
+
+    app = create_app(ConfigCharge)
+    preparer(app, classe_synthetique(5))
+    adresse = f"http://127.0.0.1:{options.port}"
+    try:
+        for nom, commande in serveurs(options, options.port).items():
+            processus = subprocess.Popen(commande, cwd=RACINE, env=environnement)
+            try:
+                attendre_serveur(adresse, processus)
+                for nb in paliers:
+                    resultat = asyncio.run(charge(adresse, creer_jobs(app, nb)))
+                    print(f"{nom:<20} {nb:4d} utilisateurs : {resultat['reussis']}/{resultat['nb']} flux, "
+                          f"p50 {resultat['p50_ms']} ms, p95 {resultat['p95_ms']} ms, {resultat['debit']} analyses/s")
+            finally:
+                processus.terminate()
+                processus.wait()
+    finally:
+        fournisseur.shutdown()
+        shutil.rmtree(dossier, ignore_errors=True)
+    print(f"Faux fournisseur : {fournisseur.stats}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+# benchmarks/faux_fournisseur.py
+"""
+Faux fournisseur d'IA compatible avec l'API OpenAI (/v1/chat/completions), pour tester
+l'ordonnanceur et mesurer l'application sans appeler d'API payante.
+
+    python -m benchmarks.faux_fournisseur --port 8089 --latence 0.8 --taux-erreur 0.1 --rpm 30
+
+Puis déclarer dans « Fournisseurs IA » un fournisseur nommé « Local » (clé quelconque),
+avec LOCAL_PROVIDER_URL=http://127.0.0.1:8089/v1.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPONSE = (
+    "Élève sérieux et impliqué, dont les résultats sont solides dans l'ensemble des matières. "
+    "Il doit maintenant gagner en régularité pour confirmer ses progrès.\n"
+    "--- JUSTIFICATIONS ---\n"
+    "- **Sérieux** : « travail régulier et soigné » (Mathématiques).\n"
+    "- **Régularité** : « des résultats en dents de scie » (Physique-Chimie)."
+)
+
+RE_NUMERO = re.compile(r'^\s*"numero": \d+,$', re.MULTILINE)  # une ligne par élève du tableau JSON
+
+
+def reponse_pour(requete, reponse):
+    """Réponse du faux fournisseur ; pour un prompt groupé (regroupement.py), un tableau JSON d'autant d'élèves."""
+    contenu = requete.get('messages', [{}])[-1].get('content', '')
+    nb = len(RE_NUMERO.findall(contenu))
+    if not nb or '=== FORMAT DE LA RÉPONSE ===' not in contenu:
+        return reponse
+    appreciation, _, justifications = reponse.partition("--- JUSTIFICATIONS ---")
+    return json.dumps([
+        {'numero': numero, 'appreciation': appreciation.strip(), 'justifications': justifications.strip()}
+        for numero in range(1, nb + 1)
+    ], ensure_ascii=False)
+
+
+class FauxFournisseur(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, adresse, latence=0.5, gigue=0.2, taux_erreur=0.0, rpm=None, reponse=REPONSE):
+        super().__init__(adresse, GestionnaireRequetes)
+        self.latence = latence
+        self.gigue = gigue
+        self.taux_erreur = taux_erreur
+        self.rpm = rpm
+        self.reponse = reponse
+        self.appels = deque()
+        self.lock = threading.Lock()
+        self.stats = {'requetes': 0, 'erreurs_429': 0, 'erreurs_500': 0}
+
+    def limite_atteinte(self):
+        """Vrai si la requête dépasse le quota de requêtes par minute simulé."""
+        with self.lock:
+            maintenant = time.monotonic()
+            while self.appels and self.appels[0] <= maintenant - 60:
+                self.appels.popleft()
+            if self.rpm and len(self.appels) >= self.rpm:
+                return True
+            self.appels.append(maintenant)
+            return False
+
+
+class GestionnaireRequetes(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, code, corps, entetes=None):
+        donnees = json.dumps(corps).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(donnees)))
+        for nom, valeur in (entetes or {}).items():
+            self.send_header(nom, valeur)
+        self.end_headers()
+        self.wfile.write(donnees)
+
+    def do_POST(self):
+        serveur = self.server
+        requete = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        with serveur.lock:
+            serveur.stats['requetes'] += 1
+        if not self.path.endswith('/chat/completions'):
+            return self._json(404, {'error': {'message': 'introuvable'}})
+        if serveur.limite_atteinte():
+            with serveur.lock:
+                serveur.stats['erreurs_429'] += 1
+            return self._json(429, {'error': {'message': 'Rate limit exceeded', 'type': 'rate_limit'}}, {'Retry-After': '1'})
+        time.sleep(max(0.0, random.gauss(serveur.latence, serveur.gigue)))
+        if random.random() < serveur.taux_erreur:
+            with serveur.lock:
+                serveur.stats['erreurs_500'] += 1
+            return self._json(500, {'error': {'message': 'Erreur simulée', 'type': 'server_error'}})
+
+        tokens_prompt = sum(len(m.get('content', '')) for m in requete.get('messages', [])) // 4
+        reponse = reponse_pour(requete, serveur.reponse)
+        tokens_reponse = len(reponse) // 4
+        if requete.get('stream'):
+            return self._stream(requete, reponse)
+        self._json(200, {
+            'id': 'chatcmpl-faux', 'object': 'chat.completion', 'created': int(time.time()),
+            'model': requete.get('model', 'faux'),
+            'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': reponse}}],
+            'usage': {'prompt_tokens': tokens_prompt, 'completion_tokens': tokens_reponse, 'total_tokens': tokens_prompt + tokens_reponse},
+        })
+
+    def _stream(self, requete, texte):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        for i in range(0, len(texte), 12):
+            morceau = {
+                'id': 'chatcmpl-faux', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                'model': requete.get('model', 'faux'),
+                'choices': [{'index': 0, 'delta': {'content': texte[i:i + 12]}, 'finish_reason': None}],
+            }
+            self.wfile.write(f"data: {json.dumps(morceau)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+            time.sleep(0.01)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+
+def demarrer(port=0, **options):
+    """Démarre le faux fournisseur dans un thread et retourne le serveur (port réel dans server_address)."""
+    serveur = FauxFournisseur(('127.0.0.1', port), **options)
+    threading.Thread(target=serveur.serve_forever, daemon=True).start()
+    return serveur
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latence', type=float, default=0.5, help="Latence moyenne en secondes.")
+    parser.add_argument('--gigue', type=float, default=0.2, help="Écart-type de la latence.")
+    parser.add_argument('--taux-erreur', type=float, default=0.0, help="Proportion de réponses 500.")
+    parser.add_argument('--rpm', type=int, default=None, help="Quota simulé de requêtes par minute (429 au-delà).")
+    args = parser.parse_args()
+    serveur = FauxFournisseur(('127.0.0.1', args.port), latence=args.latence, gigue=args.gigue,
+                              taux_erreur=args.taux_erreur, rpm=args.rpm)
+    print(f"Faux fournisseur sur http://127.0.0.1:{args.port}/v1")
+    serveur.serve_forever()
@@ -0,0 +1,271 @@
+# benchmarks/scenarios.py
+"""
+Scénarios de charge de bout en bout : l'application tourne dans le processus (client de test
+Flask), le fournisseur d'IA est le faux fournisseur local (benchmarks.faux_fournisseur) et les
+bulletins sont synthétiques (benchmarks.bulletins). Aucune API payante n'est appelée.
+
+    python -m benchmarks.scenarios
+    python -m benchmarks.scenarios --latence 0.8 --taux-erreur 0.05 --utilisateurs 8 --sortie avant.json
+    python -m benchmarks.scenarios --comparer avant.json
+
+Scénarios : analyse d'un élève, classe entière, page d'historique, export PDF de la classe
+(cache vide puis cache chaud) et utilisateurs simultanés. Le rapport (latences p50/p95, débit)
+peut être enregistré en JSON avec le commit courant, puis comparé à un rapport précédent.
+Sans --base, une base SQLite temporaire est utilisée. ATTENTION : la base est vidée.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime
+from app import create_app
+from config import Config
+from extensions import db
+from metriques import percentile
+from migrations import mettre_a_jour
+from models import AIProvider, Classe, Prompt, User
+from benchmarks.bulletins import MATIERES, classe_synthetique, pdf_classe, pdf_eleve
+from benchmarks.faux_fournisseur import demarrer
+
+SCENARIOS = ('analyse', 'classe', 'historique', 'export_pdf', 'concurrents')
+IDENTIFIANTS = {'username': 'bench', 'password': 'bench'}
+
+
+class Mesures:
+    """Durées (secondes) et erreurs d'un scénario, alimentées éventuellement par plusieurs threads."""
+
+    def __init__(self):
+        self.durees = []
+        self.erreurs = 0
+        self.debut = self.fin = None
+        self._lock = threading.Lock()
+
+    def mesurer(self, fonction, *arguments):
+        debut = time.perf_counter()
+        try:
+            ok = fonction(*arguments)
+        except Exception:
+            ok = False
+        duree = time.perf_counter() - debut
+        with self._lock:
+            self.durees.append(duree)
+            if not ok:
+                self.erreurs += 1
+            self.debut = debut if self.debut is None else min(self.debut, debut)
+            self.fin = debut + duree if self.fin is None else max(self.fin, debut + duree)
+
+    def resume(self):
+        total = (self.fin - self.debut) if self.durees else 0
+        millisecondes = [duree * 1000 for duree in self.durees]
+        return {
+            'nb': len(self.durees), 'erreurs': self.erreurs,
+            'p50_ms': percentile(millisecondes, 50), 'p95_ms': percentile(millisecondes, 95),
+            'debit': round(len(self.durees) / total, 2) if total else None,
+        }
+
+
+class Utilisateur:
+    """Un professeur connecté, avec sa propre session (client de test Flask)."""
+
+    def __init__(self, app, classe_id):
+        self.client = app.test_client()
+        self.client.post('/login', data=IDENTIFIANTS)
+        self.client.post('/', data={'classe_id': str(classe_id)})
+        self.classe_id = classe_id
+
+    def analyser_eleve(self, nom, trimestre, pdf):
+        reponse = self.client.post('/analyser', data={
+            'nom_eleve': nom, 'trimestre': str(trimestre), 'forcer': '1',
+            'bulletin_pdf': (io.BytesIO(pdf), 'bulletin.pdf'),
+        }, content_type='multipart/form-data', follow_redirects=True)
+        return reponse.status_code == 200 and reponse.request.path.startswith('/analyse/')
+
+    def analyser_classe(self, trimestre, pdf):
+        reponse = self.client.post('/analyser/classe', data={
+            'trimestre': str(trimestre), 'forcer': '1', 'bulletins_classe': (io.BytesIO(pdf), 'classe.pdf'),
+        }, content_type='multipart/form-data')
+        return reponse.status_code == 200
+
+    def historique(self):
+        return self.client.get(f'/historique/{self.classe_id}').status_code == 200
+
+    def export_pdf(self, trimestre):
+        reponse = self.client.get(f'/historique/pdf_classe/{self.classe_id}/trimestre/{trimestre}')
+        return reponse.status_code == 200 and reponse.mimetype == 'application/pdf'
+
+
+def preparer(app, eleves):
+    """Base vierge, un utilisateur, un prompt, le faux fournisseur actif et une classe synthétique."""
+    with app.app_context():
+        db.drop_all()
+        mettre_a_jour(journal=lambda message: None)
+        utilisateur = User(username=IDENTIFIANTS['username'], email='bench@example.com')
+        utilisateur.set_password(IDENTIFIANTS['password'])
+        classe = Classe(annee_scolaire='2024-2025', nom_classe='Bench')
+        db.session.add_all([
+            utilisateur, classe,
+            Prompt(name='Bench', system_message="Tu es un professeur principal.",
+                   user_message_template="Trimestre {trimestre} de {nom_eleve}.\n{appreciations_precedentes}\n{liste_appreciations}", is_active=True),
+            AIProvider(name='Local', api_key='bench', model_name='faux', is_active=True),
+        ])
+        db.session.flush()
+        classe.definir_matieres(MATIERES)
+        classe.definir_eleves(eleves)
+        db.session.commit()
+        return classe.id
+
+
+def executer(app, classe_id, eleves, options, alea):
+    resultats = {}
+    utilisateur = Utilisateur(app, classe_id)
+
+    if 'analyse' in options.scenarios:
+        mesures = Mesures()
+        for _ in range(options.echantillons):
+            nom = alea.choice(eleves)
+            mesures.mesurer(utilisateur.analyser_eleve, nom, 1, pdf_eleve(nom, MATIERES, 1, alea))
+        resultats['analyse'] = mesures.resume()
+
+    if 'classe' in options.scenarios:
+        # Une classe par trimestre : alimente aussi l'historique et les rappels des trimestres précédents
+        mesures = Mesures()
+        for trimestre in (1, 2, 3):
+            mesures.mesurer(utilisateur.analyser_classe, trimestre, pdf_classe(eleves, MATIERES, trimestre, alea))
+        resultats['classe'] = mesures.resume()
+
+    if 'historique' in options.scenarios:
+        mesures = Mesures()
+        for _ in range(options.echantillons):
+            mesures.mesurer(utilisateur.historique)
+        resultats['historique'] = mesures.resume()
+
+    if 'export_pdf' in options.scenarios:
+        froid, chaud = Mesures(), Mesures()
+        for _ in range(max(1, options.echantillons // 5)):
+            shutil.rmtree(app.config['PDF_CACHE_DOSSIER'], ignore_errors=True)
+            froid.mesurer(utilisateur.export_pdf, 1)
+            chaud.mesurer(utilisateur.export_pdf, 1)
+        resultats['export_pdf_froid'] = froid.resume()
+        resultats['export_pdf_cache'] = chaud.resume()
+
+    if 'concurrents' in options.scenarios:
+        resultats['concurrents'] = concurrents(app, classe_id, eleves, options)
+    return resultats
+
+
+def concurrents(app, classe_id, eleves, options):
+    """options.utilisateurs professeurs en parallèle pendant options.duree secondes : consultation et analyses."""
+    mesures = Mesures()
+    fin = time.monotonic() + options.duree
+
+    def session(graine):
+        alea = random.Random(graine)
+        utilisateur = Utilisateur(app, classe_id)
+        while time.monotonic() < fin:
+            if alea.random() < 0.3:
+                nom = alea.choice(eleves)
+                mesures.mesurer(utilisateur.analyser_eleve, nom, 1, pdf_eleve(nom, MATIERES, 1, alea))
+            else:
+                mesures.mesurer(utilisateur.historique)
+
+    threads = [threading.Thread(target=session, args=(options.graine + i,)) for i in range(options.utilisateurs)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return mesures.resume()
+
+
+def commit_courant():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def afficher(resultats, reference=None):
+    print(f"\n{'scénario':<20} {'nb':>5} {'erreurs':>8} {'p50':>10} {'p95':>10} {'débit':>10}")
+    for nom, r in resultats.items():
+        ligne = f"{nom:<20} {r['nb']:>5} {r['erreurs']:>8} {_cellule(r['p50_ms'], ' ms'):>10} {_cellule(r['p95_ms'], ' ms'):>10} {_cellule(r['debit'], '/s'):>10}"
+        avant = (reference or {}).get(nom)
+        if avant and avant.get('p50_ms') and r['p50_ms']:
+            ligne += f"   p50 {(r['p50_ms'] / avant['p50_ms'] - 1) * 100:+.0f} %"
+            if avant.get('p95_ms') and r['p95_ms']:
+                ligne += f", p95 {(r['p95_ms'] / avant['p95_ms'] - 1) * 100:+.0f} %"
+        print(ligne)
+
+
+def _cellule(valeur, unite):
+    return '-' if valeur is None else f"{valeur:.1f}{unite}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base', help="URL SQLAlchemy de la base de test (défaut : SQLite temporaire).")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f"Parmi : {', '.join(SCENARIOS)}.")
+    parser.add_argument('--eleves', type=int, default=30, help="Taille de la classe synthétique.")
+    parser.add_argument('--echantillons', type=int, default=20)
+    parser.add_argument('--utilisateurs', type=int, default=5, help="Utilisateurs simultanés (scénario concurrents).")
+    parser.add_argument('--duree', type=float, default=20, help="Durée du scénario concurrents, en secondes.")
+    parser.add_argument('--latence', type=float, default=0.3, help="Latence moyenne du faux fournisseur (s).")
+    parser.add_argument('--gigue', type=float, default=0.1)
+    parser.add_argument('--taux-erreur', type=float, default=0.0, help="Proportion de réponses 500 du faux fournisseur.")
+    parser.add_argument('--pack', type=int, default=1, help="PACK_ELEVES_MAX : élèves par appel pour les classes (1 = un par un).")
+    parser.add_argument('--graine', type=int, default=42)
+    parser.add_argument('--sortie', help="Enregistre le rapport JSON (avec le commit) dans ce fichier.")
+    parser.add_argument('--comparer', help="Rapport JSON précédent : affiche l'écart de p50/p95.")
+    options = parser.parse_args()
+    options.scenarios = {s.strip() for s in options.scenarios.split(',') if s.strip()}
+
+    fournisseur = demarrer(latence=options.latence, gigue=options.gigue, taux_erreur=options.taux_erreur)
+    dossier = tempfile.mkdtemp()
+
+    class ConfigBench(Config):
+        SQLALCHEMY_DATABASE_URI = options.base or f"sqlite:///{os.path.join(dossier, 'bench.db')}"
+        LOCAL_PROVIDER_URL = f"http://127.0.0.1:{fournisseur.server_address[1]}/v1"
+        JOBS_ASYNC = False          # la génération se fait dans la requête : on mesure tout le parcours
+        STREAMING_ACTIVE = False
+        PACK_ELEVES_MAX = options.pack
+        PDF_CACHE_DOSSIER = os.path.join(dossier, 'pdf')
+        EXPORTS_DOSSIER = os.path.join(dossier, 'exports')
+
+    app = create_app(ConfigBench)
+    alea = random.Random(options.graine)
+    eleves = classe_synthetique(options.eleves, alea)
+    classe_id = preparer(app, eleves)
+
+    debut = time.perf_counter()
+    resultats = executer(app, classe_id, eleves, options, alea)
+    print(f"Terminé en {time.perf_counter() - debut:.1f} s, faux fournisseur : {fournisseur.stats}")
+
+    reference = None
+    if options.comparer:
+        with open(options.comparer, encoding='utf-8') as fichier:
+            precedent = json.load(fichier)
+        print(f"Comparaison avec {options.comparer} (commit {precedent.get('commit')}, {precedent.get('date')})")
+        reference = precedent['resultats']
+    afficher(resultats, reference)
+
+    if options.sortie:
+        rapport = {
+            'commit': commit_courant(), 'date': datetime.now().isoformat(timespec='seconds'),
+            'options': {cle: valeur for cle, valeur in vars(options).items() if cle not in ('sortie', 'comparer', 'scenarios')},
+            'scenarios': sorted(options.scenarios), 'resultats': resultats,
+        }
+        with open(options.sortie, 'w', encoding='utf-8') as fichier:
+            json.dump(rapport, fichier, ensure_ascii=False, indent=2)
+        print(f"Rapport enregistré dans {options.sortie}")
+    fournisseur.shutdown()
+    fournisseur.server_close()
+    shutil.rmtree(dossier, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
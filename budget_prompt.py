@@ -0,0 +1,147 @@
+# budget_prompt.py
+"""
+Construction du prompt utilisateur dans un budget de tokens. Le budget est la fenêtre de
+contexte du modèle, moins le message système et la réponse attendue, plafonnée par
+PROMPT_BUDGET_TOKENS s'il est défini.
+
+Les espaces superflus sont toujours retirés. Au-delà du budget, les données sont réduites
+par étapes, de la moins utile à la plus utile, jusqu'à tenir :
+  1. matières non évaluées retirées ;
+  2. appréciations des trimestres précédents réduites à leurs premières phrases ;
+  3. commentaires des matières raccourcis, les plus longs d'abord ;
+  4. appréciations des trimestres précédents retirées, les plus anciennes d'abord.
+Les tokens économisés sont comptés dans les métriques (fournisseur, modèle).
+"""
+import re
+from collections import namedtuple
+from flask import current_app
+from metriques import noter_economie
+from ordonnanceur import estimer_tokens, fenetre_contexte
+from pipeline import construire_prompt_utilisateur, formater_precedentes
+
+RE_ESPACES = re.compile(r'[ \t\u00a0]+')
+RE_LIGNES_VIDES = re.compile(r'\n\s*\n+')
+RE_FIN_PHRASE = re.compile(r'(?<=[.!?…])\s+')
+
+# Longueurs (caractères) en dessous desquelles un texte n'est plus raccourci
+RESUME_PRECEDENTE = 240
+COMMENTAIRE_MIN = 80
+NON_EVALUE = {'N.Not', 'N/A'}
+COUPURE = " […]"
+
+PromptCompact = namedtuple('PromptCompact', 'texte donnees precedentes tokens_initiaux tokens')
+
+
+def normaliser_espaces(texte):
+    """Espaces multiples fusionnés, lignes nettoyées, une seule ligne vide au plus."""
+    lignes = (RE_ESPACES.sub(' ', ligne).strip() for ligne in (texte or '').split('\n'))
+    return RE_LIGNES_VIDES.sub('\n\n', '\n'.join(lignes)).strip()
+
+
+def raccourcir(texte, limite):
+    """
+    Premières phrases du texte tenant en `limite` caractères, marque de coupure comprise
+    (à défaut, coupe au dernier mot). Un texte déjà raccourci l'est à nouveau sans cumuler les marques.
+    """
+    if len(texte) <= limite:
+        return texte
+    if limite <= len(COUPURE):
+        return texte[:limite]
+    texte = texte.removesuffix(COUPURE)
+    limite -= len(COUPURE)
+    resultat = ""
+    for phrase in RE_FIN_PHRASE.split(texte):
+        if len(resultat) + len(phrase) + 1 > limite:
+            break
+        resultat = f"{resultat} {phrase}".strip()
+    if not resultat:
+        resultat = texte[:limite].rsplit(' ', 1)[0]
+    return resultat + COUPURE
+
+
+def budget_tokens(provider, system_prompt):
+    """Tokens disponibles pour le prompt utilisateur avec ce fournisseur et ce message système."""
+    config = current_app.config
+    budget = fenetre_contexte(provider.model_name) - config['PROVIDER_TOKENS_REPONSE'] - estimer_tokens(system_prompt)
+    if config['PROMPT_BUDGET_TOKENS']:
+        budget = min(budget, config['PROMPT_BUDGET_TOKENS'])
+    return budget
+
+
+class _Reduction:
+    """Données en cours de réduction : une copie, les données du parser restent intactes pour l'analyse."""
+
+    def __init__(self, prompt, nom_eleve, trimestre, donnees_structurees, par_trimestre):
+        self.prompt, self.nom_eleve, self.trimestre = prompt, nom_eleve, trimestre
+        self.donnees = dict(donnees_structurees, appreciations_matieres=[
+            dict(item, commentaire=normaliser_espaces(item['commentaire']))
+            for item in donnees_structurees['appreciations_matieres']
+        ])
+        self.precedentes = {t: normaliser_espaces(texte) for t, texte in par_trimestre.items() if texte}
+
+    def texte(self):
+        return construire_prompt_utilisateur(self.prompt, self.nom_eleve, self.trimestre, self.donnees, formater_precedentes(self.precedentes))
+
+
+def _sans_non_evalues(reduction, excedent):
+    matieres = reduction.donnees['appreciations_matieres']
+    reduction.donnees['appreciations_matieres'] = [m for m in matieres if m['moyenne'] not in NON_EVALUE or len(m['commentaire']) > 30]
+    yield
+
+
+def _precedentes_resumees(reduction, excedent):
+    for t in sorted(reduction.precedentes):
+        reduction.precedentes[t] = raccourcir(reduction.precedentes[t], RESUME_PRECEDENTE)
+        yield
+
+
+def _commentaires_raccourcis(reduction, excedent):
+    while True:
+        matieres = [m for m in reduction.donnees['appreciations_matieres'] if len(m['commentaire']) > COMMENTAIRE_MIN + 10]
+        if not matieres:
+            return
+        plus_long = max(matieres, key=lambda m: len(m['commentaire']))
+        longueur = len(plus_long['commentaire'])
+        plus_long['commentaire'] = raccourcir(plus_long['commentaire'], max(COMMENTAIRE_MIN, longueur - excedent() * 4))
+        if len(plus_long['commentaire']) >= longueur:
+            return
+        yield
+
+
+def _sans_precedentes(reduction, excedent):
+    for t in sorted(reduction.precedentes):
+        del reduction.precedentes[t]
+        yield
+
+
+ETAPES = (_sans_non_evalues, _precedentes_resumees, _commentaires_raccourcis, _sans_precedentes)
+
+
+def compacter(prompt, provider, nom_eleve, trimestre, donnees_structurees, par_trimestre):
+    """
+    Prompt utilisateur de l'élève tenant dans le budget du fournisseur. Retourne un PromptCompact :
+    le texte, les données et le rappel des trimestres précédents réduits (pour les prompts groupés),
+    les tokens du prompt complet et ceux du prompt envoyé.
+    """
+    tokens_initiaux = estimer_tokens(construire_prompt_utilisateur(
+        prompt, nom_eleve, trimestre, donnees_structurees, formater_precedentes(par_trimestre)))
+    budget = budget_tokens(provider, prompt.system_message)
+    reduction = _Reduction(prompt, nom_eleve, trimestre, donnees_structurees, par_trimestre)
+    texte = reduction.texte()
+
+    def excedent():
+        return estimer_tokens(texte) - budget
+
+    for etape in ETAPES:
+        if excedent() <= 0:
+            break
+        for _ in etape(reduction, excedent):
+            texte = reduction.texte()
+            if excedent() <= 0:
+                break
+    if excedent() > 0:
+        current_app.logger.warning(f"Prompt de {nom_eleve} : {estimer_tokens(texte)} tokens pour un budget de {budget}")
+
+    tokens = estimer_tokens(texte)
+    noter_economie(provider.name, provider.model_name, tokens_initiaux - tokens)
+    return PromptCompact(texte, reduction.donnees, formater_precedentes(reduction.precedentes), tokens_initiaux, tokens)
@@ -2,8 +2,8 @@
 # exit on error
 set -o errexit
 
-# Installe les dépendances système pour WeasyPrint
-apt-get update && apt-get install -y libpango-1.0-0 libpangoft2-1.0-0
+# Installe les dépendances système pour WeasyPrint, et les polices des PDF (templates/pdf.css)
+apt-get update && apt-get install -y libpango-1.0-0 libpangoft2-1.0-0 fonts-roboto fonts-dejavu-core
 
 # Installe les dépendances Python
 pip install -r requirements.txt
\ No newline at end of file
@@ -0,0 +1,184 @@
+# cache.py
+import hashlib
+import json
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from models import db, Compteur, ReponseCache, BulletinCache
+from providers import fournisseurs_course, temperature_pour, contient_separateur
+from ordonnanceur import get_ai_response_course, get_ai_response_ordonnance
+from extraction import extraire_texte
+from metriques import chrono
+
+
+def cle_reponse(provider, system_prompt, user_prompt):
+    """Empreinte du prompt complet : même fournisseur, modèle, température et prompts => même clé."""
+    contenu = json.dumps(
+        [provider.name.lower(), provider.model_name, temperature_pour(provider), system_prompt, user_prompt],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(contenu.encode('utf-8')).hexdigest()
+
+
+def lire_reponse(cle):
+    """
+    Retourne (réponse, fournisseur qui l'a produite) si elle est en cache et n'a pas expiré, sinon None.
+    Le fournisseur vaut None pour les réponses mises en cache avant qu'il soit enregistré.
+    """
+    entree = db.session.get(ReponseCache, cle)
+    expiration = datetime.utcnow() - timedelta(seconds=current_app.config['CACHE_REPONSES_TTL'])
+    if entree and entree.created_at and entree.created_at >= expiration:
+        entree.hits += 1
+        entree.dernier_acces = datetime.utcnow()
+        Compteur.incrementer('cache_reponses_hits')
+        db.session.commit()
+        return entree.reponse, entree.fournisseur
+    if entree:
+        db.session.delete(entree)
+    Compteur.incrementer('cache_reponses_misses')
+    db.session.commit()
+    return None
+
+
+def enregistrer_reponse(cle, reponse, fournisseur):
+    """Enregistre une réponse puis évince les entrées les moins récemment utilisées au-delà de la limite."""
+    maintenant = datetime.utcnow()
+    db.session.merge(ReponseCache(cle=cle, reponse=reponse, fournisseur=fournisseur, hits=0, created_at=maintenant, dernier_acces=maintenant))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Un autre worker vient d'enregistrer la même réponse
+        db.session.rollback()
+        return
+
+    limite = current_app.config['CACHE_REPONSES_MAX']
+    if ReponseCache.query.count() > limite:
+        a_garder = db.session.query(ReponseCache.cle).order_by(ReponseCache.dernier_acces.desc()).limit(limite)
+        ReponseCache.query.filter(ReponseCache.cle.not_in(a_garder.scalar_subquery())).delete(synchronize_session=False)
+        db.session.commit()
+
+
+def get_ai_response_cached(provider, system_prompt, user_prompt, forcer=False, tokens_reponse=None, valider=None):
+    """
+    Comme get_ai_response, mais réutilise une réponse identique déjà payée.
+    forcer=True ignore le cache (bouton « forcer une nouvelle génération ») et le met à jour.
+    En mode course, le prompt part vers plusieurs fournisseurs et le plus rapide l'emporte.
+    valider(reponse) : si fourni, seule une réponse valide gagne la course et est mise en cache.
+    Retourne (réponse, nom du fournisseur qui l'a produite).
+    """
+    cle = cle_reponse(provider, system_prompt, user_prompt)
+    if not forcer:
+        en_cache = lire_reponse(cle)
+        if en_cache is not None:
+            reponse, nom_fournisseur = en_cache
+            return reponse, nom_fournisseur or provider.name
+    participants = fournisseurs_course(provider)
+    if len(participants) > 1:
+        nom_fournisseur, reponse = get_ai_response_course(participants, system_prompt, user_prompt, valider or contient_separateur, tokens_reponse)
+    else:
+        nom_fournisseur, reponse = get_ai_response_ordonnance(provider, system_prompt, user_prompt, tokens_reponse)
+    if valider is None or valider(reponse):
+        enregistrer_reponse(cle, reponse, nom_fournisseur)
+    return reponse, nom_fournisseur
+
+
+def _cle_analyse(nom_eleve, matieres_attendues):
+    """Le résultat du parser dépend du texte, du nom de l'élève et de la liste des matières."""
+    contenu = json.dumps([nom_eleve, matieres_attendues], ensure_ascii=False)
+    return hashlib.sha256(contenu.encode('utf-8')).hexdigest()
+
+
+def _taille(texte, analyses):
+    return len(texte.encode('utf-8')) + len(json.dumps(analyses, ensure_ascii=False).encode('utf-8'))
+
+
+def evincer_bulletins():
+    """Supprime les bulletins les moins récemment utilisés tant que la taille totale dépasse la limite."""
+    limite = current_app.config['CACHE_BULLETINS_MAX_OCTETS']
+    if (db.session.query(func.sum(BulletinCache.taille)).scalar() or 0) <= limite:
+        return
+    total, a_supprimer = 0, []
+    for empreinte, taille in db.session.query(BulletinCache.empreinte, BulletinCache.taille).order_by(BulletinCache.dernier_acces.desc()):
+        total += taille
+        if total > limite:
+            a_supprimer.append(empreinte)
+    BulletinCache.query.filter(BulletinCache.empreinte.in_(a_supprimer)).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def analyser_bulletin_pdf(televersement, nom_eleve, parser):
+    """
+    Extrait et analyse un bulletin PDF téléversé avec le ParserBulletin de la classe, en réutilisant le résultat d'un envoi précédent du même fichier
+    (même empreinte SHA-256) : l'extraction et le parser ne sont alors pas relancés.
+    Retourne (texte extrait, données structurées) ; les données valent None si le PDF est vide.
+    """
+    empreinte = televersement.empreinte
+    cle = _cle_analyse(nom_eleve, parser.matieres)
+    with chrono('cache_bulletin'):
+        entree = db.session.get(BulletinCache, empreinte)
+    if entree:
+        analyses = dict(entree.analyses or {})
+        if cle not in analyses:
+            with chrono('parser'):
+                donnees = parser.analyser(entree.texte, nom_eleve)
+            analyses[cle] = {k: v for k, v in donnees.items() if k != 'texte_brut'}
+            entree.analyses = analyses
+            entree.taille = _taille(entree.texte, analyses)
+        entree.hits += 1
+        entree.dernier_acces = datetime.utcnow()
+        Compteur.incrementer('cache_bulletins_hits')
+        db.session.commit()
+        return entree.texte, {**analyses[cle], 'texte_brut': entree.texte}
+
+    with chrono('extraction'):
+        texte = extraire_texte(televersement.chemin)
+    Compteur.incrementer('cache_bulletins_misses')
+    if not texte:
+        db.session.commit()
+        return texte, None
+    with chrono('parser'):
+        donnees = parser.analyser(texte, nom_eleve)
+    # Le texte n'est stocké qu'une fois : texte_brut est recomposé à la lecture
+    analyses = {cle: {k: v for k, v in donnees.items() if k != 'texte_brut'}}
+    maintenant = datetime.utcnow()
+    db.session.add(BulletinCache(
+        empreinte=empreinte, texte=texte, analyses=analyses, taille=_taille(texte, analyses),
+        hits=0, created_at=maintenant, dernier_acces=maintenant
+    ))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Le même fichier vient d'être enregistré par un autre worker
+        db.session.rollback()
+        return texte, donnees
+    evincer_bulletins()
+    return texte, donnees
+
+
+def statistiques_cache():
+    """Compteurs affichés sur la page de configuration."""
+    hits = Compteur.lire('cache_reponses_hits')
+    misses = Compteur.lire('cache_reponses_misses')
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'taux': round(100 * hits / total) if total else 0,
+        'entrees': ReponseCache.query.count(),
+        'max': current_app.config['CACHE_REPONSES_MAX'],
+        'bulletins': BulletinCache.query.count(),
+        'bulletins_hits': Compteur.lire('cache_bulletins_hits'),
+        'bulletins_mo': round((db.session.query(func.sum(BulletinCache.taille)).scalar() or 0) / (1024 * 1024), 1),
+        'bulletins_max_mo': round(current_app.config['CACHE_BULLETINS_MAX_OCTETS'] / (1024 * 1024), 1),
+    }
+
+
+def vider_cache():
+    """Supprime les réponses et les bulletins en cache et remet les compteurs à zéro."""
+    ReponseCache.query.delete()
+    BulletinCache.query.delete()
+    Compteur.query.filter(Compteur.nom.in_([
+        'cache_reponses_hits', 'cache_reponses_misses', 'cache_bulletins_hits', 'cache_bulletins_misses'
+    ])).delete(synchronize_session=False)
+    db.session.commit()
@@ -0,0 +1,87 @@
+# cache_config.py
+"""
+Cache, propre au processus, des lignes lues à chaque requête et presque jamais modifiées :
+prompt actif, fournisseur actif et utilisateurs connectés (load_user).
+
+La cohérence entre workers repose sur le compteur 'config_version' : toute route qui modifie
+ces tables appelle invalider_config() avant son commit. Chaque processus relit ce compteur au
+plus une fois par requête et toutes les CONFIG_CACHE_DELAI secondes, et se vide s'il a changé.
+
+Les valeurs sont conservées sous forme de colonnes et rattachées à la session de la requête
+sans requête SQL (merge(load=False)) : les relations restent chargeables à la demande.
+"""
+import threading
+import time
+from flask import current_app, g, has_request_context
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+from models import db, AIProvider, Compteur, Prompt, User
+
+VERSION_CONFIG = 'config_version'
+_ABSENT = object()
+
+_lock = threading.Lock()
+_etat = {'version': None, 'verifie_le': 0.0, 'lignes': {}}
+
+
+def _verifier_version():
+    if has_request_context() and g.get('config_verifiee'):
+        return
+    maintenant = time.monotonic()
+    if maintenant - _etat['verifie_le'] >= current_app.config['CONFIG_CACHE_DELAI']:
+        version = Compteur.lire(VERSION_CONFIG)
+        with _lock:
+            if version != _etat['version']:
+                _etat['lignes'].clear()
+                _etat['version'] = version
+            _etat['verifie_le'] = maintenant
+    if has_request_context():
+        g.config_verifiee = True
+
+
+def _colonnes(instance):
+    return {attribut.key: getattr(instance, attribut.key) for attribut in inspect(instance).mapper.column_attrs}
+
+
+def _attacher(modele, colonnes):
+    """Instance persistante dans la session courante, construite sans aller-retour vers la base."""
+    instance = modele(**colonnes)
+    make_transient_to_detached(instance)
+    return db.session.merge(instance, load=False)
+
+
+def _obtenir(cle, modele, charger):
+    _verifier_version()
+    with _lock:
+        colonnes = _etat['lignes'].get(cle, _ABSENT)
+    if colonnes is _ABSENT:
+        instance = charger()
+        colonnes = _colonnes(instance) if instance is not None else None
+        with _lock:
+            _etat['lignes'][cle] = colonnes
+        return instance
+    return _attacher(modele, colonnes) if colonnes is not None else None
+
+
+def prompt_actif():
+    return _obtenir('prompt', Prompt, lambda: Prompt.query.filter_by(is_active=True).first())
+
+
+def fournisseur_actif():
+    return _obtenir('fournisseur', AIProvider, lambda: AIProvider.query.filter_by(is_active=True).first())
+
+
+def utilisateur(user_id):
+    return _obtenir(('utilisateur', user_id), User, lambda: db.session.get(User, user_id))
+
+
+def invalider_config():
+    """
+    À appeler quand un prompt, un fournisseur ou un utilisateur est modifié, avant le commit :
+    le compteur partagé est incrémenté et le cache du processus vidé immédiatement.
+    """
+    Compteur.incrementer(VERSION_CONFIG)
+    with _lock:
+        _etat['lignes'].clear()
+        _etat['version'] = None
+        _etat['verifie_le'] = 0.0
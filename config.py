@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'une-cle-secrete-par-defaut-pour-le-dev')
@@ -17,4 +18,81 @@ class Config:
     MAIL_PORT = int(os.getenv('MAIL_PORT', 587))
     MAIL_USE_TLS = os.getenv('MAIL_USE_TLS', 'true').lower() in ['true', '1', 't']
     MAIL_USERNAME = os.getenv('MAIL_USERNAME') # Votre adresse e-mail
-    MAIL_PASSWORD = os.getenv('MAIL_PASSWORD') # Le mot de passe de votre e-mail (ou mot de passe d'application)
\ No newline at end of file
+    MAIL_PASSWORD = os.getenv('MAIL_PASSWORD') # Le mot de passe de votre e-mail (ou mot de passe d'application)
+
+    # Analyse d'une classe entière : nombre maximal d'appels simultanés au fournisseur d'IA
+    BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', 4))
+
+    # File de tâches : la génération IA est exécutée par `flask run-worker`.
+    # Mettre JOBS_ASYNC=false pour générer directement dans la requête (sans worker).
+    JOBS_ASYNC = os.getenv('JOBS_ASYNC', 'true').lower() in ['true', '1', 't']
+    # Une tâche 'en_cours' sans signe de vie (réservation, progression) depuis JOBS_TIMEOUT secondes
+    # est considérée comme abandonnée par son worker
+    JOBS_TIMEOUT = int(os.getenv('JOBS_TIMEOUT', 600))
+    # Le worker relance les tâches bloquées et purge les anciennes toutes les JOBS_MAINTENANCE secondes ;
+    # une tâche finie est supprimée après JOBS_RETENTION secondes
+    JOBS_MAINTENANCE = int(os.getenv('JOBS_MAINTENANCE', 60))
+    JOBS_RETENTION = int(os.getenv('JOBS_RETENTION', 7 * 24 * 3600))
+
+    # Clients des fournisseurs d'IA : pool de connexions HTTP persistantes
+    PROVIDER_TIMEOUT = int(os.getenv('PROVIDER_TIMEOUT', 120))
+    PROVIDER_POOL_MAX_CONNECTIONS = int(os.getenv('PROVIDER_POOL_MAX_CONNECTIONS', 20))
+    PROVIDER_POOL_KEEPALIVE = int(os.getenv('PROVIDER_POOL_KEEPALIVE', 60))
+
+    # Cache des réponses de l'IA (durée de vie en secondes, nombre maximal d'entrées)
+    CACHE_REPONSES_TTL = int(os.getenv('CACHE_REPONSES_TTL', 7 * 24 * 3600))
+    CACHE_REPONSES_MAX = int(os.getenv('CACHE_REPONSES_MAX', 5000))
+
+    # Affichage de l'appréciation en direct (server-sent events) sur la page d'attente.
+    # Le worker ne reprend une analyse en flux que si personne ne l'a ouverte après ce délai.
+    STREAMING_ACTIVE = os.getenv('STREAMING_ACTIVE', 'true').lower() in ['true', '1', 't']
+    JOBS_FLUX_DELAI = int(os.getenv('JOBS_FLUX_DELAI', 30))
+    # asgi.py : threads réservés aux étapes en base des flux servis en asynchrone
+    ASGI_THREADS_BASE = int(os.getenv('ASGI_THREADS_BASE', 8))
+
+    # Mode course : le prompt est envoyé en parallèle au fournisseur actif et à ceux listés
+    # ici (noms séparés par des virgules, '*' pour tous) ; la première réponse valide l'emporte.
+    COURSE_FOURNISSEURS = [n.strip().lower() for n in os.getenv('COURSE_FOURNISSEURS', '').split(',') if n.strip()]
+    COURSE_MAX = int(os.getenv('COURSE_MAX', 3))
+
+    # Ordonnanceur des appels : reprises avec backoff exponentiel et bascule vers un autre fournisseur
+    PROVIDER_MAX_TENTATIVES = int(os.getenv('PROVIDER_MAX_TENTATIVES', 4))
+    PROVIDER_BACKOFF_BASE = float(os.getenv('PROVIDER_BACKOFF_BASE', 1.0))
+    PROVIDER_BACKOFF_MAX = float(os.getenv('PROVIDER_BACKOFF_MAX', 30.0))
+    PROVIDER_BASCULE = os.getenv('PROVIDER_BASCULE', 'false').lower() in ['true', '1', 't']
+    PROVIDER_TOKENS_REPONSE = int(os.getenv('PROVIDER_TOKENS_REPONSE', 600)) # tokens réservés pour la réponse
+    LOCAL_PROVIDER_URL = os.getenv('LOCAL_PROVIDER_URL', 'http://127.0.0.1:8089/v1')
+
+    # Extraction du texte des PDF : moteur ('pdfplumber' ou 'pypdfium2', plus rapide),
+    # nombre de processus et nombre de pages à partir duquel l'extraction est parallélisée
+    PDF_BACKEND = os.getenv('PDF_BACKEND', 'pdfplumber')
+    PDF_PROCESSUS = int(os.getenv('PDF_PROCESSUS', min(4, os.cpu_count() or 1)))
+    PDF_SEUIL_PARALLELE = int(os.getenv('PDF_SEUIL_PARALLELE', 8))
+    # Cache disque des PDF d'appréciations générés (un fichier par élève et par document de classe)
+    PDF_CACHE_DOSSIER = os.getenv('PDF_CACHE_DOSSIER', os.path.join(tempfile.gettempdir(), 'appreciations-pdf'))
+    PDF_CACHE_MAX_FICHIERS = int(os.getenv('PDF_CACHE_MAX_FICHIERS', 2000))
+    # Archives produites par les exports de fin de trimestre, conservées EXPORTS_DUREE secondes
+    EXPORTS_DOSSIER = os.getenv('EXPORTS_DOSSIER', os.path.join(tempfile.gettempdir(), 'appreciations-exports'))
+    EXPORTS_DUREE = int(os.getenv('EXPORTS_DUREE', 7 * 24 * 3600))
+    # Cache des bulletins déjà extraits (texte + analyse du parser), taille totale maximale en octets
+    CACHE_BULLETINS_MAX_OCTETS = int(os.getenv('CACHE_BULLETINS_MAX_OCTETS', 50 * 1024 * 1024))
+    # Taille maximale d'un fichier envoyé (recopié par blocs sur disque, jamais chargé en mémoire) ;
+    # au-delà de la marge prévue pour les champs du formulaire, Werkzeug refuse la requête (413)
+    UPLOAD_MAX_OCTETS = int(os.getenv('UPLOAD_MAX_OCTETS', 100 * 1024 * 1024))
+    MAX_CONTENT_LENGTH = UPLOAD_MAX_OCTETS + 1024 * 1024
+    # Jeton permettant à Prometheus de lire /metrics sans session (en-tête Authorization: Bearer <jeton>)
+    METRIQUES_JETON = os.getenv('METRIQUES_JETON')
+    # Chaque processus web publie ses métriques en base au plus toutes les METRIQUES_PUBLICATION secondes
+    METRIQUES_PUBLICATION = int(os.getenv('METRIQUES_PUBLICATION', 30))
+    # Prompt, fournisseur actifs et utilisateurs sont gardés en mémoire ; la version partagée
+    # de la configuration est relue au plus toutes les CONFIG_CACHE_DELAI secondes
+    CONFIG_CACHE_DELAI = float(os.getenv('CONFIG_CACHE_DELAI', 2))
+    # Génération groupée des classes : jusqu'à PACK_ELEVES_MAX élèves par appel à l'IA (1 = désactivée),
+    # dans la limite de la fenêtre de contexte du modèle (PACK_CONTEXTE_TOKENS si le modèle est inconnu)
+    # et du nombre de tokens qu'il peut produire en une réponse
+    PACK_ELEVES_MAX = int(os.getenv('PACK_ELEVES_MAX', 1))
+    PACK_CONTEXTE_TOKENS = int(os.getenv('PACK_CONTEXTE_TOKENS', 32000))
+    PACK_SORTIE_TOKENS = int(os.getenv('PACK_SORTIE_TOKENS', 4096))
+    # Budget du prompt utilisateur d'un élève : fenêtre de contexte du modèle moins le message système
+    # et la réponse, plafonné à PROMPT_BUDGET_TOKENS (0 = fenêtre seule). Au-delà, les données sont réduites
+    PROMPT_BUDGET_TOKENS = int(os.getenv('PROMPT_BUDGET_TOKENS', 0))
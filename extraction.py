@@ -0,0 +1,142 @@
+# extraction.py
+"""
+Extraction du texte des PDF, page par page. Les sources sont des chemins de fichier
+(téléversements copiés sur disque) ou des bytes (bulletins d'une archive ZIP) : un chemin
+n'est jamais chargé entièrement en mémoire, ni transmis en bytes aux processus du pool.
+"""
+import io
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import pdfplumber
+import pypdfium2 as pdfium
+from flask import current_app
+
+BACKENDS = ('pdfplumber', 'pypdfium2')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _pages_pdfplumber(source, debut, fin):
+    with pdfplumber.open(io.BytesIO(source) if isinstance(source, bytes) else source) as pdf:
+        for page in pdf.pages[debut:fin]:
+            # Une seule extraction par page (l'ancienne compréhension appelait extract_text deux fois)
+            texte = page.extract_text()
+            # Libère les caractères et objets de mise en page que pdfplumber garde sur chaque page
+            page.close()
+            if texte:
+                yield texte
+
+
+def _pages_pypdfium2(source, debut, fin):
+    # Moteur C (PDFium) livré avec pdfplumber : beaucoup plus rapide, même format de sortie
+    document = pdfium.PdfDocument(source)
+    try:
+        for index in range(debut, min(fin, len(document))):
+            page = document[index]
+            textpage = page.get_textpage()
+            texte = textpage.get_text_bounded().replace('\r\n', '\n').replace('\r', '\n').strip()
+            textpage.close()
+            page.close()
+            if texte:
+                yield texte
+    finally:
+        document.close()
+
+
+def _iterer_plage(source, debut, fin, backend):
+    if backend == 'pypdfium2':
+        return _pages_pypdfium2(source, debut, fin)
+    return _pages_pdfplumber(source, debut, fin)
+
+
+def extraire_plage(source, debut, fin, backend):
+    """Textes non vides des pages [debut, fin[ d'un PDF. Exécutable dans un processus du pool."""
+    return list(_iterer_plage(source, debut, fin, backend))
+
+
+def nombre_pages(source):
+    """Nombre de pages du PDF (lecture de la structure seulement, sans extraction)."""
+    document = pdfium.PdfDocument(source)
+    try:
+        return len(document)
+    finally:
+        document.close()
+
+
+def _backend():
+    backend = current_app.config['PDF_BACKEND']
+    if backend not in BACKENDS:
+        raise ValueError(f"PDF_BACKEND '{backend}' inconnu (valeurs possibles : {', '.join(BACKENDS)}).")
+    return backend
+
+
+def obtenir_pool():
+    """Pool de processus partagé (extraction et rendu des PDF), créé au premier besoin dans chaque worker gunicorn."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # 'spawn' : les processus fils ne reçoivent pas les threads (boucle asyncio, pools HTTP) du parent
+            _pool = ProcessPoolExecutor(
+                max_workers=current_app.config['PDF_PROCESSUS'],
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pool
+
+
+def _decouper(nb_pages, nb_morceaux):
+    taille = -(-nb_pages // nb_morceaux)
+    return [(debut, min(debut + taille, nb_pages)) for debut in range(0, nb_pages, taille)]
+
+
+def iterer_pages(source):
+    """
+    Textes des pages d'un PDF (pages vides exclues), produits au fur et à mesure : une seule page
+    est ouverte à la fois. Au-delà de PDF_SEUIL_PARALLELE pages, les pages sont réparties entre les
+    processus du pool, qui reçoivent le chemin du fichier et rendent leurs textes dans l'ordre.
+    """
+    backend = _backend()
+    nb_pages = nombre_pages(source)
+    nb_processus = current_app.config['PDF_PROCESSUS']
+    if nb_processus <= 1 or nb_pages < current_app.config['PDF_SEUIL_PARALLELE']:
+        yield from _iterer_plage(source, 0, nb_pages, backend)
+        return
+
+    pool = obtenir_pool()
+    futures = [pool.submit(extraire_plage, source, debut, fin, backend) for debut, fin in _decouper(nb_pages, nb_processus)]
+    for future in futures:
+        yield from future.result()
+
+
+def extraire_pages(source):
+    """Retourne la liste des textes de chaque page d'un PDF (pages vides exclues)."""
+    return list(iterer_pages(source))
+
+
+def extraire_texte(source):
+    """Retourne le texte complet d'un PDF, pages jointes par un saut de ligne."""
+    return "\n".join(iterer_pages(source))
+
+
+def iterer_textes(sources):
+    """
+    Texte complet de plusieurs PDF (ZIP de bulletins), dans l'ordre, un fichier par processus du pool.
+    Les sources sont consommées au fur et à mesure : au plus deux par processus sont en mémoire.
+    """
+    backend = _backend()
+    nb_processus = current_app.config['PDF_PROCESSUS']
+    if nb_processus <= 1:
+        for source in sources:
+            yield "\n".join(_iterer_plage(source, 0, nombre_pages(source), backend))
+        return
+
+    pool = obtenir_pool()
+    en_cours = deque()
+    for source in sources:
+        en_cours.append(pool.submit(extraire_plage, source, 0, nombre_pages(source), backend))
+        if len(en_cours) >= 2 * nb_processus:
+            yield "\n".join(en_cours.popleft().result())
+    while en_cours:
+        yield "\n".join(en_cours.popleft().result())
@@ -0,0 +1,320 @@
+# jobs.py
+import os
+import time
+import traceback
+import zipfile
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func, or_
+from models import db, Job, Analyse, AIProvider, Classe, TexteBulletin
+from pipeline import separer_reponse, DecoupeurFlux
+from ordonnanceur import ouvrir_flux
+from cache import get_ai_response_cached, cle_reponse, lire_reponse, enregistrer_reponse
+from requetes import dernieres_analyses
+from rendu_pdf import pdf_analyses
+from metriques import chrono, publier, purger_publications
+
+# Type de tâche -> fonction qui la traite
+HANDLERS = {}
+# Clés du payload inutiles une fois la tâche finie (texte du bulletin, prompts complets)
+CHAMPS_LOURDS = ('donnees_structurees', 'prompt_systeme', 'prompt_utilisateur')
+
+
+def handler(type_job):
+    """Décorateur : enregistre la fonction qui exécute les tâches d'un type donné."""
+    def decorateur(fonction):
+        HANDLERS[type_job] = fonction
+        return fonction
+    return decorateur
+
+
+def creer_job(type_job, payload):
+    """Ajoute une tâche dans la file d'attente et retourne le Job créé."""
+    job = Job(type=type_job, payload=payload, statut='en_attente')
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def reserver(job_id, type_job=None):
+    """
+    Réserve une tâche en attente et la retourne, ou None si quelqu'un l'a déjà prise.
+    La réservation est un UPDATE conditionnel sur le statut : si deux workers visent
+    la même tâche, un seul verra rowcount == 1. Fonctionne avec SQLite comme Postgres.
+    Avec type_job, une tâche d'un autre type n'est jamais réservée.
+    """
+    filtres = {'id': job_id, 'statut': 'en_attente'}
+    if type_job:
+        filtres['type'] = type_job
+    maintenant = datetime.utcnow()
+    reserve = Job.query.filter_by(**filtres).update(
+        {'statut': 'en_cours', 'started_at': maintenant, 'signe_de_vie': maintenant, 'tentatives': Job.tentatives + 1},
+        synchronize_session=False
+    )
+    db.session.commit()
+    return db.session.get(Job, job_id) if reserve else None
+
+
+def reserver_job():
+    """
+    Réserve la plus ancienne tâche en attente.
+    Les analyses en flux sont laissées au navigateur qui les affiche en direct ; le worker
+    ne les reprend que si personne ne les a ouvertes après JOBS_FLUX_DELAI secondes.
+    """
+    limite_flux = datetime.utcnow() - timedelta(seconds=current_app.config['JOBS_FLUX_DELAI'])
+    candidats = db.session.query(Job.id).filter(
+        Job.statut == 'en_attente',
+        or_(Job.type != 'analyse_flux', Job.created_at < limite_flux)
+    ).order_by(Job.id).limit(5).all()
+    for (job_id,) in candidats:
+        job = reserver(job_id)
+        if job:
+            return job
+    return None
+
+
+def relancer_jobs_bloques():
+    """
+    Remet en attente les tâches 'en_cours' sans signe de vie depuis JOBS_TIMEOUT secondes (worker
+    arrêté en cours de route). Une tâche longue qui progresse (export) n'est pas relancée.
+    """
+    limite = datetime.utcnow() - timedelta(seconds=current_app.config['JOBS_TIMEOUT'])
+    dernier_signe = func.coalesce(Job.signe_de_vie, Job.started_at)
+    nb = Job.query.filter(Job.statut == 'en_cours', dernier_signe < limite).update(
+        {'statut': 'en_attente'}, synchronize_session=False
+    )
+    db.session.commit()
+    return nb
+
+
+def purger_jobs():
+    """Supprime les tâches terminées ou en erreur depuis plus de JOBS_RETENTION secondes."""
+    limite = datetime.utcnow() - timedelta(seconds=current_app.config['JOBS_RETENTION'])
+    nb = Job.query.filter(Job.statut.in_(('termine', 'erreur')), Job.finished_at < limite).delete(synchronize_session=False)
+    db.session.commit()
+    return nb
+
+
+def alleger_payload(job):
+    """Une tâche finie ne garde que ce qu'affichent ses pages (élève, trimestre, classes...)."""
+    if job.payload:
+        job.payload = {cle: valeur for cle, valeur in job.payload.items() if cle not in CHAMPS_LOURDS}
+
+
+def executer_job(job):
+    """Exécute une tâche réservée et enregistre son statut final."""
+    try:
+        HANDLERS[job.type](job)
+        job.statut = 'termine'
+        job.progression = 100
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Job {job.id} en erreur : {e}\n{traceback.format_exc()}")
+        job.statut = 'erreur'
+        job.erreur = str(e)
+    job.finished_at = datetime.utcnow()
+    alleger_payload(job)
+    db.session.commit()
+    return job
+
+
+def boucle_worker(intervalle=1.0, une_fois=False):
+    """
+    Boucle principale du worker : réserve et exécute les tâches au fil de l'eau. Toutes les
+    JOBS_MAINTENANCE secondes, les tâches bloquées sont relancées, les anciennes supprimées,
+    ainsi que les textes de bulletins qu'aucune analyse ne cite plus. Les métriques du worker
+    sont publiées en base à chaque maintenance et dès que la file se vide.
+    """
+    maintenance, a_publier = 0, False
+    while True:
+        if time.monotonic() >= maintenance:
+            relancer_jobs_bloques()
+            purger_jobs()
+            TexteBulletin.purger_orphelins()
+            purger_publications(current_app.config['JOBS_RETENTION'])
+            db.session.commit()
+            publier()
+            maintenance = time.monotonic() + current_app.config['JOBS_MAINTENANCE']
+        job = reserver_job()
+        if job:
+            executer_job(job)
+            a_publier = True
+            continue
+        if a_publier:
+            publier()
+            a_publier = False
+        if une_fois:
+            return
+        db.session.remove()
+        time.sleep(intervalle)
+
+
+def enregistrer_analyse(job, nom_fournisseur, reponse_ia):
+    """Crée l'Analyse correspondant à la réponse de l'IA et la rattache à la tâche."""
+    p = job.payload
+    with chrono('enregistrement'):
+        appreciation, justifications = separer_reponse(reponse_ia)
+        nouvelle_analyse = Analyse(
+            nom_eleve=p['nom_eleve'],
+            eleve_id=p.get('eleve_id'),
+            trimestre=p['trimestre'],
+            appreciation_principale=appreciation,
+            justifications=justifications,
+            donnees_brutes=p['donnees_structurees'],
+            classe_id=p['classe_id'],
+            prompt_name=p['prompt_name'],
+            provider_name=nom_fournisseur
+        )
+        db.session.add(nouvelle_analyse)
+        db.session.flush()
+        job.analyse_id = nouvelle_analyse.id
+    return nouvelle_analyse
+
+
+def _provider_du_job(job):
+    provider = db.session.get(AIProvider, job.payload['provider_id'])
+    if not provider:
+        raise ValueError("Le fournisseur d'IA de cette analyse n'existe plus.")
+    return provider
+
+
+@handler('analyse')
+@handler('analyse_flux')
+def traiter_analyse(job):
+    """Génère l'appréciation d'un élève et enregistre l'Analyse correspondante."""
+    p = job.payload
+    provider = _provider_du_job(job)
+    reponse_ia, nom_fournisseur = get_ai_response_cached(provider, p['prompt_systeme'], p['prompt_utilisateur'], forcer=p.get('forcer', False))
+    enregistrer_analyse(job, nom_fournisseur, reponse_ia)
+
+
+def chemin_export(job_id):
+    return os.path.join(current_app.config['EXPORTS_DOSSIER'], f"export_{job_id}.zip")
+
+
+def purger_exports():
+    """Supprime les archives d'export plus anciennes que EXPORTS_DUREE secondes."""
+    dossier = current_app.config['EXPORTS_DOSSIER']
+    if not os.path.isdir(dossier):
+        return
+    limite = time.time() - current_app.config['EXPORTS_DUREE']
+    for entree in os.scandir(dossier):
+        if entree.name.startswith('export_') and entree.stat().st_mtime < limite:
+            os.remove(entree.path)
+
+
+@handler('export')
+def traiter_export(job):
+    """
+    Exporte en PDF la dernière appréciation de chaque élève, pour chaque classe et chaque
+    trimestre demandés, dans une archive ZIP (un PDF par classe et par trimestre).
+    """
+    p = job.payload
+    classes = Classe.query.filter(Classe.id.in_(p['classes'])).order_by(Classe.annee_scolaire, Classe.nom_classe).all()
+    lots = [(classe, trimestre) for classe in classes for trimestre in sorted(p['trimestres'])]
+    if not lots:
+        raise ValueError("Aucune classe à exporter.")
+
+    purger_exports()
+    os.makedirs(current_app.config['EXPORTS_DOSSIER'], exist_ok=True)
+    chemin = chemin_export(job.id)
+    temporaire = f"{chemin}.tmp"
+    nb_fichiers = 0
+    with zipfile.ZipFile(temporaire, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for i, (classe, trimestre) in enumerate(lots, start=1):
+            analyses = dernieres_analyses(classe.id, trimestre)
+            if analyses:
+                nom_classe = classe.nom_classe.replace(' ', '_')
+                archive.writestr(
+                    f"{classe.annee_scolaire.replace('/', '-')}/{nom_classe}/appreciations_{nom_classe}_T{trimestre}.pdf",
+                    pdf_analyses(analyses, classe)
+                )
+                nb_fichiers += 1
+            job.progression = int(100 * i / len(lots))
+            job.signe_de_vie = datetime.utcnow()
+            db.session.commit()
+    if not nb_fichiers:
+        os.remove(temporaire)
+        raise ValueError("Aucune analyse à exporter pour les classes et trimestres choisis.")
+    os.replace(temporaire, chemin)
+
+
+def preparer_flux(job):
+    """
+    Avant la génération en flux : retourne (provider, clé du cache, réponse en cache ou None,
+    fournisseur de la réponse).
+    """
+    p = job.payload
+    provider = _provider_du_job(job)
+    cle = cle_reponse(provider, p['prompt_systeme'], p['prompt_utilisateur'])
+    reponse_ia, nom_fournisseur = (None if p.get('forcer') else lire_reponse(cle)) or (None, None)
+    return provider, cle, reponse_ia, nom_fournisseur or provider.name
+
+
+def conclure_flux(job, nom_fournisseur, cle, reponse_ia, generee):
+    """Après la génération en flux : met la réponse en cache, enregistre l'Analyse et retourne son id."""
+    if generee:
+        enregistrer_reponse(cle, reponse_ia, nom_fournisseur)
+    analyse = enregistrer_analyse(job, nom_fournisseur, reponse_ia)
+    job.statut = 'termine'
+    job.progression = 100
+    job.finished_at = datetime.utcnow()
+    alleger_payload(job)
+    db.session.commit()
+    return analyse.id
+
+
+def echec_flux(job, erreur):
+    db.session.rollback()
+    # format_exception plutôt que format_exc : l'appel peut venir d'un autre thread que l'exception (asgi.py)
+    current_app.logger.error(f"Job {job.id} en erreur : {erreur}\n{''.join(traceback.format_exception(erreur))}")
+    job.statut = 'erreur'
+    job.erreur = str(erreur)
+    job.finished_at = datetime.utcnow()
+    alleger_payload(job)
+    db.session.commit()
+
+
+def abandonner_flux(job):
+    """
+    Flux interrompu avant la fin (navigateur fermé) : la tâche est remise en attente,
+    elle sera reprise à la prochaine ouverture de la page ou par le worker.
+    """
+    db.session.rollback()
+    if job.statut == 'en_cours':
+        job.statut = 'en_attente'
+        db.session.commit()
+
+
+def executer_job_en_flux(job):
+    """
+    Exécute une analyse réservée en relayant la réponse de l'IA au fil de l'eau.
+    Produit des couples (événement, données) : 'appreciation' et 'justifications' pour les
+    fragments de texte, puis 'fin' avec l'id de l'Analyse enregistrée, ou 'erreur'.
+    """
+    p = job.payload
+    try:
+        provider, cle, reponse_ia, nom_fournisseur = preparer_flux(job)
+        decoupeur = DecoupeurFlux()
+        generee = reponse_ia is None
+        if not generee:
+            yield from decoupeur.ajouter(reponse_ia)
+        else:
+            # Budgets, reprises et bascule jusqu'au premier fragment, comme pour un appel complet
+            nom_fournisseur, fragments = ouvrir_flux(provider, p['prompt_systeme'], p['prompt_utilisateur'])
+            morceaux = []
+            try:
+                for fragment in fragments:
+                    morceaux.append(fragment)
+                    yield from decoupeur.ajouter(fragment)
+            finally:
+                fragments.close()
+            reponse_ia = "".join(morceaux)
+        yield from decoupeur.terminer()
+        yield 'fin', conclure_flux(job, nom_fournisseur, cle, reponse_ia, generee)
+    except Exception as e:
+        echec_flux(job, e)
+        yield 'erreur', str(e)
+    finally:
+        # GeneratorExit (client déconnecté) n'est pas une Exception : la tâche est encore 'en_cours'
+        abandonner_flux(job)
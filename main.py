@@ -1,48 +1,33 @@
 import os
-import re
-import pdfplumber
-import unicodedata
-import io
-from flask import Blueprint, render_template, request, flash, redirect, url_for, session, current_app
+import json
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import Blueprint, render_template, request, flash, redirect, url_for, session, current_app, g
 from flask_login import login_required, current_user, login_user, logout_user
-from mistralai.client import MistralClient
-from mistralai.models.chat_completion import ChatMessage
-from groq import Groq
-from openai import OpenAI
-from parser import analyser_texte_bulletin
-from models import db, Classe, Analyse, User, Prompt, AIProvider
-from flask import Response
-from weasyprint import HTML
+from parser import parser_pour, invalider_parser
+from pipeline import (
+    decouper_pdf_classe, decouper_zip_classe, verifier_donnees,
+    precedentes_par_trimestre, separer_reponse
+)
+from budget_prompt import compacter
+from requetes import dernieres_analyses, nombre_versions, versions_precedentes
+from models import db, Classe, Eleve, Analyse, User, Prompt, AIProvider, Job, LimiteFournisseur, TexteBulletin, noms_eleves, noms_matieres
+from flask import Response, jsonify, stream_with_context, send_file
+from rendu_pdf import pdf_analyses
+from metriques import chrono, metriques_globales, publier_periodiquement
 from extensions import mail
 from flask_mail import Message
+from providers import clients, latences
+from ordonnanceur import ordonnanceur
+from jobs import creer_job, executer_job, reserver, executer_job_en_flux, chemin_export
+from cache_config import fournisseur_actif, prompt_actif, invalider_config
+from regroupement import former_paquets, generer_paquet
+from televersement import recevoir, taille_lisible
+from werkzeug.exceptions import RequestEntityTooLarge
+from cache import get_ai_response_cached, analyser_bulletin_pdf, statistiques_cache, vider_cache
 
 main = Blueprint('main', __name__)
 
-def get_ai_response(provider, system_prompt, user_prompt):
-    """Appelle le bon fournisseur d'IA et retourne la réponse."""
-    provider_name = provider.name.lower()
-    if provider_name == 'mistral':
-        client = MistralClient(api_key=provider.api_key)
-        messages = [ChatMessage(role="system", content=system_prompt), ChatMessage(role="user", content=user_prompt)]
-        chat_response = client.chat(model=provider.model_name, messages=messages, temperature=0.6)
-        return chat_response.choices[0].message.content
-    elif provider_name == 'groq':
-        client = Groq(api_key=provider.api_key)
-        chat_completion = client.chat.completions.create(
-            messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}],
-            model=provider.model_name, temperature=0.5
-        )
-        return chat_completion.choices[0].message.content
-    elif provider_name == 'openai':
-        client = OpenAI(api_key=provider.api_key)
-        chat_completion = client.chat.completions.create(
-            messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}],
-            model=provider.model_name, temperature=0.5
-        )
-        return chat_completion.choices[0].message.content
-    else:
-        raise ValueError(f"Fournisseur d'IA '{provider.name}' non supporté.")
-
 @main.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated: 
@@ -74,10 +59,10 @@ def accueil():
     try:
         classes = Classe.query.order_by(Classe.annee_scolaire.desc(), Classe.nom_classe).all()
         derniere_classe_id = session.get('classe_id')
-        return render_template('accueil.html', classes=classes, derniere_classe_id=derniere_classe_id)
+        return render_template('accueil.html', classes=classes, derniere_classe_id=derniere_classe_id, stats=Classe.statistiques())
     except Exception as e:
         flash(f"La base de données n'est pas initialisée. Veuillez visiter l'URL /init-db-manuellement. Erreur: {e}", "warning")
-        return render_template('accueil.html', classes=[], derniere_classe_id=None)
+        return render_template('accueil.html', classes=[], derniere_classe_id=None, stats={})
 
 @main.route('/analyser', methods=['GET', 'POST'])
 @login_required
@@ -87,8 +72,7 @@ def analyser():
         return redirect(url_for('main.accueil'))
     
     classe = Classe.query.get_or_404(classe_id)
-    eleves_liste = [e.strip() for e in classe.eleves.split('\n') if e.strip()]
-    matieres_attendues = [m.strip() for m in classe.matieres.split(',') if m.strip()]
+    eleves_liste = classe.noms_eleves
     
     if request.method == 'POST':
         fichier = request.files.get('bulletin_pdf')
@@ -102,76 +86,48 @@ def analyser():
         trimestre = int(trimestre_str)
         
         try:
-            active_provider = AIProvider.query.filter_by(is_active=True).first()
-            active_prompt = Prompt.query.filter_by(is_active=True).first()
+            active_provider = fournisseur_actif()
+            active_prompt = prompt_actif()
             if not active_provider or not active_prompt:
                 raise ValueError("Veuillez définir un Fournisseur IA et un Prompt actifs dans la Configuration.")
 
-            pdf_bytes = fichier.read()
-            texte_extrait = ""
-            with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-                full_text = [page.extract_text() for page in pdf.pages if page.extract_text()]
-                texte_extrait = "\n".join(full_text)
+            eleve = Eleve.query.filter_by(classe_id=classe.id, nom=nom_eleve, actif=True).first()
+            if not eleve:
+                raise ValueError(f"L'élève '{nom_eleve}' ne fait pas partie de la classe.")
+
+            with recevoir(fichier) as televersement:
+                texte_extrait, donnees_structurees = analyser_bulletin_pdf(televersement, nom_eleve, parser_pour(classe.id, classe.noms_matieres))
 
             if not texte_extrait: 
                 raise ValueError("Le contenu du PDF est vide ou illisible.")
 
-            donnees_structurees = analyser_texte_bulletin(texte_extrait, nom_eleve, matieres_attendues)
-            
-            # --- CORRECTION MAJEURE : Vérifier si le parser a fonctionné ---
-            if not donnees_structurees.get("appreciations_matieres"):
-                raise ValueError(
-                    "Le parser n'a trouvé aucune matière. Vérifiez que les noms des matières dans la configuration de la classe "
-                    "correspondent EXACTEMENT à ceux du PDF (y compris les abréviations, points, et espacements comme 'SC. ECONO.& SOCIALES')."
-                )
-            # --- FIN DE LA CORRECTION ---
-
-            if not donnees_structurees.get("nom_eleve"): 
-                raise ValueError(f"Le nom '{nom_eleve}' n'a pas été trouvé dans le PDF.")
-            
-            appreciations_precedentes = ""
-            if trimestre > 1:
-                analyses_t1 = Analyse.query.filter_by(classe_id=classe_id, nom_eleve=nom_eleve, trimestre=1).first()
-                if analyses_t1: 
-                    appreciations_precedentes += f"Appréciation du Trimestre 1:\n{analyses_t1.appreciation_principale}\n\n"
-            if trimestre > 2:
-                analyses_t2 = Analyse.query.filter_by(classe_id=classe_id, nom_eleve=nom_eleve, trimestre=2).first()
-                if analyses_t2: 
-                    appreciations_precedentes += f"Appréciation du Trimestre 2:\n{analyses_t2.appreciation_principale}\n\n"
-            
-            contexte_trimestre = "C'est le début de l'année, l'appréciation doit être encourageante et fixer des objectifs clairs pour les deux trimestres restants." if trimestre == 1 else "C'est le milieu de l'année. L'appréciation doit faire le bilan des progrès par rapport au T1 et motiver pour le dernier trimestre." if trimestre == 2 else "C'est la fin de l'année. L'appréciation doit être un bilan final, tenir compte de l'évolution sur l'année et donner des conseils pour la poursuite d'études."
-            
-            liste_appreciations = "\n".join([f"- {item['matiere']} ({item['moyenne']}): {item['commentaire']}" for item in donnees_structurees['appreciations_matieres']])
+            verifier_donnees(donnees_structurees, nom_eleve)
             
+            with chrono('precedentes'):
+                precedentes = precedentes_par_trimestre(eleve.id, trimestre)
             prompt_systeme = active_prompt.system_message
-            prompt_utilisateur = active_prompt.user_message_template.format(
-                nom_eleve=nom_eleve, trimestre=trimestre, contexte_trimestre=contexte_trimestre,
-                appreciations_precedentes=appreciations_precedentes, liste_appreciations=liste_appreciations
-            )
+            with chrono('prompt'):
+                prompt_utilisateur = compacter(active_prompt, active_provider, nom_eleve, trimestre, donnees_structurees, precedentes).texte
             
-            reponse_ia = get_ai_response(active_provider, prompt_systeme, prompt_utilisateur)
-            
-            separateur = "--- JUSTIFICATIONS ---"
-            if separateur in reponse_ia:
-                parties = reponse_ia.split(separateur, 1)
-                appreciation, justifications = parties[0].strip(), parties[1].strip()
-            else:
-                appreciation, justifications = reponse_ia, ""
-                
-            nouvelle_analyse = Analyse(
-                nom_eleve=nom_eleve, 
-                trimestre=trimestre, 
-                appreciation_principale=appreciation, 
-                justifications=justifications, 
-                donnees_brutes=donnees_structurees, 
-                classe_id=classe_id, 
-                prompt_name=active_prompt.name, 
-                provider_name=active_provider.name
-            )
-            db.session.add(nouvelle_analyse)
-            db.session.commit()
-            
-            return render_template('resultat.html', res=nouvelle_analyse, classe=classe)
+            # La génération IA est confiée au worker (ou au flux SSE de la page d'attente) :
+            # la requête rend la main immédiatement
+            streaming = current_app.config['STREAMING_ACTIVE']
+            with chrono('file_attente'):
+                job = creer_job('analyse_flux' if streaming else 'analyse', {
+                    'nom_eleve': nom_eleve,
+                    'eleve_id': eleve.id,
+                    'trimestre': trimestre,
+                    'classe_id': classe.id,
+                    'donnees_structurees': donnees_structurees,
+                    'prompt_systeme': prompt_systeme,
+                    'prompt_utilisateur': prompt_utilisateur,
+                    'prompt_name': active_prompt.name,
+                    'provider_id': active_provider.id,
+                    'forcer': bool(request.form.get('forcer'))
+                })
+            if not current_app.config['JOBS_ASYNC'] and not streaming:
+                executer_job(job)
+            return redirect(url_for('main.suivi_job', job_id=job.id))
 
         except Exception as e:
             flash(f"Une erreur est survenue : {e}", "danger")
@@ -179,12 +135,281 @@ def analyser():
 
     return render_template('analyser.html', classe=classe, eleves_liste=eleves_liste)
 
+@main.route('/analyser/classe', methods=['POST'])
+@login_required
+def analyser_classe():
+    """
+    Analyse toute une classe en une fois : l'export PDF complet (ou un ZIP de bulletins)
+    est découpé par élève et les appels à l'IA sont lancés en parallèle.
+    """
+    classe_id = session.get('classe_id')
+    if not classe_id:
+        return redirect(url_for('main.accueil'))
+
+    classe = Classe.query.get_or_404(classe_id)
+    eleves_liste = classe.noms_eleves
+
+    fichier = request.files.get('bulletins_classe')
+    trimestre_str = request.form.get('trimestre')
+    if not all([fichier, trimestre_str]):
+        flash("Tous les champs sont requis.", "danger")
+        return redirect(url_for('main.analyser'))
+
+    trimestre = int(trimestre_str)
+
+    try:
+        active_provider = fournisseur_actif()
+        active_prompt = prompt_actif()
+        if not active_provider or not active_prompt:
+            raise ValueError("Veuillez définir un Fournisseur IA et un Prompt actifs dans la Configuration.")
+
+        with recevoir(fichier) as televersement, chrono('extraction'):
+            if fichier.filename.lower().endswith('.zip'):
+                bulletins = decouper_zip_classe(televersement.chemin, eleves_liste, current_app.config['UPLOAD_MAX_OCTETS'])
+            else:
+                bulletins = decouper_pdf_classe(televersement.chemin, eleves_liste)
+        if not bulletins:
+            raise ValueError("Aucun bulletin d'élève de la classe n'a été reconnu dans le fichier.")
+
+        # 1. Préparation des prompts (rapide, dans la requête)
+        erreurs = {}
+        a_generer = []
+        with chrono('parser'):
+            analyses_bulletins = parser_pour(classe.id, classe.noms_matieres).analyser_lot(bulletins)
+        ids_eleves = classe.ids_eleves()
+        for (nom_eleve, _), donnees_structurees in zip(bulletins, analyses_bulletins):
+            try:
+                verifier_donnees(donnees_structurees, nom_eleve)
+                with chrono('precedentes'):
+                    precedentes = precedentes_par_trimestre(ids_eleves[nom_eleve], trimestre)
+                with chrono('prompt'):
+                    compact = compacter(active_prompt, active_provider, nom_eleve, trimestre, donnees_structurees, precedentes)
+                a_generer.append((nom_eleve, donnees_structurees, compact))
+            except Exception as e:
+                erreurs[nom_eleve] = str(e)
+
+        # 2. Appels à l'IA via un pool borné : la classe prend le temps des appels les plus lents
+        reponses = {}
+        app = current_app._get_current_object()
+
+        forcer = bool(request.form.get('forcer'))
+        # Les threads du pool ne partagent pas la session de la requête (une Session SQLAlchemy
+        # n'est pas thread-safe) : chacun recharge le fournisseur et le prompt dans la sienne
+        provider_id, prompt_id = active_provider.id, active_prompt.id
+
+        def generer(prompt_utilisateur):
+            with app.app_context():
+                provider, prompt = db.session.get(AIProvider, provider_id), db.session.get(Prompt, prompt_id)
+                return get_ai_response_cached(provider, prompt.system_message, prompt_utilisateur, forcer=forcer)
+
+        def generer_groupe(paquet):
+            with app.app_context():
+                provider, prompt = db.session.get(AIProvider, provider_id), db.session.get(Prompt, prompt_id)
+                return generer_paquet(provider, prompt, trimestre, paquet, forcer=forcer)
+
+        max_workers = current_app.config['BATCH_MAX_WORKERS']
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            restants = a_generer
+            if current_app.config['PACK_ELEVES_MAX'] > 1:
+                # Plusieurs élèves par appel ; ceux que la réponse groupée n'a pas su rendre repartent un par un
+                paquets = former_paquets(active_provider, active_prompt, trimestre, [(nom, compact.donnees, compact.precedentes) for nom, _, compact in a_generer])
+                for future in as_completed([pool.submit(generer_groupe, paquet) for paquet in paquets if len(paquet) > 1]):
+                    try:
+                        reponses.update(future.result())
+                    except Exception as e:
+                        current_app.logger.warning(f"Génération groupée impossible, élèves générés un par un : {e}")
+                restants = [eleve for eleve in a_generer if eleve[0] not in reponses]
+            futures = {
+                pool.submit(generer, compact.texte): nom_eleve
+                for nom_eleve, _, compact in restants
+            }
+            for future in as_completed(futures):
+                nom_eleve = futures[future]
+                try:
+                    reponses[nom_eleve] = future.result()
+                except Exception as e:
+                    erreurs[nom_eleve] = str(e)
+
+        # 3. Un seul insert groupé pour toute la classe
+        nouvelles_analyses = []
+        for nom_eleve, donnees_structurees, _ in a_generer:
+            if nom_eleve not in reponses:
+                continue
+            reponse_ia, nom_fournisseur = reponses[nom_eleve]
+            appreciation, justifications = separer_reponse(reponse_ia)
+            nouvelles_analyses.append(Analyse(
+                nom_eleve=nom_eleve,
+                eleve_id=ids_eleves[nom_eleve],
+                trimestre=trimestre,
+                appreciation_principale=appreciation,
+                justifications=justifications,
+                donnees_brutes=donnees_structurees,
+                classe_id=classe_id,
+                prompt_name=active_prompt.name,
+                provider_name=nom_fournisseur
+            ))
+        with chrono('enregistrement'):
+            db.session.add_all(nouvelles_analyses)
+            db.session.commit()
+
+        return render_template('resultat_classe.html', analyses=nouvelles_analyses, erreurs=erreurs, classe=classe, trimestre=trimestre)
+
+    except Exception as e:
+        flash(f"Une erreur est survenue : {e}", "danger")
+        return redirect(url_for('main.analyser'))
+
+@main.route('/jobs/<int:job_id>')
+@login_required
+def suivi_job(job_id):
+    """Page d'attente d'une génération : redirige vers le résultat dès que la tâche est terminée."""
+    job = Job.query.get_or_404(job_id)
+    if job.statut == 'termine' and job.analyse_id:
+        return redirect(url_for('main.voir_analyse', analyse_id=job.analyse_id))
+    return render_template('job.html', job=job)
+
+@main.route('/jobs/<int:job_id>/statut')
+@login_required
+def statut_job(job_id):
+    """Statut d'une tâche au format JSON, interrogé périodiquement par la page d'attente."""
+    job = Job.query.get_or_404(job_id)
+    resultat_url = url_for('main.voir_analyse', analyse_id=job.analyse_id) if job.analyse_id else None
+    if job.type == 'export' and job.statut == 'termine':
+        resultat_url = url_for('main.telecharger_export', job_id=job.id)
+    return jsonify(id=job.id, type=job.type, statut=job.statut, progression=job.progression,
+                   erreur=job.erreur, resultat_url=resultat_url)
+
+@main.route('/exports', methods=['POST'])
+@login_required
+def creer_export():
+    """Lance en tâche de fond l'export PDF des classes et trimestres cochés."""
+    classes = request.form.getlist('classes', type=int)
+    trimestres = [t for t in request.form.getlist('trimestres', type=int) if t in (1, 2, 3)]
+    if not classes or not trimestres:
+        flash("Choisissez au moins une classe et un trimestre à exporter.", "warning")
+        return redirect(url_for('main.historique_global'))
+    job = creer_job('export', {'classes': classes, 'trimestres': trimestres})
+    if not current_app.config['JOBS_ASYNC']:
+        executer_job(job)
+    return redirect(url_for('main.suivi_export', job_id=job.id))
+
+@main.route('/exports/<int:job_id>')
+@login_required
+def suivi_export(job_id):
+    """Page de suivi d'un export : barre de progression puis lien de téléchargement."""
+    job = Job.query.filter_by(id=job_id, type='export').first_or_404()
+    classes = Classe.query.filter(Classe.id.in_(job.payload['classes'])).order_by(Classe.nom_classe).all()
+    return render_template('export.html', job=job, classes=classes)
+
+@main.route('/exports/<int:job_id>/telecharger')
+@login_required
+def telecharger_export(job_id):
+    job = Job.query.filter_by(id=job_id, type='export', statut='termine').first_or_404()
+    chemin = chemin_export(job.id)
+    if not os.path.exists(chemin):
+        flash("Cette archive a expiré, relancez l'export.", "warning")
+        return redirect(url_for('main.historique_global'))
+    return send_file(chemin, mimetype='application/zip', as_attachment=True,
+                     download_name=f"appreciations_export_{job.id}.zip")
+
+@main.route('/jobs/<int:job_id>/flux')
+@login_required
+def flux_job(job_id):
+    """
+    Génère l'appréciation d'une tâche en attente et relaie la réponse de l'IA en
+    server-sent events. Si la tâche est déjà prise (par le worker), on envoie 'attente'
+    et la page revient au suivi classique. Seules les analyses en flux passent par ici :
+    un export ou une analyse du worker ne peut pas être réservé depuis cette adresse.
+    """
+    Job.query.filter_by(id=job_id, type='analyse_flux').first_or_404()
+
+    def evenements():
+        # Réservée au premier envoi seulement : un client parti avant ne laisse pas la tâche 'en_cours'
+        job = reserver(job_id, 'analyse_flux')
+        if not job:
+            yield sse('attente', None)
+            return
+        flux = executer_job_en_flux(job)
+        try:
+            for evenement, donnees in flux:
+                if evenement == 'fin':
+                    donnees = url_for('main.voir_analyse', analyse_id=donnees)
+                yield sse(evenement, donnees)
+        finally:
+            flux.close()
+
+    return Response(stream_with_context(evenements()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def sse(evenement, donnees):
+    """Formate un message server-sent event (données encodées en JSON)."""
+    return f"event: {evenement}\ndata: {json.dumps(donnees)}\n\n"
+
+@main.route('/analyse/<int:analyse_id>')
+@login_required
+def voir_analyse(analyse_id):
+    """Affiche le résultat d'une analyse enregistrée."""
+    analyse = Analyse.query.get_or_404(analyse_id)
+    return render_template('resultat.html', res=analyse, classe=analyse.classe)
+
 @main.route('/configuration')
 @login_required
 def configuration():
     """Affiche uniquement la liste des classes existantes."""
     classes = Classe.query.order_by(Classe.annee_scolaire.desc()).all()
-    return render_template('configuration.html', classes=classes)
+    return render_template('configuration.html', classes=classes, stats_cache=statistiques_cache())
+
+@main.after_request
+def publier_metriques(response):
+    """Métriques du processus publiées en base pour /metrics, quel que soit le processus qui sera interrogé."""
+    try:
+        publier_periodiquement(current_app.config['METRIQUES_PUBLICATION'])
+    except Exception as e:
+        # Les métriques ne doivent jamais faire échouer une requête
+        current_app.logger.warning(f"Publication des métriques impossible : {e}")
+    return response
+
+@main.after_request
+def journaliser_chronos(response):
+    """Une ligne de journal par requête instrumentée, avec la durée de chaque étape."""
+    chronos = g.get('chronos')
+    if chronos:
+        totaux = {}
+        for etape, duree in chronos:
+            totaux[etape] = totaux.get(etape, 0) + duree  # étapes répétées (classe entière) cumulées
+        etapes = " ".join(f"{etape}={duree * 1000:.1f}ms" for etape, duree in totaux.items())
+        if g.get('tokens_economises'):
+            etapes += f" tokens_economises={g.tokens_economises}"
+        current_app.logger.info(f"{request.method} {request.path} {response.status_code} | {etapes}")
+    return response
+
+@main.app_errorhandler(RequestEntityTooLarge)
+def fichier_trop_volumineux(erreur):
+    """Envoi refusé par Werkzeug (MAX_CONTENT_LENGTH) avant même d'être lu."""
+    flash(f"Le fichier dépasse la taille maximale autorisée ({taille_lisible(current_app.config['UPLOAD_MAX_OCTETS'])}).", "danger")
+    return redirect(request.referrer or url_for('main.accueil'))
+
+@main.route('/metrics')
+def metrics():
+    """Métriques au format Prometheus (session ouverte, ou en-tête 'Authorization: Bearer METRIQUES_JETON')."""
+    jeton = current_app.config['METRIQUES_JETON']
+    if not current_user.is_authenticated and not (jeton and request.headers.get('Authorization') == f"Bearer {jeton}"):
+        return current_app.login_manager.unauthorized()
+    return Response(metriques_globales().prometheus(), mimetype='text/plain; version=0.0.4')
+
+@main.route('/metriques')
+@login_required
+def page_metriques():
+    """Durées récentes (p50/p95) de chaque étape du pipeline, par fournisseur et modèle."""
+    total = metriques_globales()
+    return render_template('metriques.html', etapes=total.resume(), economies=total.economies())
+
+@main.route('/cache/vider', methods=['POST'])
+@login_required
+def vider_cache_reponses():
+    """Vide le cache des réponses de l'IA et celui des bulletins extraits."""
+    vider_cache()
+    flash("Les caches (réponses de l'IA et bulletins extraits) ont été vidés.", "info")
+    return redirect(url_for('main.configuration'))
 
 @main.route('/classe/add', methods=['GET', 'POST'])
 @login_required
@@ -197,8 +422,11 @@ def add_classe():
         eleves = request.form.get('eleves')
         
         if all([annee, nom_classe, matieres, eleves]):
-            new_classe = Classe(annee_scolaire=annee, nom_classe=nom_classe, matieres=matieres, eleves=eleves)
+            new_classe = Classe(annee_scolaire=annee, nom_classe=nom_classe)
             db.session.add(new_classe)
+            db.session.flush()
+            new_classe.definir_matieres(noms_matieres(matieres))
+            new_classe.definir_eleves(noms_eleves(eleves))
             db.session.commit()
             flash("Nouvelle classe ajoutée avec succès !", "success")
             return redirect(url_for('main.configuration'))
@@ -214,9 +442,10 @@ def edit_classe(classe_id):
     classe = Classe.query.get_or_404(classe_id)
     if request.method == 'POST':
         # On met à jour uniquement les champs modifiables
-        classe.matieres = request.form.get('matieres')
-        classe.eleves = request.form.get('eleves')
+        classe.definir_matieres(noms_matieres(request.form.get('matieres')))
+        classe.definir_eleves(noms_eleves(request.form.get('eleves')))
         db.session.commit()
+        invalider_parser(classe.id)
         flash(f"La classe '{classe.nom_classe}' a été mise à jour avec succès.", "success")
         return redirect(url_for('main.configuration'))
         
@@ -227,29 +456,49 @@ def edit_classe(classe_id):
 def supprimer_classe(classe_id):
     classe = Classe.query.get_or_404(classe_id)
     db.session.delete(classe)
+    db.session.flush()
+    TexteBulletin.purger_orphelins()
     db.session.commit()
+    invalider_parser(classe_id)
     return redirect(url_for('main.configuration'))
 
 @main.route('/historique/<int:classe_id>')
 @login_required
 def historique_classe(classe_id):
+    """
+    Dernière version de chaque appréciation, par élève et par trimestre. Les versions
+    précédentes sont chargées à la demande (historique_versions).
+    """
     classe = Classe.query.get_or_404(classe_id)
     analyses_par_eleve = {}
+    # dernieres_analyses est déjà trié par élève puis par trimestre : un seul passage suffit
+    for analyse in dernieres_analyses(classe_id):
+        analyses_par_eleve.setdefault(analyse.eleve_id, []).append(analyse)
+    versions = nombre_versions(classe_id)
     
-    # Logique existante pour trier par élève
-    eleves_tries = sorted(list(set(a.nom_eleve for a in classe.analyses)))
-    for nom_eleve in eleves_tries:
-        analyses_par_eleve[nom_eleve] = sorted([a for a in classe.analyses if a.nom_eleve == nom_eleve], key=lambda x: (x.trimestre, x.created_at))
-    
-    # NOUVELLE LOGIQUE : Trouver les trimestres pour lesquels il existe au moins une analyse
-    trimestres_disponibles = sorted(list(set(a.trimestre for a in classe.analyses)))
+    # Trimestres pour lesquels il existe au moins une analyse
+    trimestres_disponibles = sorted({trimestre for _, trimestre in versions})
     
-    return render_template(
+    page = render_template(
         'historique.html', 
         classe=classe, 
         analyses_par_eleve=analyses_par_eleve,
-        trimestres_disponibles=trimestres_disponibles  # On passe la nouvelle variable
+        versions=versions,
+        trimestres_disponibles=trimestres_disponibles
     )
+    # Conserve les justifications rendues pendant l'affichage
+    db.session.commit()
+    return page
+
+@main.route('/historique/<int:classe_id>/versions')
+@login_required
+def historique_versions(classe_id):
+    """Fragment HTML des versions précédentes d'une appréciation (chargé par la page d'historique)."""
+    trimestre = request.args.get('trimestre', type=int)
+    analyses = versions_precedentes(classe_id, request.args.get('eleve_id', type=int), trimestre)
+    fragment = render_template('historique_versions.html', analyses=analyses)
+    db.session.commit()
+    return fragment
 
 @main.route('/historique')
 @login_required
@@ -257,11 +506,12 @@ def historique_global():
     """Affiche la liste de toutes les classes ayant au moins une analyse."""
     # On récupère uniquement les classes qui ont des analyses associées
     # pour ne pas afficher de classes vides sur cette page.
-    classes_avec_analyses = Classe.query.filter(Classe.analyses.any()).order_by(
+    stats = Classe.statistiques()
+    classes_avec_analyses = Classe.query.filter(Classe.id.in_(list(stats))).order_by(
         Classe.annee_scolaire.desc(), Classe.nom_classe
     ).all()
     
-    return render_template('historique_global.html', classes=classes_avec_analyses)
+    return render_template('historique_global.html', classes=classes_avec_analyses, stats=stats)
 
 @main.route('/prompts')
 @login_required
@@ -279,6 +529,7 @@ def add_prompt():
             return redirect(url_for('main.add_prompt'))
         new_prompt = Prompt(name=name, system_message=system_message, user_message_template=user_message_template)
         db.session.add(new_prompt)
+        invalider_config()
         db.session.commit()
         flash(f"Prompt '{name}' ajouté !", "success")
         return redirect(url_for('main.list_prompts'))
@@ -292,6 +543,7 @@ def edit_prompt(prompt_id):
         prompt.name = request.form.get('name')
         prompt.system_message = request.form.get('system_message')
         prompt.user_message_template = request.form.get('user_message_template')
+        invalider_config()
         db.session.commit()
         flash(f"Prompt '{prompt.name}' mis à jour !", "success")
         return redirect(url_for('main.list_prompts'))
@@ -303,6 +555,7 @@ def set_active_prompt(prompt_id):
     Prompt.query.update({'is_active': False})
     prompt = Prompt.query.get_or_404(prompt_id)
     prompt.is_active = True
+    invalider_config()
     db.session.commit()
     flash(f"Prompt '{prompt.name}' activé !", "success")
     return redirect(url_for('main.list_prompts'))
@@ -315,6 +568,7 @@ def delete_prompt(prompt_id):
         flash("Impossible de supprimer un prompt actif.", "danger")
     else:
         db.session.delete(prompt)
+        invalider_config()
         db.session.commit()
         flash(f"Prompt '{prompt.name}' supprimé !", "info")
     return redirect(url_for('main.list_prompts'))
@@ -323,7 +577,12 @@ def delete_prompt(prompt_id):
 @login_required
 def list_providers():
     providers = AIProvider.query.order_by(AIProvider.name).all()
-    return render_template('providers.html', providers=providers)
+    return render_template('providers.html', providers=providers, latences=latences.statistiques())
+
+def limite_depuis_formulaire():
+    """Budgets saisis dans le formulaire d'un fournisseur (None si aucun)."""
+    rpm, tpm = request.form.get('rpm', type=int), request.form.get('tpm', type=int)
+    return LimiteFournisseur(rpm=rpm, tpm=tpm) if rpm or tpm else None
 
 @main.route('/providers/add', methods=['GET', 'POST'])
 @login_required
@@ -334,7 +593,9 @@ def add_provider():
             flash("Tous les champs sont requis.", "warning")
         else:
             new_provider = AIProvider(name=name, api_key=api_key, model_name=model_name)
+            new_provider.limite = limite_depuis_formulaire()
             db.session.add(new_provider)
+            invalider_config()
             db.session.commit()
             flash(f"Fournisseur '{name}' ajouté !", "success")
             return redirect(url_for('main.list_providers'))
@@ -350,7 +611,10 @@ def edit_provider(provider_id):
         if new_api_key:
             provider.api_key = new_api_key
         provider.model_name = request.form.get('model_name')
+        provider.limite = limite_depuis_formulaire()
+        invalider_config()
         db.session.commit()
+        clients.invalider(provider.id)
         flash(f"Fournisseur '{provider.name}' mis à jour !", "success")
         return redirect(url_for('main.list_providers'))
     return render_template('providers_form.html', provider=provider)
@@ -361,7 +625,9 @@ def set_active_provider(provider_id):
     AIProvider.query.update({'is_active': False})
     provider = AIProvider.query.get_or_404(provider_id)
     provider.is_active = True
+    invalider_config()
     db.session.commit()
+    clients.invalider(provider.id)
     flash(f"Fournisseur '{provider.name}' activé !", "success")
     return redirect(url_for('main.list_providers'))
 
@@ -373,16 +639,26 @@ def delete_provider(provider_id):
         flash("Impossible de supprimer un fournisseur actif.", "danger")
     else:
         db.session.delete(provider)
+        invalider_config()
         db.session.commit()
+        clients.invalider(provider_id)
         flash(f"Fournisseur '{provider.name}' supprimé !", "info")
     return redirect(url_for('main.list_providers'))
     
+@main.route('/providers/stats')
+@login_required
+def providers_stats():
+    """Statistiques des clients SDK et de leurs pools de connexions (JSON)."""
+    return jsonify(clients=clients.statistiques(), latences=latences.statistiques(), usage=ordonnanceur.usage())
+
 @main.route('/analyse/supprimer/<int:analyse_id>', methods=['POST'])
 @login_required
 def supprimer_analyse(analyse_id):
     analyse = Analyse.query.get_or_404(analyse_id)
     classe_id = analyse.classe_id
     db.session.delete(analyse)
+    db.session.flush()
+    TexteBulletin.purger_orphelins()
     db.session.commit()
     return redirect(url_for('main.historique_classe', classe_id=classe_id))
 
@@ -394,11 +670,9 @@ def download_pdf(analyse_id):
     analyse = Analyse.query.get_or_404(analyse_id)
     classe = analyse.classe # SQLAlchemy backref nous donne accès à la classe
     
-    # Rendre le template HTML avec les données de l'analyse
-    html_string = render_template('pdf_template.html', analyse=analyse, classe=classe)
-    
-    # Utiliser WeasyPrint pour convertir le HTML en PDF
-    pdf_bytes = HTML(string=html_string).write_pdf()
+    # PDF rendu par WeasyPrint, ou relu du cache si l'analyse n'a pas changé
+    pdf_bytes = pdf_analyses([analyse], classe)
+    db.session.commit()
     
     # Créer un nom de fichier propre
     filename = f"appreciation_{analyse.nom_eleve.replace(' ', '_')}_T{analyse.trimestre}.pdf"
@@ -420,32 +694,16 @@ def download_bulk_pdf(classe_id, trimestre):
     """
     classe = Classe.query.get_or_404(classe_id)
     
-    # 1. Récupérer toutes les analyses pour le trimestre
-    analyses_trimestre = Analyse.query.filter_by(classe_id=classe_id, trimestre=trimestre).all()
-    
-    # 2. Identifier tous les élèves uniques ayant une analyse
-    noms_eleves = sorted(list(set(a.nom_eleve for a in analyses_trimestre)))
-    
-    # 3. Pour chaque élève, trouver son analyse la plus récente pour ce trimestre
-    analyses_finales = []
-    for nom in noms_eleves:
-        analyse_recente = Analyse.query.filter_by(
-            classe_id=classe_id, 
-            trimestre=trimestre, 
-            nom_eleve=nom
-        ).order_by(Analyse.created_at.desc()).first()
-        if analyse_recente:
-            analyses_finales.append(analyse_recente)
+    # 1. L'analyse la plus récente de chaque élève pour ce trimestre, en une requête
+    analyses_finales = dernieres_analyses(classe_id, trimestre)
     
     if not analyses_finales:
         flash(f"Aucune analyse à inclure dans le PDF pour le Trimestre {trimestre}.", "warning")
         return redirect(url_for('main.historique_classe', classe_id=classe_id))
 
-    # 4. Rendre le template HTML avec la liste des analyses finales
-    html_string = render_template('pdf_bulk_template.html', analyses=analyses_finales, classe=classe, trimestre=trimestre)
-    
-    # 5. Convertir en PDF
-    pdf_bytes = HTML(string=html_string).write_pdf()
+    # 2. Une page par élève, rendues en parallèle (seules celles absentes du cache) puis assemblées
+    pdf_bytes = pdf_analyses(analyses_finales, classe)
+    db.session.commit()
     
     filename = f"appreciations_{classe.nom_classe.replace(' ', '_')}_T{trimestre}.pdf"
     
@@ -465,6 +723,8 @@ def edit_analyse(analyse_id):
     
     if nouvelle_appreciation:
         analyse.appreciation_principale = nouvelle_appreciation
+        analyse.justifications_html = None
+        analyse.modifie_le = datetime.utcnow()
         db.session.commit()
         flash("L'appréciation a été mise à jour avec succès.", "success")
     else:
@@ -504,6 +764,7 @@ def account():
                 flash('Les mots de passe ne correspondent pas.', 'danger')
                 return render_template('account.html')
         
+        invalider_config()
         db.session.commit()
         flash('Votre compte a été mis à jour !', 'success')
         return redirect(url_for('main.account'))
@@ -536,6 +797,7 @@ def reset_password(token):
         password_confirm = request.form.get('password_confirm')
         if password == password_confirm:
             user.set_password(password)
+            invalider_config()
             db.session.commit()
             flash('Votre mot de passe a été mis à jour ! Vous pouvez vous connecter.', 'success')
             return redirect(url_for('main.login'))
@@ -554,11 +816,12 @@ def init_db_manually():
         from models import User, Prompt, AIProvider
         from extensions import db
         from flask import current_app
+        from migrations import mettre_a_jour
         import os 
 
         with current_app.app_context():
             db.drop_all() 
-            db.create_all()
+            mettre_a_jour()
 
             if not User.query.first():
                 admin_username = os.getenv('APP_USERNAME', 'admin')
@@ -601,6 +864,7 @@ Sous le séparateur, justifie chaque idée clé avec des citations brutes des co
                 )
                 db.session.add(default_provider)
 
+            invalider_config()
             db.session.commit()
 
         flash("La base de données a été réinitialisée avec succès ! Vous pouvez maintenant vous connecter avec les identifiants par défaut.", "success")
@@ -0,0 +1,226 @@
+# metriques.py
+import math
+import os
+import socket
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from flask import g, has_request_context
+from sqlalchemy import select
+from models import db, MetriquesProcessus
+
+# Bornes (secondes) des histogrammes exposés au format Prometheus
+BORNES = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def percentile(valeurs, p):
+    """Percentile p (0-100) par la méthode du rang le plus proche, None si aucune valeur."""
+    valeurs = sorted(valeurs)
+    if not valeurs:
+        return None
+    rang = max(0, min(len(valeurs) - 1, math.ceil(p / 100 * len(valeurs)) - 1))
+    return round(valeurs[rang], 3)
+
+
+class Metriques:
+    """
+    Durées des étapes du pipeline d'analyse (extraction, parser, appel au fournisseur...) et
+    tokens consommés, par étape, fournisseur et modèle. Propre au processus, comme SuiviLatences :
+    chaque processus (workers gunicorn ou uvicorn, worker des tâches) publie les siens en base
+    (publier), et /metrics et /metriques servent leur total (metriques_globales).
+    """
+
+    def __init__(self, taille=500):
+        self._etapes = {}
+        self._tokens = {}
+        self._economies = {}
+        self._taille = taille
+        self._lock = threading.Lock()
+
+    def _etape(self, cle):
+        if cle not in self._etapes:
+            self._etapes[cle] = {
+                'nb': 0, 'somme': 0.0, 'erreurs': 0,
+                'seaux': [0] * len(BORNES), 'recentes': deque(maxlen=self._taille)
+            }
+        return self._etapes[cle]
+
+    def observer(self, etape, duree, fournisseur='', modele=''):
+        with self._lock:
+            mesure = self._etape((etape, fournisseur, modele))
+            mesure['nb'] += 1
+            mesure['somme'] += duree
+            mesure['recentes'].append(duree)
+            for i, borne in enumerate(BORNES):
+                if duree <= borne:
+                    mesure['seaux'][i] += 1
+
+    def erreur(self, etape, fournisseur='', modele=''):
+        with self._lock:
+            self._etape((etape, fournisseur, modele))['erreurs'] += 1
+
+    def tokens(self, fournisseur, modele, entree, sortie):
+        """Tokens facturés d'après le champ usage de la réponse du SDK."""
+        with self._lock:
+            for sens, nombre in (('entree', entree), ('sortie', sortie)):
+                if nombre:
+                    cle = (fournisseur, modele, sens)
+                    self._tokens[cle] = self._tokens.get(cle, 0) + nombre
+
+    def economie(self, fournisseur, modele, nombre):
+        """Tokens retirés des prompts par budget_prompt (estimation)."""
+        with self._lock:
+            cle = (fournisseur, modele)
+            self._economies[cle] = self._economies.get(cle, 0) + nombre
+
+    def economies(self):
+        with self._lock:
+            return [dict(fournisseur=f, modele=m, tokens=n) for (f, m), n in sorted(self._economies.items())]
+
+    def resume(self):
+        """Liste des étapes avec nb, erreurs et p50/p95 (secondes) sur les mesures récentes."""
+        with self._lock:
+            return [dict(
+                etape=etape, fournisseur=fournisseur, modele=modele, nb=m['nb'], erreurs=m['erreurs'],
+                p50=percentile(m['recentes'], 50), p95=percentile(m['recentes'], 95),
+                tokens_entree=self._tokens.get((fournisseur, modele, 'entree'), 0) if fournisseur else None,
+                tokens_sortie=self._tokens.get((fournisseur, modele, 'sortie'), 0) if fournisseur else None,
+            ) for (etape, fournisseur, modele), m in sorted(self._etapes.items())]
+
+    def etat(self):
+        """Copie sérialisable en JSON des compteurs (voir fusionner)."""
+        with self._lock:
+            return {
+                'etapes': [[*cle, m['nb'], m['somme'], m['erreurs'], m['seaux'], list(m['recentes'])]
+                           for cle, m in self._etapes.items()],
+                'tokens': [[*cle, n] for cle, n in self._tokens.items()],
+                'economies': [[*cle, n] for cle, n in self._economies.items()],
+            }
+
+    def fusionner(self, etat):
+        """Ajoute les compteurs d'un autre processus (résultat de etat())."""
+        with self._lock:
+            for etape, fournisseur, modele, nb, somme, erreurs, seaux, recentes in etat.get('etapes', []):
+                mesure = self._etape((etape, fournisseur, modele))
+                mesure['nb'] += nb
+                mesure['somme'] += somme
+                mesure['erreurs'] += erreurs
+                mesure['seaux'] = [a + b for a, b in zip(mesure['seaux'], seaux)]
+                mesure['recentes'].extend(recentes)
+            for fournisseur, modele, sens, n in etat.get('tokens', []):
+                self._tokens[(fournisseur, modele, sens)] = self._tokens.get((fournisseur, modele, sens), 0) + n
+            for fournisseur, modele, n in etat.get('economies', []):
+                self._economies[(fournisseur, modele)] = self._economies.get((fournisseur, modele), 0) + n
+
+    def prometheus(self):
+        """Exposition au format texte de Prometheus."""
+        lignes = [
+            "# HELP appreciations_etape_duree_secondes Durée des étapes du pipeline d'analyse.",
+            "# TYPE appreciations_etape_duree_secondes histogram",
+        ]
+        with self._lock:
+            for (etape, fournisseur, modele), m in sorted(self._etapes.items()):
+                labels = _labels(etape=etape, fournisseur=fournisseur, modele=modele)
+                for borne, nb in zip(BORNES, m['seaux']):
+                    lignes.append(f'appreciations_etape_duree_secondes_bucket{{{labels},le="{borne}"}} {nb}')
+                lignes.append(f'appreciations_etape_duree_secondes_bucket{{{labels},le="+Inf"}} {m["nb"]}')
+                lignes.append(f'appreciations_etape_duree_secondes_sum{{{labels}}} {m["somme"]:.6f}')
+                lignes.append(f'appreciations_etape_duree_secondes_count{{{labels}}} {m["nb"]}')
+            lignes += [
+                "# HELP appreciations_etape_erreurs_total Étapes terminées par une exception.",
+                "# TYPE appreciations_etape_erreurs_total counter",
+            ]
+            for (etape, fournisseur, modele), m in sorted(self._etapes.items()):
+                lignes.append(f'appreciations_etape_erreurs_total{{{_labels(etape=etape, fournisseur=fournisseur, modele=modele)}}} {m["erreurs"]}')
+            lignes += [
+                "# HELP appreciations_tokens_total Tokens consommés auprès des fournisseurs d'IA.",
+                "# TYPE appreciations_tokens_total counter",
+            ]
+            for (fournisseur, modele, sens), nombre in sorted(self._tokens.items()):
+                lignes.append(f'appreciations_tokens_total{{{_labels(fournisseur=fournisseur, modele=modele, sens=sens)}}} {nombre}')
+            lignes += [
+                "# HELP appreciations_prompt_tokens_economises_total Tokens retirés des prompts pour tenir dans le budget (estimation).",
+                "# TYPE appreciations_prompt_tokens_economises_total counter",
+            ]
+            for (fournisseur, modele), nombre in sorted(self._economies.items()):
+                lignes.append(f'appreciations_prompt_tokens_economises_total{{{_labels(fournisseur=fournisseur, modele=modele)}}} {nombre}')
+        return "\n".join(lignes) + "\n"
+
+
+def _labels(**valeurs):
+    echapper = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ",".join(f'{nom}="{echapper(valeur)}"' for nom, valeur in valeurs.items())
+
+
+metriques = Metriques()
+
+
+def _processus():
+    # Calculé à chaque appel : un processus forké ne doit pas reprendre l'identité de son parent
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def publier():
+    """Enregistre en base l'état des métriques du processus."""
+    MetriquesProcessus.enregistrer(_processus(), metriques.etat())
+
+
+_publication = {'le': 0.0}
+_publication_lock = threading.Lock()
+
+
+def publier_periodiquement(intervalle):
+    """publier, au plus une fois toutes les intervalle secondes (appelé après chaque requête du serveur web)."""
+    with _publication_lock:
+        maintenant = time.monotonic()
+        if maintenant - _publication['le'] < intervalle:
+            return
+        _publication['le'] = maintenant
+    publier()
+
+
+def purger_publications(duree):
+    """Oublie les métriques publiées par les processus muets depuis plus de duree secondes (le commit reste à l'appelant)."""
+    MetriquesProcessus.query.filter(MetriquesProcessus.maj_le < datetime.utcnow() - timedelta(seconds=duree)).delete()
+
+
+def metriques_globales():
+    """
+    Total des métriques publiées par tous les processus. Celles du processus qui répond sont
+    publiées d'abord : le résultat ne dépend pas du processus qui sert la requête, et les
+    compteurs ne reculent pas d'un appel à l'autre (sauf purge d'un processus arrêté).
+    """
+    publier()
+    total = Metriques(taille=None)
+    for etat in db.session.execute(select(MetriquesProcessus.etat)).scalars():
+        total.fusionner(etat)
+    return total
+
+
+def noter(etape, duree, fournisseur='', modele=''):
+    """Enregistre une durée, et l'ajoute au journal de la requête en cours s'il y en a une."""
+    metriques.observer(etape, duree, fournisseur, modele)
+    if has_request_context():
+        g.setdefault('chronos', []).append((etape, duree))
+
+
+def noter_economie(fournisseur, modele, nombre):
+    """Tokens économisés sur un prompt, ajoutés au journal de la requête en cours s'il y en a une."""
+    metriques.economie(fournisseur, modele, nombre)
+    if has_request_context():
+        g.tokens_economises = g.get('tokens_economises', 0) + nombre
+
+
+@contextmanager
+def chrono(etape, fournisseur='', modele=''):
+    """Mesure la durée du bloc (les exceptions sont comptées comme erreurs de l'étape)."""
+    debut = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        metriques.erreur(etape, fournisseur, modele)
+        raise
+    finally:
+        noter(etape, time.perf_counter() - debut, fournisseur, modele)
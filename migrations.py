@@ -0,0 +1,159 @@
+# migrations.py
+"""
+Évolutions du schéma des bases existantes. db.create_all() crée les tables manquantes
+mais ne modifie jamais une table déjà en place : chaque changement de ce type
+(index, colonne...) est décrit ici par une migration numérotée, jouée une seule fois.
+La version du schéma est conservée dans le compteur 'schema_version'.
+
+    flask db-upgrade
+"""
+import json
+from sqlalchemy import inspect, text
+from models import db, Compteur, Analyse, Eleve, Job, Matiere, ReponseCache, TexteBulletin, compresser_json, noms_eleves, noms_matieres
+
+VERSION_SCHEMA = 'schema_version'
+
+
+def _creer_index(table):
+    """
+    Crée les index déclarés sur le modèle qui n'existent pas encore en base. Ceux qui portent sur
+    une colonne pas encore ajoutée sont laissés à la migration qui l'ajoute.
+    """
+    colonnes = {c['name'] for c in inspect(db.engine).get_columns(table.name)}
+    for index in table.indexes:
+        if all(colonne.name in colonnes for colonne in index.columns):
+            index.create(db.engine, checkfirst=True)
+
+
+def _ajouter_colonne(modele, nom):
+    """Ajoute à la table une colonne déclarée sur le modèle, si elle n'existe pas encore."""
+    table = modele.__table__
+    if nom in {c['name'] for c in inspect(db.engine).get_columns(table.name)}:
+        return
+    type_sql = table.c[nom].type.compile(dialect=db.engine.dialect)
+    with db.engine.begin() as connexion:
+        connexion.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {nom} {type_sql}'))
+
+
+def _index_analyse():
+    _creer_index(Analyse.__table__)
+
+
+def _justifications_html():
+    _ajouter_colonne(Analyse, 'justifications_html')
+
+
+def _textes_bulletins(taille_lot=500):
+    """
+    Sort le texte brut des bulletins de analyse.donnees_brutes vers texte_bulletin (une ligne par
+    texte distinct), compresse le reste dans analyse.donnees puis supprime l'ancienne colonne JSON.
+    """
+    _ajouter_colonne(Analyse, 'donnees')
+    _ajouter_colonne(Analyse, 'texte_id')
+    if 'donnees_brutes' not in {c['name'] for c in inspect(db.engine).get_columns('analyse')}:
+        return
+    while True:
+        lignes = db.session.execute(text(
+            'SELECT id, donnees_brutes FROM analyse WHERE donnees_brutes IS NOT NULL AND donnees IS NULL ORDER BY id LIMIT :n'
+        ), {'n': taille_lot}).all()
+        if not lignes:
+            break
+        for analyse_id, donnees_brutes in lignes:
+            # Selon le pilote, la colonne JSON revient déjà décodée ou sous forme de chaîne
+            donnees = json.loads(donnees_brutes) if isinstance(donnees_brutes, str) else dict(donnees_brutes)
+            texte = donnees.pop('texte_brut', None)
+            db.session.execute(text('UPDATE analyse SET donnees = :donnees, texte_id = :texte_id WHERE id = :id'), {
+                'donnees': compresser_json(donnees),
+                'texte_id': TexteBulletin.enregistrer(texte) if texte else None,
+                'id': analyse_id,
+            })
+        db.session.commit()
+    # La copie est vérifiée avant de supprimer l'ancienne colonne ; en cas d'écart la migration
+    # s'arrête sans rien supprimer et peut être rejouée
+    restantes = db.session.execute(text(
+        'SELECT COUNT(*) FROM analyse WHERE donnees_brutes IS NOT NULL AND donnees IS NULL'
+    )).scalar()
+    sans_texte = db.session.execute(text(
+        'SELECT COUNT(*) FROM analyse a WHERE a.texte_id IS NOT NULL AND NOT EXISTS '
+        '(SELECT 1 FROM texte_bulletin t WHERE t.empreinte = a.texte_id)'
+    )).scalar()
+    if restantes or sans_texte:
+        raise RuntimeError(f"Copie incomplète ({restantes} analyse(s) non copiée(s), {sans_texte} texte(s) manquant(s)) : "
+                           "la colonne analyse.donnees_brutes est conservée.")
+    with db.engine.begin() as connexion:
+        connexion.execute(text('ALTER TABLE analyse DROP COLUMN donnees_brutes'))
+
+
+def _modifie_le():
+    _ajouter_colonne(Analyse, 'modifie_le')
+
+
+def _eleves_matieres():
+    """
+    Remplace les colonnes texte classe.eleves et classe.matieres par les tables eleve et matiere,
+    rattache chaque analyse à son élève (analyse.eleve_id) et indexe l'historique sur cet identifiant.
+    Les élèves qui ont une analyse mais ne figurent plus dans la liste de leur classe sont créés inactifs.
+    """
+    _ajouter_colonne(Analyse, 'eleve_id')
+    colonnes_classe = {c['name'] for c in inspect(db.engine).get_columns('classe')}
+    if {'eleves', 'matieres'} <= colonnes_classe:
+        for classe_id, eleves, matieres in db.session.execute(text('SELECT id, eleves, matieres FROM classe')).all():
+            Eleve.synchroniser(classe_id, noms_eleves(eleves))
+            Matiere.synchroniser(classe_id, noms_matieres(matieres))
+        db.session.execute(text(
+            'INSERT INTO eleve (classe_id, nom, position, actif) '
+            'SELECT DISTINCT a.classe_id, a.nom_eleve, 0, :inactif FROM analyse a WHERE NOT EXISTS '
+            '(SELECT 1 FROM eleve e WHERE e.classe_id = a.classe_id AND e.nom = a.nom_eleve)'
+        ), {'inactif': False})
+        db.session.commit()
+    db.session.execute(text(
+        'UPDATE analyse SET eleve_id = (SELECT e.id FROM eleve e WHERE e.classe_id = analyse.classe_id '
+        'AND e.nom = analyse.nom_eleve) WHERE eleve_id IS NULL'
+    ))
+    db.session.commit()
+    with db.engine.begin() as connexion:
+        for ancien in ('ix_analyse_classe_trimestre_eleve', 'ix_analyse_classe_eleve_trimestre'):
+            connexion.execute(text(f'DROP INDEX IF EXISTS {ancien}'))
+        for colonne in ({'eleves', 'matieres'} & colonnes_classe):
+            connexion.execute(text(f'ALTER TABLE classe DROP COLUMN {colonne}'))
+    _creer_index(Analyse.__table__)
+
+
+def _fournisseur_reponse():
+    _ajouter_colonne(ReponseCache, 'fournisseur')
+
+
+def _signe_de_vie_job():
+    _ajouter_colonne(Job, 'signe_de_vie')
+
+# (version, description, fonction) ; les fonctions doivent pouvoir être rejouées sans effet
+# sur une base neuve, dont les tables ont été créées d'emblée dans leur dernière version.
+MIGRATIONS = [
+    (1, "Index composites de la table analyse", _index_analyse),
+    (2, "Colonne analyse.justifications_html (rendu Markdown mis en cache)", _justifications_html),
+    (3, "Textes des bulletins dédoublonnés dans texte_bulletin, données compressées", _textes_bulletins),
+    (4, "Colonne analyse.modifie_le (clé du cache des PDF)", _modifie_le),
+    (5, "Tables eleve et matiere, analyse.eleve_id et index sur l'élève", _eleves_matieres),
+    (6, "Colonne reponse_cache.fournisseur (fournisseur qui a produit la réponse)", _fournisseur_reponse),
+    (7, "Colonne job.signe_de_vie (tâches longues en cours)", _signe_de_vie_job),
+]
+
+
+def version_courante():
+    if not inspect(db.engine).has_table(Compteur.__tablename__):
+        return 0
+    return Compteur.lire(VERSION_SCHEMA)
+
+
+def mettre_a_jour(journal=print):
+    """Crée les tables manquantes puis joue les migrations pas encore appliquées, dans l'ordre."""
+    depart = version_courante()
+    db.create_all()
+    for version, description, migration in MIGRATIONS:
+        if version <= depart:
+            continue
+        journal(f"Migration {version} : {description}")
+        migration()
+        db.session.merge(Compteur(nom=VERSION_SCHEMA, valeur=version))
+        db.session.commit()
+    return Compteur.lire(VERSION_SCHEMA)
@@ -1,9 +1,16 @@
 # models.py
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, func, ForeignKey
+import hashlib
+import json
+import zlib
+from datetime import datetime, timedelta
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, LargeBinary, func, ForeignKey, case, select, and_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import deferred, column_property
 from flask_login import UserMixin
 from itsdangerous import URLSafeTimedSerializer as Serializer
 from flask import current_app
-from extensions import db, bcrypt # MODIFICATION : on importe depuis extensions.py
+from markupsafe import Markup
+from extensions import db, bcrypt, misaka # MODIFICATION : on importe depuis extensions.py
 
 class User(db.Model, UserMixin):
     id = Column(Integer, primary_key=True)
@@ -31,25 +38,206 @@ class User(db.Model, UserMixin):
         return User.query.get(user_id)
 
 # Le reste du fichier models.py ne change pas...
+def _dialecte():
+    return postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+
+
+class MembreClasse:
+    """
+    Élève ou matière d'une classe, dans l'ordre saisi (position). Une ligne retirée de la liste
+    n'est pas supprimée mais désactivée : les analyses d'un élève parti gardent leur élève.
+    """
+    id = Column(Integer, primary_key=True)
+    nom = Column(String(200), nullable=False)
+    position = Column(Integer, nullable=False, default=0)
+    actif = Column(Boolean, nullable=False, default=True)
+
+    @classmethod
+    def synchroniser(cls, classe_id, noms):
+        """
+        Aligne les lignes de la classe sur la liste de noms, en un upsert groupé :
+        nouveaux noms insérés, noms existants réactivés et repositionnés, autres désactivés.
+        """
+        noms = list(dict.fromkeys(noms))
+        if noms:
+            insertion = _dialecte().insert(cls).values([
+                {'classe_id': classe_id, 'nom': nom, 'position': position, 'actif': True}
+                for position, nom in enumerate(noms)
+            ])
+            db.session.execute(insertion.on_conflict_do_update(
+                index_elements=['classe_id', 'nom'],
+                set_={'position': insertion.excluded.position, 'actif': True}
+            ))
+        db.session.execute(db.update(cls).where(cls.classe_id == classe_id, cls.nom.not_in(noms)).values(actif=False))
+
+
+class Eleve(MembreClasse, db.Model):
+    classe_id = Column(Integer, ForeignKey('classe.id', ondelete='CASCADE'), nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('classe_id', 'nom', name='uq_eleve_classe_nom'),)
+
+
+class Matiere(MembreClasse, db.Model):
+    classe_id = Column(Integer, ForeignKey('classe.id', ondelete='CASCADE'), nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('classe_id', 'nom', name='uq_matiere_classe_nom'),)
+
+
+def noms_eleves(texte):
+    """Liste d'élèves saisie dans le formulaire d'une classe : un nom par ligne."""
+    return [e.strip() for e in (texte or '').split('\n') if e.strip()]
+
+
+def noms_matieres(texte):
+    """Liste de matières saisie dans le formulaire d'une classe : séparées par des virgules."""
+    return [m.strip() for m in (texte or '').split(',') if m.strip()]
+
+
 class Classe(db.Model):
     id = db.Column(Integer, primary_key=True)
     annee_scolaire = db.Column(String(10), nullable=False)
     nom_classe = db.Column(String(50), nullable=False)
-    matieres = db.Column(Text, nullable=False)
-    eleves = db.Column(Text, nullable=False)
     analyses = db.relationship('Analyse', backref='classe', lazy=True, cascade="all, delete-orphan")
+    # Élèves et matières actuels, dans l'ordre de saisie
+    eleves = db.relationship(
+        'Eleve', order_by='Eleve.position', viewonly=True,
+        primaryjoin='and_(Eleve.classe_id == Classe.id, Eleve.actif == True)')
+    matieres = db.relationship(
+        'Matiere', order_by='Matiere.position', viewonly=True,
+        primaryjoin='and_(Matiere.classe_id == Classe.id, Matiere.actif == True)')
+    tous_eleves = db.relationship('Eleve', cascade="all, delete-orphan")
+    toutes_matieres = db.relationship('Matiere', cascade="all, delete-orphan")
+    # Calculé dans la requête qui charge la classe (sous-requête corrélée), sans charger les élèves
+    nb_eleves = column_property(
+        select(func.count(Eleve.id)).where(and_(Eleve.classe_id == id, Eleve.actif == True)).scalar_subquery(),
+        deferred=False)
+
+    @property
+    def noms_eleves(self):
+        return [eleve.nom for eleve in self.eleves]
+
+    @property
+    def noms_matieres(self):
+        return [matiere.nom for matiere in self.matieres]
+
+    def definir_eleves(self, noms):
+        Eleve.synchroniser(self.id, noms)
+        db.session.expire(self, ['eleves', 'nb_eleves'])
+
+    def definir_matieres(self, noms):
+        Matiere.synchroniser(self.id, noms)
+        db.session.expire(self, ['matieres'])
+
+    def ids_eleves(self):
+        """{nom: id} de tous les élèves de la classe, anciens compris, en une requête."""
+        return dict(db.session.query(Eleve.nom, Eleve.id).filter(Eleve.classe_id == self.id))
+
+    @staticmethod
+    def statistiques():
+        """
+        Statistiques des analyses de chaque classe, en une seule requête groupée (sans charger les analyses) :
+        {classe_id: {'analyses': n, 'derniere': datetime, 'eleves_par_trimestre': {1: n, 2: n, 3: n}}}.
+        Les classes sans analyse sont absentes du résultat.
+        """
+        colonnes = [
+            Analyse.classe_id, func.count(Analyse.id), func.max(Analyse.created_at),
+            *[func.count(func.distinct(case((Analyse.trimestre == t, Analyse.eleve_id)))) for t in (1, 2, 3)]
+        ]
+        return {
+            classe_id: {'analyses': nb, 'derniere': derniere, 'eleves_par_trimestre': dict(zip((1, 2, 3), par_trimestre))}
+            for classe_id, nb, derniere, *par_trimestre in db.session.query(*colonnes).group_by(Analyse.classe_id)
+        }
 
 class Analyse(db.Model):
     id = Column(Integer, primary_key=True)
-    nom_eleve = Column(String(200), nullable=False)
+    nom_eleve = Column(String(200), nullable=False)  # nom au moment de l'analyse, pour l'affichage
+    eleve_id = Column(Integer, ForeignKey('eleve.id'))
+    eleve = db.relationship('Eleve')
     trimestre = Column(Integer, nullable=False)
     appreciation_principale = Column(Text)
     justifications = Column(Text)
-    donnees_brutes = Column(db.JSON)
+    justifications_html = Column(Text)  # rendu Markdown des justifications, calculé au premier affichage
+    # Données du parser sans le texte du bulletin, en JSON compact compressé (voir donnees_brutes)
+    donnees = deferred(Column(LargeBinary))
+    texte_id = Column(String(64), ForeignKey('texte_bulletin.empreinte'))
+    texte_bulletin = db.relationship('TexteBulletin')
     classe_id = Column(Integer, ForeignKey('classe.id'), nullable=False)
     prompt_name = Column(String(100))
     provider_name = Column(String(50))
     created_at = Column(DateTime, server_default=func.now())
+    modifie_le = Column(DateTime)  # dernière modification manuelle de l'appréciation
+
+    __table_args__ = (
+        # Sert la recherche de la dernière analyse de chaque élève d'une classe (requetes.dernieres_analyses)
+        db.Index('ix_analyse_classe_trimestre_eleve_id', 'classe_id', 'trimestre', 'eleve_id', 'created_at'),
+        # Sert l'historique d'un élève et le rappel des trimestres précédents (appreciations_precedentes)
+        db.Index('ix_analyse_eleve_trimestre', 'eleve_id', 'trimestre', 'created_at'),
+    )
+
+    @property
+    def donnees_brutes(self):
+        """Structure du parser avec son texte_brut, recomposée depuis donnees et TexteBulletin."""
+        if self.donnees is None:
+            return None
+        donnees = decompresser_json(self.donnees)
+        if self.texte_bulletin:
+            donnees['texte_brut'] = self.texte_bulletin.texte
+        return donnees
+
+    @donnees_brutes.setter
+    def donnees_brutes(self, valeur):
+        valeur = dict(valeur or {})
+        texte = valeur.pop('texte_brut', None)
+        self.texte_id = TexteBulletin.enregistrer(texte) if texte else None
+        self.donnees = compresser_json(valeur)
+
+    def justifications_rendues(self):
+        """HTML des justifications, rendu une seule fois puis conservé (à remettre à None si elles changent)."""
+        if self.justifications_html is None and self.justifications:
+            self.justifications_html = str(misaka.render(self.justifications))
+        return Markup(self.justifications_html or '')
+
+def compresser_json(valeur):
+    return zlib.compress(json.dumps(valeur, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+def decompresser_json(octets):
+    return json.loads(zlib.decompress(octets).decode('utf-8'))
+
+
+class TexteBulletin(db.Model):
+    """Texte brut d'un bulletin, compressé et stocké une seule fois quel que soit le nombre d'analyses qui le citent."""
+    empreinte = Column(String(64), primary_key=True)
+    contenu = Column(LargeBinary, nullable=False)
+    taille = Column(Integer, nullable=False)  # octets avant compression
+    created_at = Column(DateTime, server_default=func.now())
+
+    @property
+    def texte(self):
+        return zlib.decompress(self.contenu).decode('utf-8')
+
+    @staticmethod
+    def enregistrer(texte):
+        """Stocke le texte s'il est nouveau et retourne son empreinte (sans conflit entre workers concurrents)."""
+        octets = texte.encode('utf-8')
+        empreinte = hashlib.sha256(octets).hexdigest()
+        db.session.execute(_dialecte().insert(TexteBulletin).values(
+            empreinte=empreinte, contenu=zlib.compress(octets), taille=len(octets)
+        ).on_conflict_do_nothing(index_elements=['empreinte']))
+        return empreinte
+
+    @staticmethod
+    def purger_orphelins(marge=3600):
+        """
+        Supprime les textes qu'aucune analyse ne cite plus (analyses ou classes supprimées) et
+        retourne leur nombre. Les textes de moins de `marge` secondes sont gardés : leur analyse
+        peut être en cours d'enregistrement. Le commit reste à la charge de l'appelant.
+        """
+        limite = datetime.utcnow() - timedelta(seconds=marge)
+        return TexteBulletin.query.filter(
+            TexteBulletin.created_at < limite,
+            ~select(Analyse.id).where(Analyse.texte_id == TexteBulletin.empreinte).exists()
+        ).delete(synchronize_session=False)
 
 class Prompt(db.Model):
     id = Column(Integer, primary_key=True)
@@ -64,4 +252,84 @@ class AIProvider(db.Model):
     name = Column(String(50), unique=True, nullable=False)
     api_key = Column(String(200), nullable=False)
     model_name = Column(String(100), nullable=False)
-    is_active = Column(Boolean, default=False, nullable=False)
\ No newline at end of file
+    is_active = Column(Boolean, default=False, nullable=False)
+    limite = db.relationship('LimiteFournisseur', uselist=False, backref='provider', cascade="all, delete-orphan")
+
+class LimiteFournisseur(db.Model):
+    """Budgets d'un fournisseur d'IA : requêtes et tokens par minute (vide = pas de limite)."""
+    provider_id = Column(Integer, ForeignKey('ai_provider.id'), primary_key=True)
+    rpm = Column(Integer)
+    tpm = Column(Integer)
+
+class Compteur(db.Model):
+    """Compteur nommé partagé entre tous les workers (statistiques, numéros de version...)."""
+    nom = Column(String(50), primary_key=True)
+    valeur = Column(Integer, default=0, nullable=False)
+
+    @staticmethod
+    def incrementer(nom, pas=1):
+        """
+        Incrémente le compteur de façon atomique, en le créant au premier appel (le commit reste
+        à la charge de l'appelant). Un seul INSERT ... ON CONFLICT : deux workers qui créent le même
+        compteur en même temps ne se gênent pas.
+        """
+        db.session.execute(_dialecte().insert(Compteur).values(nom=nom, valeur=pas).on_conflict_do_update(
+            index_elements=['nom'], set_={'valeur': Compteur.valeur + pas}
+        ))
+
+    @staticmethod
+    def lire(nom):
+        compteur = db.session.get(Compteur, nom)
+        return compteur.valeur if compteur else 0
+
+class MetriquesProcessus(db.Model):
+    """Dernier état des métriques de chaque processus (serveurs web, worker), additionnés par /metrics et /metriques."""
+    processus = Column(String(100), primary_key=True)  # hôte:pid
+    etat = Column(db.JSON, nullable=False)
+    maj_le = Column(DateTime, nullable=False, index=True)
+
+    @staticmethod
+    def enregistrer(processus, etat):
+        """
+        Remplace l'état publié par le processus, dans une transaction à part : appelé après une
+        requête, il ne valide pas ce que la session de la requête aurait laissé en cours.
+        """
+        requete = _dialecte().insert(MetriquesProcessus).values(processus=processus, etat=etat, maj_le=datetime.utcnow())
+        with db.engine.begin() as connexion:
+            connexion.execute(requete.on_conflict_do_update(
+                index_elements=['processus'], set_={'etat': requete.excluded.etat, 'maj_le': requete.excluded.maj_le}
+            ))
+
+class ReponseCache(db.Model):
+    """Réponse d'un fournisseur d'IA, indexée par l'empreinte SHA-256 du prompt complet."""
+    cle = Column(String(64), primary_key=True)
+    reponse = Column(Text, nullable=False)
+    fournisseur = Column(String(100))  # fournisseur qui l'a produite (gagnant d'une course, fournisseur de secours...)
+    hits = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+    dernier_acces = Column(DateTime, server_default=func.now(), index=True)
+
+class BulletinCache(db.Model):
+    """Texte extrait d'un bulletin PDF et ses analyses par le parser, indexés par l'empreinte SHA-256 du fichier."""
+    empreinte = Column(String(64), primary_key=True)
+    texte = Column(Text, nullable=False)
+    analyses = Column(db.JSON)  # {clé (élève, matières): donnees_structurees sans texte_brut}
+    taille = Column(Integer, default=0, nullable=False)
+    hits = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+    dernier_acces = Column(DateTime, server_default=func.now(), index=True)
+
+class Job(db.Model):
+    """Tâche de fond (génération IA...) exécutée par le worker `flask run-worker`."""
+    id = Column(Integer, primary_key=True)
+    type = Column(String(30), nullable=False)
+    statut = Column(String(20), default='en_attente', nullable=False, index=True)
+    payload = Column(db.JSON)
+    progression = Column(Integer, default=0, nullable=False)
+    erreur = Column(Text)
+    tentatives = Column(Integer, default=0, nullable=False)
+    analyse_id = Column(Integer, ForeignKey('analyse.id', ondelete='SET NULL'))
+    created_at = Column(DateTime, server_default=func.now())
+    started_at = Column(DateTime)
+    signe_de_vie = Column(DateTime)  # dernière progression enregistrée : une tâche longue n'est pas relancée
+    finished_at = Column(DateTime)
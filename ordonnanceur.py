@@ -0,0 +1,365 @@
+# ordonnanceur.py
+import asyncio
+import random
+import re
+import threading
+import time
+from collections import deque
+import httpx
+from flask import current_app
+from models import AIProvider
+from providers import (acomplete_ai_response, astream_ai_response, clients, contient_separateur, executer_async,
+                       get_ai_response, provider_pour, stream_ai_response)
+
+# Codes HTTP pour lesquels un nouvel essai a des chances de réussir
+CODES_A_REESSAYER = {408, 409, 429, 500, 502, 503, 504}
+
+
+class Ordonnanceur:
+    """
+    Fait respecter les budgets de requêtes et de tokens par minute de chaque fournisseur
+    (LimiteFournisseur). Les appels qui dépasseraient le budget attendent qu'une place se
+    libère dans la fenêtre glissante de 60 secondes. Le suivi est propre au processus.
+    """
+
+    FENETRE = 60.0
+
+    def __init__(self):
+        self._appels = {}
+        self._condition = threading.Condition()
+
+    def _purger(self, appels, maintenant):
+        while appels and appels[0][0] <= maintenant - self.FENETRE:
+            appels.popleft()
+
+    def _reserver(self, provider_id, tokens, rpm, tpm, limite_attente):
+        """
+        Enregistre l'appel s'il tient dans les budgets et retourne None ; sinon retourne
+        le délai avant qu'une place se libère. À appeler sous self._condition.
+        """
+        appels = self._appels.setdefault(provider_id, deque())
+        maintenant = time.monotonic()
+        self._purger(appels, maintenant)
+        ok_rpm = not rpm or len(appels) < rpm
+        # Un appel plus gros que tout le budget passe seul plutôt que de bloquer indéfiniment
+        ok_tpm = not tpm or not appels or sum(t for _, t in appels) + tokens <= tpm
+        if ok_rpm and ok_tpm:
+            appels.append((maintenant, tokens))
+            return None
+        if maintenant >= limite_attente:
+            raise TimeoutError("Budget du fournisseur d'IA dépassé, réessayez dans quelques instants.")
+        return max(0.05, min(appels[0][0] + self.FENETRE - maintenant, limite_attente - maintenant))
+
+    def attendre(self, provider_id, tokens, rpm=None, tpm=None, attente_max=300):
+        """Bloque jusqu'à ce que l'appel tienne dans les budgets, puis l'enregistre."""
+        limite_attente = time.monotonic() + attente_max
+        with self._condition:
+            while True:
+                delai = self._reserver(provider_id, tokens, rpm, tpm, limite_attente)
+                if delai is None:
+                    return
+                self._condition.wait(timeout=delai)
+
+    async def aattendre(self, provider_id, tokens, rpm=None, tpm=None, attente_max=300):
+        """Comme attendre, mais l'attente libère la boucle asyncio (serveur ASGI)."""
+        limite_attente = time.monotonic() + attente_max
+        while True:
+            with self._condition:
+                delai = self._reserver(provider_id, tokens, rpm, tpm, limite_attente)
+            if delai is None:
+                return
+            await asyncio.sleep(delai)
+
+    def usage(self):
+        """{provider_id: {'requetes': n, 'tokens': n}} sur la dernière minute."""
+        with self._condition:
+            maintenant = time.monotonic()
+            resultat = {}
+            for provider_id, appels in self._appels.items():
+                self._purger(appels, maintenant)
+                resultat[provider_id] = {'requetes': len(appels), 'tokens': sum(t for _, t in appels)}
+            return resultat
+
+
+ordonnanceur = Ordonnanceur()
+
+
+def estimer_tokens(*textes):
+    """Estimation grossière du nombre de tokens (environ 4 caractères par token)."""
+    return sum(len(t) for t in textes) // 4 + 1
+
+
+# Fenêtre de contexte (tokens) des modèles courants, par préfixe du nom du modèle ;
+# PACK_CONTEXTE_TOKENS pour les autres
+FENETRES_CONTEXTE = {
+    'mistral-large': 128000, 'mistral-medium': 128000, 'mistral-small': 32000, 'open-mistral-nemo': 128000,
+    'gpt-4o': 128000, 'gpt-4.1': 1000000, 'gpt-3.5': 16000,
+    'llama-3.1': 128000, 'llama-3.3': 128000, 'llama3': 8192, 'mixtral-8x7b': 32768, 'gemma': 8192,
+}
+
+
+def fenetre_contexte(model_name):
+    """Nombre de tokens (prompt et réponse) que le modèle accepte en un appel."""
+    nom = (model_name or '').lower()
+    for prefixe, fenetre in FENETRES_CONTEXTE.items():
+        if nom.startswith(prefixe):
+            return fenetre
+    return current_app.config['PACK_CONTEXTE_TOKENS']
+
+
+def code_http(erreur):
+    """Code HTTP d'une erreur de SDK (openai/groq : status_code, mistralai : http_status ou message)."""
+    code = getattr(erreur, 'status_code', None) or getattr(erreur, 'http_status', None)
+    if code is None:
+        match = re.search(r'Status: (\d{3})', str(erreur))
+        code = int(match.group(1)) if match else None
+    return code
+
+
+def est_reessayable(erreur):
+    """Vrai pour les limites de débit, erreurs serveur, délais dépassés et coupures réseau."""
+    if isinstance(erreur, (httpx.TransportError, TimeoutError, ConnectionError)):
+        return True
+    if type(erreur).__name__ in ('APIConnectionError', 'APITimeoutError', 'MistralConnectionException'):
+        return True
+    return code_http(erreur) in CODES_A_REESSAYER
+
+
+def delai_reprise(erreur, tentative, config=None):
+    """
+    Backoff exponentiel avec gigue ; respecte l'en-tête Retry-After s'il est fourni.
+    config : configuration de l'application, à passer hors contexte Flask (boucle asyncio).
+    """
+    config = config or current_app.config
+    reponse = getattr(erreur, 'response', None)
+    retry_after = getattr(reponse, 'headers', {}).get('retry-after') if reponse is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), config['PROVIDER_BACKOFF_MAX'])
+        except ValueError:
+            pass
+    plafond = min(config['PROVIDER_BACKOFF_MAX'], config['PROVIDER_BACKOFF_BASE'] * 2 ** tentative)
+    return random.uniform(0, plafond)
+
+
+def budget_appel(provider, system_prompt, user_prompt, tokens_reponse=None):
+    """
+    Arguments de ordonnanceur.attendre pour un appel à ce fournisseur.
+    tokens_reponse : tokens réservés pour la réponse (PROVIDER_TOKENS_REPONSE par défaut).
+    """
+    limite = provider.limite
+    return dict(
+        provider_id=provider.id,
+        tokens=estimer_tokens(system_prompt, user_prompt) + (tokens_reponse or current_app.config['PROVIDER_TOKENS_REPONSE']),
+        rpm=limite.rpm if limite else None, tpm=limite.tpm if limite else None,
+    )
+
+
+def appeler(provider, system_prompt, user_prompt, tokens_reponse=None):
+    """Appelle un fournisseur en respectant ses budgets, avec reprises sur les erreurs transitoires."""
+    budget = budget_appel(provider, system_prompt, user_prompt, tokens_reponse)
+    tentatives = current_app.config['PROVIDER_MAX_TENTATIVES']
+    for tentative in range(tentatives):
+        ordonnanceur.attendre(**budget)
+        try:
+            return get_ai_response(provider, system_prompt, user_prompt)
+        except Exception as e:
+            if not est_reessayable(e) or tentative == tentatives - 1:
+                raise
+            delai = delai_reprise(e, tentative)
+            current_app.logger.warning(f"{provider.name} : {e} ; nouvel essai dans {delai:.1f} s")
+            time.sleep(delai)
+
+
+def candidats(provider):
+    """Le fournisseur, suivi des autres fournisseurs configurés si PROVIDER_BASCULE est actif (ordre de bascule)."""
+    if not current_app.config['PROVIDER_BASCULE']:
+        return [provider]
+    return [provider, *AIProvider.query.filter(AIProvider.id != provider.id).order_by(AIProvider.name).all()]
+
+
+def _avec_bascule(provider, appel):
+    """
+    appel(provider), puis si ses reprises échouent et que PROVIDER_BASCULE est actif,
+    appel(secours) pour chacun des autres fournisseurs. Retourne (nom du fournisseur, résultat).
+    """
+    try:
+        return provider.name, appel(provider)
+    except Exception as e:
+        if not current_app.config['PROVIDER_BASCULE'] or not est_reessayable(e):
+            raise
+        erreur = e
+    for secours in candidats(provider)[1:]:
+        try:
+            current_app.logger.warning(f"{provider.name} indisponible, bascule vers {secours.name}")
+            return secours.name, appel(secours)
+        except Exception as e:
+            erreur = e
+    raise erreur
+
+
+def get_ai_response_ordonnance(provider, system_prompt, user_prompt, tokens_reponse=None):
+    """
+    Appelle le fournisseur via l'ordonnanceur. Si ses reprises échouent et que
+    PROVIDER_BASCULE est actif, les autres fournisseurs configurés sont essayés à leur tour.
+    Retourne (nom du fournisseur qui a répondu, réponse).
+    """
+    return _avec_bascule(provider, lambda p: appeler(p, system_prompt, user_prompt, tokens_reponse))
+
+
+def _suite_flux(premier, fragments):
+    """Le premier fragment déjà reçu puis le reste du flux, fermé même si l'appelant s'arrête avant la fin."""
+    try:
+        if premier is not None:
+            yield premier
+        yield from fragments
+    finally:
+        # Sans fermeture explicite, le flux du SDK serait refermé par le ramasse-miettes, à un moment
+        # où le pool HTTP peut être verrouillé par le même thread
+        fragments.close()
+
+
+def _ouvrir_flux(provider, system_prompt, user_prompt):
+    """Flux du fournisseur dont le premier fragment est reçu, avec les reprises de appeler."""
+    budget = budget_appel(provider, system_prompt, user_prompt)
+    tentatives = current_app.config['PROVIDER_MAX_TENTATIVES']
+    for tentative in range(tentatives):
+        ordonnanceur.attendre(**budget)
+        fragments = stream_ai_response(provider, system_prompt, user_prompt)
+        try:
+            premier = next(fragments, None)
+        except Exception as e:
+            if not est_reessayable(e) or tentative == tentatives - 1:
+                raise
+            delai = delai_reprise(e, tentative)
+            current_app.logger.warning(f"{provider.name} : {e} ; nouvel essai dans {delai:.1f} s")
+            time.sleep(delai)
+            continue
+        return _suite_flux(premier, fragments)
+
+
+def ouvrir_flux(provider, system_prompt, user_prompt):
+    """
+    Ouvre le flux de la réponse comme get_ai_response_ordonnance : budgets, reprises et bascule
+    s'appliquent tant qu'aucun fragment n'est reçu (une erreur en cours de flux n'est pas rejouée,
+    le début de la réponse ayant déjà été relayé). Retourne (nom du fournisseur, fragments).
+    """
+    return _avec_bascule(provider, lambda p: _ouvrir_flux(p, system_prompt, user_prompt))
+
+
+def config_reprises():
+    """Réglages des reprises, copiés pour la boucle des fournisseurs qui tourne hors du contexte de l'application."""
+    return {cle: current_app.config[cle] for cle in ('PROVIDER_MAX_TENTATIVES', 'PROVIDER_BACKOFF_BASE', 'PROVIDER_BACKOFF_MAX')}
+
+
+def preparer_participants(providers, system_prompt, user_prompt, tokens_reponse=None):
+    """(impl, client asynchrone, budget) de chaque fournisseur, préparés dans le contexte de l'application."""
+    resultat = []
+    for provider in providers:
+        impl = provider_pour(provider)
+        resultat.append((impl, clients.obtenir(impl, asynchrone=True), budget_appel(provider, system_prompt, user_prompt, tokens_reponse)))
+    return resultat
+
+
+async def _asuite_flux(premier, fragments):
+    try:
+        if premier is not None:
+            yield premier
+        async for fragment in fragments:
+            yield fragment
+    finally:
+        await fragments.aclose()
+
+
+async def _aouvrir_flux(participant, system_prompt, user_prompt, config, journal):
+    impl, client, budget = participant
+    tentatives = config['PROVIDER_MAX_TENTATIVES']
+    for tentative in range(tentatives):
+        await ordonnanceur.aattendre(**budget)
+        fragments = astream_ai_response(impl, client, system_prompt, user_prompt)
+        try:
+            premier = await anext(fragments, None)
+        except Exception as e:
+            if not est_reessayable(e) or tentative == tentatives - 1:
+                raise
+            delai = delai_reprise(e, tentative, config)
+            journal.warning(f"{impl.nom} : {e} ; nouvel essai dans {delai:.1f} s")
+            await asyncio.sleep(delai)
+            continue
+
+        return _asuite_flux(premier, fragments)
+
+
+async def aouvrir_flux(ordre, system_prompt, user_prompt, config, journal):
+    """
+    Équivalent asynchrone de ouvrir_flux (serveur ASGI). ordre : participants (preparer_participants)
+    dans l'ordre de bascule (candidats), le fournisseur de la tâche en premier.
+    Retourne (nom du fournisseur, fragments).
+    """
+    erreur = None
+    for rang, participant in enumerate(ordre):
+        if rang:
+            journal.warning(f"{ordre[0][0].nom} indisponible, bascule vers {participant[0].nom}")
+        try:
+            return participant[0].nom, await _aouvrir_flux(participant, system_prompt, user_prompt, config, journal)
+        except Exception as e:
+            if not rang and not est_reessayable(e):
+                raise
+            erreur = e
+    raise erreur
+
+
+async def _aappeler(participant, system_prompt, user_prompt, config, journal):
+    """Équivalent asynchrone de appeler, pour un participant (impl, client, budget) d'une course."""
+    impl, client, budget = participant
+    tentatives = config['PROVIDER_MAX_TENTATIVES']
+    for tentative in range(tentatives):
+        await ordonnanceur.aattendre(**budget)
+        try:
+            return await acomplete_ai_response(impl, client, system_prompt, user_prompt)
+        except Exception as e:
+            if not est_reessayable(e) or tentative == tentatives - 1:
+                raise
+            delai = delai_reprise(e, tentative, config)
+            journal.warning(f"{impl.nom} : {e} ; nouvel essai dans {delai:.1f} s")
+            await asyncio.sleep(delai)
+
+
+async def _course(participants, system_prompt, user_prompt, valider, config, journal):
+    taches = {
+        asyncio.ensure_future(_aappeler(participant, system_prompt, user_prompt, config, journal)): participant[0]
+        for participant in participants
+    }
+    erreurs = []
+    try:
+        while taches:
+            terminees, _ = await asyncio.wait(taches, return_when=asyncio.FIRST_COMPLETED)
+            for tache in terminees:
+                impl = taches.pop(tache)
+                try:
+                    reponse = tache.result()
+                except Exception as e:
+                    erreurs.append(f"{impl.nom} : {e}")
+                    continue
+                if valider(reponse):
+                    return impl, reponse
+                erreurs.append(f"{impl.nom} : réponse invalide")
+    finally:
+        for tache in taches:
+            tache.cancel()
+    raise ValueError("Aucun fournisseur n'a donné de réponse valide. " + " | ".join(erreurs))
+
+
+def get_ai_response_course(providers, system_prompt, user_prompt, valider=contient_separateur, tokens_reponse=None):
+    """
+    Envoie le même prompt à plusieurs fournisseurs en parallèle. La première réponse
+    valide (valider(reponse) vrai : par défaut, elle contient le séparateur) l'emporte,
+    les autres appels sont annulés. Chaque participant passe par l'ordonnanceur : budgets
+    du fournisseur et reprises sur les erreurs transitoires, comme appeler.
+    Retourne (nom du fournisseur gagnant, réponse).
+    """
+    gagnant, reponse = executer_async(_course(
+        preparer_participants(providers, system_prompt, user_prompt, tokens_reponse), system_prompt, user_prompt,
+        valider, config_reprises(), current_app.logger
+    ))
+    return gagnant.nom, reponse
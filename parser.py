@@ -1,61 +1,135 @@
 import re
+import threading
 import unicodedata
 
-def analyser_texte_bulletin(texte, nom_eleve_attendu, matieres_attendues):
+# Motifs communs à toutes les classes, compilés une seule fois
+RE_MOYENNE_GENERALE = re.compile(r'Moyenne générale\s+([\d,\.]+)')
+RE_APPRECIATION_GLOBALE = re.compile(r'Appréciation globale\s*:\s*(.+?)\nMentions', re.DOTALL)
+RE_TABLEAU = re.compile(r'Appréciations\n(.+?)\nMoyenne générale', re.DOTALL)
+RE_PROFESSEUR = re.compile(r'(M\.|Mme)\s+((?:[A-ZÀ-ÿ-]+\s?)+)')
+RE_MOYENNE = re.compile(r'(\d{1,2}[,.]\d{2})')
+RE_PREFIXE_NOTES = re.compile(r'^\s*[\d\s,./]*')
+RE_NOTES = re.compile(r'\s*\d*/\d+\s*[\d,\s.]*')
+RE_FRACTION_INITIALE = re.compile(r'^\s*\d*/\d+\s*')
+
+
+def motif_trie(mots):
+    """
+    Alternance regex factorisée en arbre de préfixes : « MATHS|MUSIQUE » devient « M(?:ATHS|USIQUE) ».
+    Le moteur n'essaie plus chaque matière à chaque position, seulement les branches qui correspondent.
+    Le résultat est celui de l'alternance « A|B|... » dans l'ordre de la liste : quand une matière est
+    le préfixe d'une autre (ANGLAIS, ANGLAIS LV1), la première de la liste l'emporte, pas la plus longue.
+    """
+    def motif(suffixes):
+        # suffixes : (reste du mot, rang dans la liste). Un mot qui se termine ici l'emporte sur ceux,
+        # plus loin dans la liste, qui le prolongent : ils ne peuvent plus correspondre et sont écartés
+        rang_fin = min((rang for reste, rang in suffixes if not reste), default=None)
+        suite = {}
+        for reste, rang in suffixes:
+            if reste and (rang_fin is None or rang < rang_fin):
+                suite.setdefault(reste[0], []).append((reste[1:], rang))
+        branches = [re.escape(c) + motif(suite[c]) for c in sorted(suite)]
+        if not branches:
+            return ''
+        # Un mot se termine ici mais d'autres, plus haut dans la liste, le prolongent : la suite devient optionnelle
+        if rang_fin is not None:
+            return '(?:' + '|'.join(branches) + ')?'
+        return branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+
+    return motif([(mot, rang) for rang, mot in enumerate(mots)])
+
+
+class ParserBulletin:
     """
-    Analyse le texte brut en se basant sur une liste de matières fournie.
-    CETTE VERSION NE VÉRIFIE PAS LE NOM, ELLE FAIT CONFIANCE À L'ORDRE DONNÉ.
+    Parser des bulletins d'une classe : le motif des matières, identique pour tous les élèves,
+    est compilé une seule fois. Obtenir l'instance d'une classe via parser_pour().
     """
-    donnees = {
-        # On assigne directement le nom de l'élève, sans vérification.
-        "nom_eleve": nom_eleve_attendu,
-        "moyenne_generale": None,
-        "appreciations_matieres": [],
-        "appreciation_globale": None,
-        "texte_brut": texte
-    }
-    
-    # --- Extraction des autres métadonnées (ne change pas) ---
-    match_moy_gen = re.search(r'Moyenne générale\s+([\d,\.]+)', texte)
-    if match_moy_gen:
-        donnees["moyenne_generale"] = match_moy_gen.group(1).replace(',', '.')
-
-    match_app_glob = re.search(r'Appréciation globale\s*:\s*(.+?)\nMentions', texte, re.DOTALL)
-    if match_app_glob:
-        donnees["appreciation_globale"] = " ".join(match_app_glob.group(1).replace('\n', ' ').split())
-
-    # --- Extraction des matières (ne change pas) ---
-    try:
-        match_tableau = re.search(r'Appréciations\n(.+?)\nMoyenne générale', texte, re.DOTALL)
-        if not match_tableau:
-            return donnees
-
-        tableau_texte = match_tableau.group(1)
-        matieres_pattern = "|".join(re.escape(m) for m in matieres_attendues)
-        blocs_contenu = re.split(matieres_pattern, tableau_texte)[1:]
-
-        for i, nom_matiere in enumerate(matieres_attendues):
-            if i < len(blocs_contenu):
-                contenu = blocs_contenu[i]
-                commentaire_brut = re.sub(r'(M\.|Mme)\s+((?:[A-ZÀ-ÿ-]+\s?)+)', '', contenu).strip()
-                
+
+    def __init__(self, matieres_attendues):
+        self.matieres = list(matieres_attendues)
+        self.re_matieres = re.compile(motif_trie(self.matieres)) if self.matieres else None
+
+    def analyser(self, texte, nom_eleve_attendu):
+        """
+        Analyse le texte brut en se basant sur la liste de matières de la classe.
+        CETTE VERSION NE VÉRIFIE PAS LE NOM, ELLE FAIT CONFIANCE À L'ORDRE DONNÉ.
+        """
+        donnees = {
+            # On assigne directement le nom de l'élève, sans vérification.
+            "nom_eleve": nom_eleve_attendu,
+            "moyenne_generale": None,
+            "appreciations_matieres": [],
+            "appreciation_globale": None,
+            "texte_brut": texte
+        }
+
+        match_moy_gen = RE_MOYENNE_GENERALE.search(texte)
+        if match_moy_gen:
+            donnees["moyenne_generale"] = match_moy_gen.group(1).replace(',', '.')
+
+        match_app_glob = RE_APPRECIATION_GLOBALE.search(texte)
+        if match_app_glob:
+            donnees["appreciation_globale"] = " ".join(match_app_glob.group(1).replace('\n', ' ').split())
+
+        try:
+            match_tableau = RE_TABLEAU.search(texte)
+            if not match_tableau or not self.re_matieres:
+                return donnees
+
+            blocs_contenu = self.re_matieres.split(match_tableau.group(1))[1:]
+
+            for nom_matiere, contenu in zip(self.matieres, blocs_contenu):
+                commentaire_brut = RE_PROFESSEUR.sub('', contenu).strip()
+
                 moyenne, commentaire_final = "N/A", ""
                 if "N.Not" in commentaire_brut or "non évalué" in commentaire_brut:
                     moyenne, commentaire_final = "N.Not", "non évalué ce trimestre"
-                elif re.search(r'\d{1,2}[,.]\d{2}', commentaire_brut):
-                    match_moyenne = re.search(r'(\d{1,2}[,.]\d{2})', commentaire_brut)
-                    moyenne = match_moyenne.group(1).replace(',', '.')
-                    reste = commentaire_brut[match_moyenne.end():]
-                    nettoye = re.sub(r'^\s*[\d\s,./]*', '', reste.strip())
-                    commentaire_final = " ".join(re.sub(r'\s*\d*/\d+\s*[\d,\s.]*', ' ', nettoye).strip().split())
                 else:
-                    moyenne = "N/A"
-                    commentaire_final = " ".join(re.sub(r'^\s*\d*/\d+\s*', '', commentaire_brut).strip().split())
+                    match_moyenne = RE_MOYENNE.search(commentaire_brut)
+                    if match_moyenne:
+                        moyenne = match_moyenne.group(1).replace(',', '.')
+                        reste = commentaire_brut[match_moyenne.end():]
+                        nettoye = RE_PREFIXE_NOTES.sub('', reste.strip())
+                        commentaire_final = " ".join(RE_NOTES.sub(' ', nettoye).strip().split())
+                    else:
+                        commentaire_final = " ".join(RE_FRACTION_INITIALE.sub('', commentaire_brut).strip().split())
 
                 donnees["appreciations_matieres"].append({
                     "matiere": nom_matiere, "moyenne": moyenne, "commentaire": commentaire_final
                 })
-    except Exception as e:
-        print(f"Erreur de parsing des matières pour l'élève attendu '{nom_eleve_attendu}': {e}")
-    
-    return donnees
\ No newline at end of file
+        except Exception as e:
+            print(f"Erreur de parsing des matières pour l'élève attendu '{nom_eleve_attendu}': {e}")
+
+        return donnees
+
+    def analyser_lot(self, bulletins):
+        """Analyse une liste de (nom_eleve, texte) et retourne les données structurées dans le même ordre."""
+        return [self.analyser(texte, nom_eleve) for nom_eleve, texte in bulletins]
+
+
+_parsers = {}
+_parsers_lock = threading.Lock()
+
+
+def parser_pour(classe_id, matieres_attendues):
+    """
+    Parser de la classe, construit au premier appel puis réutilisé.
+    Il est reconstruit si la liste des matières a changé (modification faite dans un autre worker).
+    """
+    matieres = tuple(matieres_attendues)
+    with _parsers_lock:
+        parser = _parsers.get(classe_id)
+        if parser is None or tuple(parser.matieres) != matieres:
+            parser = _parsers[classe_id] = ParserBulletin(matieres)
+        return parser
+
+
+def invalider_parser(classe_id):
+    """À appeler quand les matières d'une classe changent ou que la classe est supprimée."""
+    with _parsers_lock:
+        _parsers.pop(classe_id, None)
+
+
+def analyser_texte_bulletin(texte, nom_eleve_attendu, matieres_attendues):
+    """Analyse ponctuelle sans classe associée (préférer parser_pour(...).analyser pour une classe)."""
+    return ParserBulletin(matieres_attendues).analyser(texte, nom_eleve_attendu)
@@ -0,0 +1,208 @@
+# pipeline.py
+import io
+import re
+import string
+import zipfile
+import unicodedata
+from functools import lru_cache
+from sqlalchemy.orm import load_only
+from models import Analyse
+from extraction import iterer_pages, iterer_textes
+
+SEPARATEUR = "--- JUSTIFICATIONS ---"
+
+CONTEXTES_TRIMESTRE = {
+    1: "C'est le début de l'année, l'appréciation doit être encourageante et fixer des objectifs clairs pour les deux trimestres restants.",
+    2: "C'est le milieu de l'année. L'appréciation doit faire le bilan des progrès par rapport au T1 et motiver pour le dernier trimestre.",
+    3: "C'est la fin de l'année. L'appréciation doit être un bilan final, tenir compte de l'évolution sur l'année et donner des conseils pour la poursuite d'études.",
+}
+
+
+def _normaliser(texte):
+    """Minuscules sans accents ni espaces multiples, pour comparer des noms."""
+    texte = unicodedata.normalize('NFKD', texte)
+    texte = "".join(c for c in texte if not unicodedata.combining(c))
+    return " ".join(texte.lower().split())
+
+
+@lru_cache(maxsize=4096)
+def _motif_nom(nom):
+    """Nom normalisé en mots entiers : « martin lea » ne reconnaît pas « martin leane »."""
+    return re.compile(r'(?<!\w)' + re.escape(_normaliser(nom)) + r'(?!\w)')
+
+
+def _trouver_eleve(texte, eleves):
+    """
+    Retourne l'élève dont le nom apparaît dans le texte, en mots entiers. Si plusieurs noms
+    apparaissent (l'un prolongeant l'autre), le plus long l'emporte, puis le premier de la liste.
+    """
+    texte_normalise = _normaliser(texte)
+    trouves = [nom for nom in eleves if nom.strip() and _motif_nom(nom).search(texte_normalise)]
+    return max(trouves, key=lambda nom: len(_normaliser(nom)), default=None)
+
+
+def decouper_pdf_classe(source, eleves):
+    """
+    Découpe l'export PDF d'une classe en un texte par élève.
+    Une page qui contient le nom d'un élève ouvre son bulletin, les pages suivantes
+    sans nom lui sont rattachées. Si aucun nom n'est trouvé, on répartit les pages
+    dans l'ordre de Classe.eleves (même nombre de pages par élève).
+    Seul le texte des pages est conservé, les pages sont extraites une à une.
+    """
+    pages = []
+    textes_par_eleve = {}
+    eleve_courant = None
+    for texte_page in iterer_pages(source):
+        pages.append(texte_page)
+        nom = _trouver_eleve(texte_page, eleves)
+        if nom:
+            eleve_courant = nom
+        if eleve_courant:
+            textes_par_eleve.setdefault(eleve_courant, []).append(texte_page)
+
+    if not textes_par_eleve and pages and eleves and len(pages) % len(eleves) == 0:
+        pages_par_eleve = len(pages) // len(eleves)
+        for i, nom in enumerate(eleves):
+            textes_par_eleve[nom] = pages[i * pages_par_eleve:(i + 1) * pages_par_eleve]
+
+    return [(nom, "\n".join(textes_par_eleve[nom])) for nom in eleves if nom in textes_par_eleve]
+
+
+def decouper_zip_classe(source, eleves, max_octets=0):
+    """
+    Extrait un texte par élève depuis une archive ZIP de bulletins PDF (chemin ou bytes).
+    L'élève est reconnu dans le nom du fichier ou, à défaut, dans le texte du bulletin.
+    Les bulletins sont décompressés un à un ; une archive qui, décompressée, dépasse
+    max_octets (0 = sans limite) est refusée avant toute extraction.
+    """
+    textes_par_eleve = {}
+    with zipfile.ZipFile(io.BytesIO(source) if isinstance(source, bytes) else source) as archive:
+        membres = sorted((m for m in archive.infolist() if m.filename.lower().endswith('.pdf')), key=lambda m: m.filename)
+        if max_octets and sum(m.file_size for m in membres) > max_octets:
+            raise ValueError("L'archive décompressée dépasse la taille maximale autorisée.")
+        textes = iterer_textes(archive.read(m) for m in membres)
+        for membre, texte in zip(membres, textes):
+            nom = _trouver_eleve(re.sub(r'[_\-.]+', ' ', membre.filename), eleves) or _trouver_eleve(texte, eleves)
+            if nom and texte:
+                textes_par_eleve[nom] = texte
+    return [(nom, textes_par_eleve[nom]) for nom in eleves if nom in textes_par_eleve]
+
+
+def verifier_donnees(donnees_structurees, nom_eleve):
+    """Lève une ValueError si le parser n'a pas pu exploiter le bulletin."""
+    if not donnees_structurees.get("appreciations_matieres"):
+        raise ValueError(
+            "Le parser n'a trouvé aucune matière. Vérifiez que les noms des matières dans la configuration de la classe "
+            "correspondent EXACTEMENT à ceux du PDF (y compris les abréviations, points, et espacements comme 'SC. ECONO.& SOCIALES')."
+        )
+    if not donnees_structurees.get("nom_eleve"):
+        raise ValueError(f"Le nom '{nom_eleve}' n'a pas été trouvé dans le PDF.")
+
+
+def precedentes_par_trimestre(eleve_id, trimestre):
+    """{trimestre: appréciation la plus récente} des trimestres précédents (une seule requête pour tous)."""
+    if trimestre <= 1:
+        return {}
+    analyses = Analyse.query.options(load_only(Analyse.trimestre, Analyse.appreciation_principale)).filter(
+        Analyse.eleve_id == eleve_id, Analyse.trimestre < trimestre
+    ).order_by(Analyse.trimestre, Analyse.created_at, Analyse.id).all()
+    # La plus récente de chaque trimestre l'emporte
+    return {a.trimestre: a.appreciation_principale for a in analyses}
+
+
+def formater_precedentes(par_trimestre):
+    return "".join(f"Appréciation du Trimestre {t}:\n{par_trimestre[t]}\n\n" for t in sorted(par_trimestre))
+
+
+class GabaritPrompt:
+    """
+    user_message_template découpé une fois pour toutes en morceaux de texte et en champs nommés :
+    le remplir revient à une concaténation. Même résultat que str.format ; les gabarits à
+    champs composés ({eleve.nom}, {0}, spécification imbriquée) sont confiés à str.format.
+    """
+
+    def __init__(self, gabarit):
+        self.gabarit = gabarit
+        self.morceaux = []
+        for texte, champ, specification, conversion in string.Formatter().parse(gabarit):
+            if texte:
+                self.morceaux.append(texte)
+            if champ is None:
+                continue
+            if not champ.isidentifier() or '{' in (specification or ''):
+                self.morceaux = None
+                return
+            self.morceaux.append((champ, specification or '', conversion))
+
+    def remplir(self, **valeurs):
+        if self.morceaux is None:
+            return self.gabarit.format(**valeurs)
+        resultat = []
+        for morceau in self.morceaux:
+            if isinstance(morceau, str):
+                resultat.append(morceau)
+                continue
+            champ, specification, conversion = morceau
+            valeur = valeurs[champ]
+            if conversion:
+                valeur = {'r': repr, 's': str, 'a': ascii}[conversion](valeur)
+            resultat.append(format(valeur, specification))
+        return "".join(resultat)
+
+
+@lru_cache(maxsize=32)
+def gabarit_prompt(gabarit):
+    """Gabarit compilé, partagé par toutes les requêtes qui utilisent le même texte de prompt."""
+    return GabaritPrompt(gabarit)
+
+
+def liste_appreciations(donnees_structurees):
+    """Appréciations des matières, une ligne par matière, telles qu'elles sont données à l'IA."""
+    return "\n".join([f"- {item['matiere']} ({item['moyenne']}): {item['commentaire']}" for item in donnees_structurees['appreciations_matieres']])
+
+
+def construire_prompt_utilisateur(prompt, nom_eleve, trimestre, donnees_structurees, precedentes):
+    """Remplit le user_message_template du prompt actif avec les données de l'élève."""
+    return gabarit_prompt(prompt.user_message_template).remplir(
+        nom_eleve=nom_eleve, trimestre=trimestre, contexte_trimestre=CONTEXTES_TRIMESTRE[trimestre],
+        appreciations_precedentes=precedentes, liste_appreciations=liste_appreciations(donnees_structurees)
+    )
+
+
+def separer_reponse(reponse_ia):
+    """Sépare la réponse de l'IA en (appréciation, justifications)."""
+    if SEPARATEUR in reponse_ia:
+        parties = reponse_ia.split(SEPARATEUR, 1)
+        return parties[0].strip(), parties[1].strip()
+    return reponse_ia, ""
+
+
+class DecoupeurFlux:
+    """
+    Repère le séparateur des justifications dans une réponse reçue par fragments.
+    Les derniers caractères sont retenus tant qu'ils peuvent être le début du séparateur,
+    pour ne jamais en afficher un morceau dans le panneau de l'appréciation.
+    """
+
+    def __init__(self):
+        self.partie = 'appreciation'
+        self._tampon = ""
+
+    def ajouter(self, fragment):
+        """Ajoute un fragment et retourne les couples (partie, texte) prêts à être affichés."""
+        if self.partie == 'justifications':
+            return [('justifications', fragment)] if fragment else []
+        self._tampon += fragment
+        if SEPARATEUR in self._tampon:
+            avant, apres = self._tampon.split(SEPARATEUR, 1)
+            self._tampon = ""
+            self.partie = 'justifications'
+            return [(p, t) for p, t in [('appreciation', avant), ('justifications', apres)] if t]
+        retenue = len(SEPARATEUR) - 1
+        a_envoyer, self._tampon = self._tampon[:-retenue], self._tampon[-retenue:]
+        return [('appreciation', a_envoyer)] if a_envoyer else []
+
+    def terminer(self):
+        """Vide le tampon en fin de réponse."""
+        reste, self._tampon = self._tampon, ""
+        return [(self.partie, reste)] if reste else []
@@ -0,0 +1,419 @@
+# providers.py
+import asyncio
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+import httpx
+from flask import current_app
+from mistralai.client import MistralClient
+from mistralai.async_client import MistralAsyncClient
+from mistralai.models.chat_completion import ChatMessage
+from groq import Groq, AsyncGroq
+from openai import OpenAI, AsyncOpenAI
+from pipeline import SEPARATEUR
+from models import AIProvider
+from metriques import metriques, noter, percentile
+
+# Nom du fournisseur (AIProvider.name en minuscules) -> classe qui sait l'appeler
+PROVIDERS = {}
+
+
+def register_provider(nom):
+    """Décorateur : enregistre l'implémentation d'un fournisseur d'IA sous un nom."""
+    def decorateur(classe):
+        PROVIDERS[nom] = classe
+        return classe
+    return decorateur
+
+
+def provider_pour(provider):
+    """Retourne l'implémentation correspondant à une ligne AIProvider."""
+    classe = PROVIDERS.get(provider.name.lower())
+    if not classe:
+        raise ValueError(f"Fournisseur d'IA '{provider.name}' non supporté.")
+    return classe(provider)
+
+
+class BaseProvider(ABC):
+    """
+    Implémentation d'un fournisseur d'IA. Les attributs de la ligne AIProvider sont
+    copiés à la construction : l'objet peut ensuite être utilisé hors de la session SQLAlchemy
+    (threads du pool, boucle asyncio).
+    """
+    temperature = 0.5
+
+    def __init__(self, provider):
+        self.id = provider.id
+        self.nom = provider.name
+        self.api_key = provider.api_key
+        self.model_name = provider.model_name
+
+    def messages(self, system_prompt, user_prompt):
+        return [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}]
+
+    def noter_usage(self, reponse):
+        """Relève les tokens du champ usage d'une réponse (ou du dernier fragment d'un flux)."""
+        usage = getattr(reponse, 'usage', None) or getattr(getattr(reponse, 'x_groq', None), 'usage', None)
+        if usage:
+            metriques.tokens(self.nom, self.model_name, getattr(usage, 'prompt_tokens', 0), getattr(usage, 'completion_tokens', 0))
+
+    @abstractmethod
+    def creer_client(self, http_client, asynchrone):
+        """Construit le client SDK autour du client httpx fourni."""
+
+    @abstractmethod
+    def complete(self, client, system_prompt, user_prompt):
+        """Texte de la réponse (client synchrone)."""
+
+    @abstractmethod
+    async def acomplete(self, client, system_prompt, user_prompt):
+        """Texte de la réponse (client asynchrone)."""
+
+    @abstractmethod
+    def stream(self, client, system_prompt, user_prompt):
+        """Itérateur des fragments de la réponse (client synchrone)."""
+
+    @abstractmethod
+    def astream(self, client, system_prompt, user_prompt):
+        """Itérateur asynchrone des fragments de la réponse (client asynchrone)."""
+
+
+@register_provider('mistral')
+class MistralProvider(BaseProvider):
+    temperature = 0.6
+
+    def messages(self, system_prompt, user_prompt):
+        return [ChatMessage(role="system", content=system_prompt), ChatMessage(role="user", content=user_prompt)]
+
+    def creer_client(self, http_client, asynchrone):
+        # mistralai 0.4.x n'accepte pas de client httpx en argument et crée le sien : il est fermé
+        # avant d'être remplacé par le nôtre, qui porte les réglages du pool
+        client = (MistralAsyncClient if asynchrone else MistralClient)(api_key=self.api_key)
+        if asynchrone:
+            executer_async(client._client.aclose())
+        else:
+            client._client.close()
+        client._client = http_client
+        return client
+
+    def complete(self, client, system_prompt, user_prompt):
+        reponse = client.chat(model=self.model_name, messages=self.messages(system_prompt, user_prompt), temperature=self.temperature)
+        self.noter_usage(reponse)
+        return reponse.choices[0].message.content
+
+    async def acomplete(self, client, system_prompt, user_prompt):
+        reponse = await client.chat(model=self.model_name, messages=self.messages(system_prompt, user_prompt), temperature=self.temperature)
+        self.noter_usage(reponse)
+        return reponse.choices[0].message.content
+
+    def stream(self, client, system_prompt, user_prompt):
+        return client.chat_stream(model=self.model_name, messages=self.messages(system_prompt, user_prompt), temperature=self.temperature)
+
+    def astream(self, client, system_prompt, user_prompt):
+        # MistralAsyncClient.chat_stream est déjà un générateur asynchrone
+        return client.chat_stream(model=self.model_name, messages=self.messages(system_prompt, user_prompt), temperature=self.temperature)
+
+
+@register_provider('openai')
+class OpenAIProvider(BaseProvider):
+    client_sync = OpenAI
+    client_async = AsyncOpenAI
+
+    def creer_client(self, http_client, asynchrone):
+        # Les reprises sont gérées par l'ordonnanceur (backoff, budgets) et non par le SDK
+        return (self.client_async if asynchrone else self.client_sync)(api_key=self.api_key, http_client=http_client, max_retries=0)
+
+    def complete(self, client, system_prompt, user_prompt):
+        chat_completion = client.chat.completions.create(
+            messages=self.messages(system_prompt, user_prompt), model=self.model_name, temperature=self.temperature
+        )
+        self.noter_usage(chat_completion)
+        return chat_completion.choices[0].message.content
+
+    async def acomplete(self, client, system_prompt, user_prompt):
+        chat_completion = await client.chat.completions.create(
+            messages=self.messages(system_prompt, user_prompt), model=self.model_name, temperature=self.temperature
+        )
+        self.noter_usage(chat_completion)
+        return chat_completion.choices[0].message.content
+
+    def stream(self, client, system_prompt, user_prompt):
+        return client.chat.completions.create(
+            messages=self.messages(system_prompt, user_prompt), model=self.model_name, temperature=self.temperature, stream=True
+        )
+
+    async def astream(self, client, system_prompt, user_prompt):
+        flux = await client.chat.completions.create(
+            messages=self.messages(system_prompt, user_prompt), model=self.model_name, temperature=self.temperature, stream=True
+        )
+        async for morceau in flux:
+            yield morceau
+
+
+@register_provider('groq')
+class GroqProvider(OpenAIProvider):
+    client_sync = Groq
+    client_async = AsyncGroq
+
+
+@register_provider('local')
+class LocalProvider(OpenAIProvider):
+    """Serveur compatible OpenAI à l'adresse LOCAL_PROVIDER_URL (faux fournisseur de test, serveur auto-hébergé...)."""
+
+    def creer_client(self, http_client, asynchrone):
+        classe = self.client_async if asynchrone else self.client_sync
+        return classe(api_key=self.api_key, http_client=http_client, max_retries=0, base_url=current_app.config['LOCAL_PROVIDER_URL'])
+
+
+class ClientRegistry:
+    """
+    Conserve un client SDK par fournisseur, clé (AIProvider.id, api_key, model_name, asynchrone).
+    Les clients gardent leur pool de connexions HTTP ouvert (keep-alive) : plus de
+    nouvelle poignée de main TLS à chaque appréciation.
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def obtenir(self, impl, asynchrone=False):
+        """Retourne le client du fournisseur, en le créant au premier appel."""
+        cle = (impl.id, impl.api_key, impl.model_name, asynchrone)
+        with self._lock:
+            entree = self._clients.get(cle)
+            if entree:
+                self._stats['hits'] += 1
+                entree['utilisations'] += 1
+                return entree['client']
+            self._stats['misses'] += 1
+            # Une clé d'API ou un modèle modifié remplace l'ancien client de ce fournisseur
+            self._fermer(impl.id, asynchrone)
+            http_client = _creer_http_client(asynchrone)
+            self._clients[cle] = {
+                'client': impl.creer_client(http_client, asynchrone), 'http_client': http_client,
+                'fournisseur': impl.nom, 'cree_le': time.time(), 'utilisations': 1
+            }
+            return self._clients[cle]['client']
+
+    def invalider(self, provider_id):
+        """Ferme et oublie les clients d'un fournisseur (modifié, activé ou supprimé)."""
+        with self._lock:
+            if self._fermer(provider_id, False) | self._fermer(provider_id, True):
+                self._stats['invalidations'] += 1
+
+    def _fermer(self, provider_id, asynchrone):
+        cles = [cle for cle in self._clients if cle[0] == provider_id and cle[3] == asynchrone]
+        for cle in cles:
+            http_client = self._clients.pop(cle)['http_client']
+            try:
+                if asynchrone:
+                    if _boucle is not None:
+                        asyncio.run_coroutine_threadsafe(http_client.aclose(), _boucle)
+                else:
+                    http_client.close()
+            except Exception:
+                pass
+        return bool(cles)
+
+    def statistiques(self):
+        """Statistiques du registre et des pools de connexions, pour le monitoring."""
+        with self._lock:
+            clients = []
+            for (provider_id, _, model_name, asynchrone), entree in self._clients.items():
+                pool = getattr(getattr(entree['http_client'], '_transport', None), '_pool', None)
+                clients.append({
+                    'provider_id': provider_id,
+                    'fournisseur': entree['fournisseur'],
+                    'model_name': model_name,
+                    'asynchrone': asynchrone,
+                    'age_secondes': round(time.time() - entree['cree_le'], 1),
+                    'utilisations': entree['utilisations'],
+                    'connexions_ouvertes': len(pool.connections) if pool is not None else None,
+                })
+            return dict(self._stats, nb_clients=len(self._clients), clients=clients)
+
+
+def _creer_http_client(asynchrone=False):
+    """Client httpx partagé par un SDK, avec un pool de connexions persistantes."""
+    config = current_app.config
+    return (httpx.AsyncClient if asynchrone else httpx.Client)(
+        follow_redirects=True,
+        timeout=config['PROVIDER_TIMEOUT'],
+        limits=httpx.Limits(
+            max_connections=config['PROVIDER_POOL_MAX_CONNECTIONS'],
+            max_keepalive_connections=config['PROVIDER_POOL_MAX_CONNECTIONS'],
+            keepalive_expiry=config['PROVIDER_POOL_KEEPALIVE'],
+        ),
+    )
+
+
+class SuiviLatences:
+    """Latences récentes des appels réussis, par fournisseur (fenêtre glissante en mémoire)."""
+
+    def __init__(self, taille=500):
+        self._mesures = {}
+        self._erreurs = {}
+        self._taille = taille
+        self._lock = threading.Lock()
+
+    def enregistrer(self, nom, duree):
+        with self._lock:
+            self._mesures.setdefault(nom, deque(maxlen=self._taille)).append(duree)
+
+    def erreur(self, nom):
+        with self._lock:
+            self._erreurs[nom] = self._erreurs.get(nom, 0) + 1
+
+    def statistiques(self):
+        """{fournisseur: {nb, erreurs, p50, p95}} avec les latences en secondes."""
+        with self._lock:
+            noms = set(self._mesures) | set(self._erreurs)
+            return {nom: dict(
+                nb=len(self._mesures.get(nom, ())), erreurs=self._erreurs.get(nom, 0),
+                p50=percentile(self._mesures.get(nom, ()), 50), p95=percentile(self._mesures.get(nom, ()), 95)
+            ) for nom in noms}
+
+
+clients = ClientRegistry()
+latences = SuiviLatences()
+
+# Boucle asyncio du processus, dans un thread dédié : les clients asynchrones y restent
+# attachés d'un appel à l'autre (leur pool de connexions est lié à une boucle).
+_boucle = None
+_boucle_lock = threading.Lock()
+
+
+def boucle_fournisseurs():
+    """Boucle asyncio des fournisseurs, démarrée au premier besoin."""
+    global _boucle
+    with _boucle_lock:
+        if _boucle is None:
+            _boucle = asyncio.new_event_loop()
+            threading.Thread(target=_boucle.run_forever, name='providers-asyncio', daemon=True).start()
+        return _boucle
+
+
+def executer_async(coroutine):
+    """Exécute une coroutine sur la boucle des fournisseurs et attend son résultat."""
+    return asyncio.run_coroutine_threadsafe(coroutine, boucle_fournisseurs()).result()
+
+
+def temperature_pour(provider):
+    """Température d'échantillonnage utilisée pour ce fournisseur."""
+    return provider_pour(provider).temperature
+
+
+def get_ai_response(provider, system_prompt, user_prompt):
+    """Appelle le bon fournisseur d'IA et retourne la réponse."""
+    impl = provider_pour(provider)
+    debut = time.perf_counter()
+    try:
+        reponse = impl.complete(clients.obtenir(impl), system_prompt, user_prompt)
+    except Exception:
+        latences.erreur(impl.nom)
+        metriques.erreur('fournisseur', impl.nom, impl.model_name)
+        raise
+    duree = time.perf_counter() - debut
+    latences.enregistrer(impl.nom, duree)
+    noter('fournisseur', duree, impl.nom, impl.model_name)
+    return reponse
+
+
+async def acomplete_ai_response(impl, client, system_prompt, user_prompt):
+    """Équivalent asynchrone de get_ai_response, sur la boucle des fournisseurs (mode course)."""
+    debut = time.perf_counter()
+    try:
+        reponse = await impl.acomplete(client, system_prompt, user_prompt)
+    except Exception:
+        latences.erreur(impl.nom)
+        metriques.erreur('fournisseur', impl.nom, impl.model_name)
+        raise
+    duree = time.perf_counter() - debut
+    latences.enregistrer(impl.nom, duree)
+    metriques.observer('fournisseur', duree, impl.nom, impl.model_name)
+    return reponse
+
+
+def contient_separateur(reponse):
+    """Réponse valide d'un prompt individuel : appréciation et justifications séparées."""
+    return SEPARATEUR in reponse
+
+
+def fournisseurs_course(provider):
+    """
+    Fournisseurs mis en concurrence avec le fournisseur actif (mode course), d'après
+    COURSE_FOURNISSEURS ('*' pour tous). Retourne [provider] si le mode est désactivé.
+    """
+    noms = current_app.config['COURSE_FOURNISSEURS']
+    if not noms:
+        return [provider]
+    autres = AIProvider.query.filter(AIProvider.id != provider.id).order_by(AIProvider.name).all()
+    if noms != ['*']:
+        autres = [p for p in autres if p.name.lower() in noms]
+    return [provider] + autres[:current_app.config['COURSE_MAX'] - 1]
+
+
+def stream_ai_response(provider, system_prompt, user_prompt):
+    """Appelle l'API de chat en streaming du fournisseur et produit les fragments de texte reçus."""
+    impl = provider_pour(provider)
+    debut = time.perf_counter()
+    try:
+        for morceau in impl.stream(clients.obtenir(impl), system_prompt, user_prompt):
+            impl.noter_usage(morceau)
+            if morceau.choices and morceau.choices[0].delta.content:
+                yield morceau.choices[0].delta.content
+    except Exception:
+        latences.erreur(impl.nom)
+        metriques.erreur('fournisseur', impl.nom, impl.model_name)
+        raise
+    duree = time.perf_counter() - debut
+    latences.enregistrer(impl.nom, duree)
+    noter('fournisseur', duree, impl.nom, impl.model_name)
+
+
+async def astream_ai_response(impl, client, system_prompt, user_prompt):
+    """
+    Équivalent asynchrone de stream_ai_response, pour le serveur ASGI : aucun thread n'est
+    bloqué pendant la génération. impl et client (asynchrone) sont obtenus au préalable
+    dans un contexte d'application (provider_pour, clients.obtenir). Le flux est lu sur la
+    boucle des fournisseurs, à laquelle le client est attaché, et relayé vers la boucle
+    de l'appelant.
+    """
+    boucle = asyncio.get_running_loop()
+    file = asyncio.Queue()
+
+    def transmettre(evenement, valeur=None):
+        boucle.call_soon_threadsafe(file.put_nowait, (evenement, valeur))
+
+    async def lire():
+        debut = time.perf_counter()
+        try:
+            async for morceau in impl.astream(client, system_prompt, user_prompt):
+                impl.noter_usage(morceau)
+                if morceau.choices and morceau.choices[0].delta.content:
+                    transmettre('fragment', morceau.choices[0].delta.content)
+        except Exception as e:
+            latences.erreur(impl.nom)
+            metriques.erreur('fournisseur', impl.nom, impl.model_name)
+            transmettre('erreur', e)
+            return
+        duree = time.perf_counter() - debut
+        latences.enregistrer(impl.nom, duree)
+        metriques.observer('fournisseur', duree, impl.nom, impl.model_name)
+        transmettre('fin')
+
+    lecture = asyncio.run_coroutine_threadsafe(lire(), boucle_fournisseurs())
+    try:
+        while True:
+            evenement, valeur = await file.get()
+            if evenement == 'fragment':
+                yield valeur
+            elif evenement == 'erreur':
+                raise valeur
+            else:
+                return
+    finally:
+        # Client parti ou erreur : la lecture du flux est abandonnée
+        lecture.cancel()
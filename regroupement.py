@@ -0,0 +1,127 @@
+# regroupement.py
+"""
+Génération groupée des appréciations d'une classe : plusieurs élèves par appel à l'IA.
+Le message système et les consignes du prompt ne sont envoyés qu'une fois par paquet ;
+les données des élèves partent dans un tableau JSON et l'IA répond par un tableau JSON,
+redécoupé en une réponse par élève. Les élèves dont la réponse est illisible ou absente
+sont rendus à l'appelant, qui les génère un par un.
+
+La taille des paquets est bornée par PACK_ELEVES_MAX, par la fenêtre de contexte du modèle
+et par le nombre de tokens qu'il peut produire en une réponse (PACK_SORTIE_TOKENS).
+"""
+import json
+import re
+from flask import current_app
+from cache import get_ai_response_cached
+from ordonnanceur import estimer_tokens, fenetre_contexte
+from pipeline import CONTEXTES_TRIMESTRE, SEPARATEUR, gabarit_prompt, liste_appreciations
+
+CONSIGNES_GROUPE = """Rédige séparément l'appréciation de chacun des {nb} élèves décrits plus bas.
+Les consignes sont les mêmes pour tous : « l'élève » y désigne tour à tour chaque élève du tableau.
+
+=== CONSIGNES ===
+{consignes}
+
+=== ÉLÈVES (tableau JSON) ===
+{eleves}
+
+=== FORMAT DE LA RÉPONSE ===
+Réponds UNIQUEMENT par un tableau JSON contenant un objet par élève, dans le même ordre :
+[{{"numero": 1, "appreciation": "...", "justifications": "..."}}]
+« appreciation » reçoit la partie 1 (l'appréciation globale) et « justifications » la partie 2
+(les justifications, en Markdown). N'utilise pas le séparateur "{separateur}"."""
+
+RE_BLOC_CODE = re.compile(r'^```(?:json)?\s*|\s*```$')
+
+
+def consignes(prompt, trimestre):
+    """Le user_message_template rempli une seule fois, les données propres à l'élève renvoyant au tableau."""
+    return gabarit_prompt(prompt.user_message_template).remplir(
+        nom_eleve="l'élève", trimestre=trimestre, contexte_trimestre=CONTEXTES_TRIMESTRE[trimestre],
+        appreciations_precedentes="(appréciations précédentes : champ « appreciations_precedentes » de l'élève)",
+        liste_appreciations="(champ « appreciations_matieres » de l'élève)",
+    )
+
+
+def _element(numero, nom_eleve, donnees_structurees, precedentes):
+    return {
+        'numero': numero, 'eleve': nom_eleve,
+        'appreciations_precedentes': precedentes.strip(),
+        'appreciations_matieres': liste_appreciations(donnees_structurees),
+    }
+
+
+def construire_prompt_groupe(prompt, trimestre, eleves):
+    """eleves : liste de (nom_eleve, donnees_structurees, precedentes). Retourne le prompt utilisateur du paquet."""
+    elements = [_element(i, nom, donnees, precedentes) for i, (nom, donnees, precedentes) in enumerate(eleves, start=1)]
+    return CONSIGNES_GROUPE.format(
+        nb=len(eleves), consignes=consignes(prompt, trimestre), separateur=SEPARATEUR,
+        eleves=json.dumps(elements, ensure_ascii=False, indent=1),
+    )
+
+
+def former_paquets(provider, prompt, trimestre, eleves):
+    """
+    Répartit les élèves (nom_eleve, donnees_structurees, precedentes) en paquets successifs,
+    chacun tenant dans la fenêtre de contexte du modèle et dans son budget de sortie.
+    """
+    config = current_app.config
+    sortie_par_eleve = config['PROVIDER_TOKENS_REPONSE']
+    fenetre = fenetre_contexte(provider.model_name)
+    fixe = estimer_tokens(prompt.system_message, CONSIGNES_GROUPE, consignes(prompt, trimestre))
+    paquets, courant, tokens = [], [], fixe
+    for eleve in eleves:
+        cout = estimer_tokens(json.dumps(_element(0, *eleve), ensure_ascii=False)) + sortie_par_eleve
+        plein = (len(courant) >= config['PACK_ELEVES_MAX'] or tokens + cout > fenetre
+                 or (len(courant) + 1) * sortie_par_eleve > config['PACK_SORTIE_TOKENS'])
+        if courant and plein:
+            paquets.append(courant)
+            courant, tokens = [], fixe
+        courant.append(eleve)
+        tokens += cout
+    if courant:
+        paquets.append(courant)
+    return paquets
+
+
+def separer_reponse_groupee(reponse, nb):
+    """{numero: (appreciation, justifications)} des élèves correctement rendus ; les autres sont absents."""
+    texte = RE_BLOC_CODE.sub('', reponse.strip())
+    debut, fin = texte.find('['), texte.rfind(']')
+    try:
+        elements = json.loads(texte[debut:fin + 1]) if 0 <= debut < fin else []
+    except ValueError:
+        return {}
+    resultat = {}
+    for element in elements if isinstance(elements, list) else []:
+        if not isinstance(element, dict):
+            continue
+        numero, appreciation = element.get('numero'), element.get('appreciation')
+        if isinstance(numero, int) and 1 <= numero <= nb and isinstance(appreciation, str) and appreciation.strip():
+            resultat[numero] = (appreciation.strip(), str(element.get('justifications') or '').strip())
+    return resultat
+
+
+def generer_paquet(provider, prompt, trimestre, paquet, forcer=False):
+    """
+    Un appel à l'IA pour tout le paquet. Retourne {nom_eleve: (reponse_ia, nom_fournisseur)} pour les
+    élèves lisibles, la réponse étant remise au format habituel (appréciation, séparateur, justifications).
+    """
+    prompt_utilisateur = construire_prompt_groupe(prompt, trimestre, paquet)
+
+    def complete(reponse):
+        # Seule une réponse qui rend tous les élèves gagne la course et va en cache : sinon,
+        # une nouvelle génération sans « forcer » rejouerait les mêmes élèves illisibles
+        return len(separer_reponse_groupee(reponse, len(paquet))) == len(paquet)
+
+    reponse, nom_fournisseur = get_ai_response_cached(
+        provider, prompt.system_message, prompt_utilisateur, forcer=forcer,
+        tokens_reponse=len(paquet) * current_app.config['PROVIDER_TOKENS_REPONSE'], valider=complete
+    )
+    lues = separer_reponse_groupee(reponse, len(paquet))
+    if len(lues) < len(paquet):
+        current_app.logger.warning(f"Réponse groupée : {len(paquet) - len(lues)} élève(s) sur {len(paquet)} illisible(s), générés un par un")
+    return {
+        nom: (f"{lues[i][0]}\n{SEPARATEUR}\n{lues[i][1]}", nom_fournisseur)
+        for i, (nom, _, _) in enumerate(paquet, start=1) if i in lues
+    }
@@ -0,0 +1,138 @@
+# rendu_pdf.py
+import hashlib
+import io
+import json
+import os
+import pypdfium2 as pdfium
+from flask import current_app, render_template
+from extraction import obtenir_pool
+from metriques import chrono
+
+CHEMIN_CSS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'pdf.css')
+
+# Feuille de style et polices analysées une seule fois par processus
+_css = None
+_polices = None
+
+
+def _preparer_styles():
+    global _css, _polices
+    if _css is None:
+        from weasyprint import CSS
+        from weasyprint.text.fonts import FontConfiguration
+        _polices = FontConfiguration()
+        _css = CSS(filename=CHEMIN_CSS, font_config=_polices)
+    return _css, _polices
+
+
+def rendre_html(html):
+    """Convertit le HTML d'un élève en PDF. Exécutable dans un processus du pool."""
+    from weasyprint import HTML
+    css, polices = _preparer_styles()
+    return HTML(string=html).write_pdf(stylesheets=[css], font_config=polices)
+
+
+def fusionner(liste_pdf):
+    """Assemble plusieurs PDF en un seul document, dans l'ordre."""
+    if len(liste_pdf) == 1:
+        return liste_pdf[0]
+    document = pdfium.PdfDocument.new()
+    for pdf_bytes in liste_pdf:
+        source = pdfium.PdfDocument(pdf_bytes)
+        document.import_pages(source)
+        source.close()
+    sortie = io.BytesIO()
+    document.save(sortie)
+    document.close()
+    return sortie.getvalue()
+
+
+def _version_gabarit():
+    """Empreinte de la feuille de style et du gabarit : les modifier invalide le cache."""
+    gabarit = os.path.join(os.path.dirname(CHEMIN_CSS), 'pdf_analyse.html')
+    empreinte = hashlib.sha256()
+    for chemin in (CHEMIN_CSS, gabarit):
+        with open(chemin, 'rb') as fichier:
+            empreinte.update(fichier.read())
+    return empreinte.hexdigest()[:16]
+
+
+def cle_analyse(analyse, classe):
+    """Clé du PDF d'un élève : l'analyse, sa dernière modification, l'en-tête de classe et le gabarit."""
+    horodatage = analyse.modifie_le or analyse.created_at
+    contenu = json.dumps([
+        analyse.id, horodatage.isoformat() if horodatage else None,
+        classe.nom_classe, classe.annee_scolaire, _version_gabarit()
+    ], ensure_ascii=False)
+    return hashlib.sha256(contenu.encode('utf-8')).hexdigest()
+
+
+def _chemin(cle):
+    return os.path.join(current_app.config['PDF_CACHE_DOSSIER'], f"{cle}.pdf")
+
+
+def lire_cache(cle):
+    try:
+        with open(_chemin(cle), 'rb') as fichier:
+            contenu = fichier.read()
+    except FileNotFoundError:
+        return None
+    try:
+        os.utime(_chemin(cle))  # la date de modification sert d'ordre LRU pour l'éviction
+    except FileNotFoundError:
+        pass  # évincé par un autre processus entre-temps : le contenu est déjà lu
+    return contenu
+
+
+def ecrire_cache(cle, pdf_bytes):
+    dossier = current_app.config['PDF_CACHE_DOSSIER']
+    os.makedirs(dossier, exist_ok=True)
+    temporaire = f"{_chemin(cle)}.{os.getpid()}.tmp"
+    with open(temporaire, 'wb') as fichier:
+        fichier.write(pdf_bytes)
+    os.replace(temporaire, _chemin(cle))
+
+
+def evincer_cache():
+    """Supprime les PDF les moins récemment utilisés au-delà de PDF_CACHE_MAX_FICHIERS."""
+    dossier = current_app.config['PDF_CACHE_DOSSIER']
+    if not os.path.isdir(dossier):
+        return
+    fichiers = [e for e in os.scandir(dossier) if e.name.endswith('.pdf')]
+    surplus = len(fichiers) - current_app.config['PDF_CACHE_MAX_FICHIERS']
+    if surplus <= 0:
+        return
+    for entree in sorted(fichiers, key=lambda e: e.stat().st_mtime)[:surplus]:
+        try:
+            os.remove(entree.path)
+        except FileNotFoundError:
+            pass
+
+
+def pdf_analyses(analyses, classe):
+    """
+    PDF des appréciations données, un élève par page. Le PDF de chaque élève est mis en cache
+    sur disque ; seuls les élèves absents du cache sont rendus, en parallèle dans le pool de processus.
+    """
+    cles = [cle_analyse(a, classe) for a in analyses]
+    cle_document = hashlib.sha256("".join(cles).encode('ascii')).hexdigest() if len(cles) > 1 else cles[0]
+    document = lire_cache(cle_document)
+    if document is not None:
+        return document
+
+    pages = {cle: lire_cache(cle) for cle in cles}
+    a_rendre = [(cle, render_template('pdf_analyse.html', analyse=a, classe=classe)) for a, cle in zip(analyses, cles) if pages[cle] is None]
+    with chrono('rendu_pdf'):
+        if len(a_rendre) > 1 and current_app.config['PDF_PROCESSUS'] > 1:
+            rendus = list(obtenir_pool().map(rendre_html, [html for _, html in a_rendre]))
+        else:
+            rendus = [rendre_html(html) for _, html in a_rendre]
+    for (cle, _), pdf_bytes in zip(a_rendre, rendus):
+        pages[cle] = pdf_bytes
+        ecrire_cache(cle, pdf_bytes)
+
+    document = fusionner([pages[cle] for cle in cles])
+    if len(cles) > 1:
+        ecrire_cache(cle_document, document)
+    evincer_cache()
+    return document
@@ -0,0 +1,66 @@
+# requetes.py
+import sqlite3
+from sqlalchemy import and_, exists, or_
+from sqlalchemy.orm import aliased, load_only
+from models import db, Analyse
+
+# Colonnes nécessaires à l'affichage et aux PDF (sans les données du parser ni le texte du bulletin)
+COLONNES_AFFICHAGE = (
+    Analyse.id, Analyse.nom_eleve, Analyse.eleve_id, Analyse.trimestre, Analyse.classe_id,
+    Analyse.appreciation_principale, Analyse.justifications, Analyse.justifications_html,
+    Analyse.prompt_name, Analyse.provider_name, Analyse.created_at, Analyse.modifie_le,
+)
+
+
+def _fenetres_disponibles():
+    """Les fonctions de fenêtre existent sous PostgreSQL et sous SQLite à partir de 3.25."""
+    return db.engine.dialect.name != 'sqlite' or sqlite3.sqlite_version_info >= (3, 25)
+
+
+def dernieres_analyses(classe_id, trimestre=None, colonnes=COLONNES_AFFICHAGE):
+    """
+    Analyse la plus récente de chaque élève (par trimestre) d'une classe, en une seule requête.
+    Seules les colonnes demandées sont chargées. Résultat trié par élève puis par trimestre.
+    """
+    filtres = [Analyse.classe_id == classe_id]
+    if trimestre is not None:
+        filtres.append(Analyse.trimestre == trimestre)
+
+    if _fenetres_disponibles():
+        rang = db.func.row_number().over(
+            partition_by=(Analyse.eleve_id, Analyse.trimestre),
+            order_by=(Analyse.created_at.desc(), Analyse.id.desc())
+        ).label('rang')
+        classees = db.session.query(Analyse.id, rang).filter(*filtres).subquery()
+        requete = Analyse.query.join(classees, and_(classees.c.id == Analyse.id, classees.c.rang == 1))
+    else:
+        # Repli pour les vieux SQLite : on garde les analyses pour lesquelles il n'en existe pas de plus récente
+        plus_recente = aliased(Analyse)
+        requete = Analyse.query.filter(*filtres).filter(~exists().where(and_(
+            plus_recente.eleve_id == Analyse.eleve_id,
+            plus_recente.trimestre == Analyse.trimestre,
+            or_(
+                plus_recente.created_at > Analyse.created_at,
+                and_(plus_recente.created_at == Analyse.created_at, plus_recente.id > Analyse.id)
+            )
+        )))
+
+    return requete.options(load_only(*colonnes)).order_by(Analyse.nom_eleve, Analyse.trimestre).all()
+
+
+def nombre_versions(classe_id):
+    """{(eleve_id, trimestre): nombre d'analyses générées} pour une classe, en une requête groupée."""
+    requete = db.session.query(Analyse.eleve_id, Analyse.trimestre, db.func.count(Analyse.id)).filter(
+        Analyse.classe_id == classe_id
+    ).group_by(Analyse.eleve_id, Analyse.trimestre)
+    return {(eleve_id, trimestre): nombre for eleve_id, trimestre, nombre in requete}
+
+
+def versions_precedentes(classe_id, eleve_id, trimestre, colonnes=COLONNES_AFFICHAGE):
+    """
+    Analyses d'un élève d'une classe pour un trimestre, de la plus récente à la plus ancienne,
+    sans la dernière. Un eleve_id d'une autre classe ne renvoie rien.
+    """
+    return Analyse.query.options(load_only(*colonnes)).filter_by(
+        classe_id=classe_id, eleve_id=eleve_id, trimestre=trimestre
+    ).order_by(Analyse.created_at.desc(), Analyse.id.desc()).offset(1).all()
@@ -0,0 +1,63 @@
+# televersement.py
+"""
+Réception des fichiers envoyés (bulletin PDF, export de classe, archive ZIP) sans les charger
+en mémoire : le flux est recopié par blocs dans un fichier temporaire, en calculant au passage
+son empreinte SHA-256, et l'envoi est refusé dès qu'il dépasse UPLOAD_MAX_OCTETS.
+"""
+import hashlib
+import os
+import tempfile
+from flask import current_app
+
+TAILLE_BLOC = 1024 * 1024
+
+
+def taille_lisible(octets):
+    return f"{octets / (1024 * 1024):.0f} Mo"
+
+
+class Televersement:
+    """
+    Fichier reçu, copié sur le disque. S'utilise comme gestionnaire de contexte :
+    le fichier temporaire est supprimé à la sortie du bloc.
+    """
+
+    def __init__(self, chemin, nom, taille, empreinte):
+        self.chemin = chemin
+        self.nom = nom
+        self.taille = taille
+        self.empreinte = empreinte
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.supprimer()
+
+    def supprimer(self):
+        try:
+            os.remove(self.chemin)
+        except FileNotFoundError:
+            pass
+
+
+def recevoir(fichier):
+    """Copie le FileStorage reçu dans un fichier temporaire. Lève une ValueError s'il est trop volumineux."""
+    limite = current_app.config['UPLOAD_MAX_OCTETS']
+    empreinte, taille = hashlib.sha256(), 0
+    descripteur, chemin = tempfile.mkstemp(prefix='televersement-', suffix=os.path.splitext(fichier.filename or '')[1].lower())
+    try:
+        with os.fdopen(descripteur, 'wb') as sortie:
+            while True:
+                bloc = fichier.stream.read(TAILLE_BLOC)
+                if not bloc:
+                    break
+                taille += len(bloc)
+                if limite and taille > limite:
+                    raise ValueError(f"Le fichier dépasse la taille maximale autorisée ({taille_lisible(limite)}).")
+                empreinte.update(bloc)
+                sortie.write(bloc)
+    except BaseException:
+        os.remove(chemin)
+        raise
+    return Televersement(chemin, fichier.filename, taille, empreinte.hexdigest())
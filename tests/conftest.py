@@ -0,0 +1,79 @@
+# tests/conftest.py
+import pytest
+import cache_config
+from app import create_app
+from config import Config
+from extensions import db
+from ordonnanceur import ordonnanceur
+from providers import LocalProvider, clients, register_provider
+from benchmarks.faux_fournisseur import demarrer
+from benchmarks.scenarios import IDENTIFIANTS, preparer
+
+
+@register_provider('local bis')
+class LocalBis(LocalProvider):
+    """Second fournisseur servi par le même faux fournisseur (mode course, bascule)."""
+
+
+@register_provider('en panne')
+class EnPanne(LocalProvider):
+    """Fournisseur servi par un faux fournisseur qui répond toujours 500 (fixture fournisseur_en_panne)."""
+    url = None
+
+    def creer_client(self, http_client, asynchrone):
+        classe = self.client_async if asynchrone else self.client_sync
+        return classe(api_key=self.api_key, http_client=http_client, max_retries=0, base_url=EnPanne.url)
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Application sur une base SQLite temporaire, au schéma à jour."""
+    from migrations import mettre_a_jour
+
+    class ConfigTest(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'test.db'}"
+        PDF_CACHE_DOSSIER = str(tmp_path / 'pdf')
+        EXPORTS_DOSSIER = str(tmp_path / 'exports')
+        PROVIDER_BACKOFF_BASE = 0.01
+
+    app = create_app(ConfigTest)
+    with app.app_context():
+        mettre_a_jour(journal=lambda message: None)
+        yield app
+        # Les caches du processus survivent à la base : chaque test repart de zéro
+        with cache_config._lock:
+            cache_config._etat.update(version=None, verifie_le=0.0, lignes={})
+        for provider_id in {cle[0] for cle in clients._clients}:
+            clients.invalider(provider_id)
+        ordonnanceur._appels.clear()
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def fournisseur(app):
+    """Faux fournisseur d'IA local, utilisé par le fournisseur « Local »."""
+    serveur = demarrer(latence=0.02, gigue=0)
+    app.config['LOCAL_PROVIDER_URL'] = f"http://127.0.0.1:{serveur.server_address[1]}/v1"
+    yield serveur
+    serveur.shutdown()
+    serveur.server_close()
+
+
+@pytest.fixture
+def client(app, fournisseur):
+    """Client connecté, avec une classe de deux élèves, le prompt et le fournisseur « Local » actifs."""
+    client = app.test_client()
+    client.classe_id = preparer(app, ['DUPONT Jean', 'MARTIN Léa'])
+    client.post('/login', data=IDENTIFIANTS)
+    return client
+
+
+@pytest.fixture
+def fournisseur_en_panne(app):
+    serveur = demarrer(latence=0, gigue=0, taux_erreur=1.0)
+    EnPanne.url = f"http://127.0.0.1:{serveur.server_address[1]}/v1"
+    yield serveur
+    serveur.shutdown()
+    serveur.server_close()
@@ -0,0 +1,119 @@
+# tests/test_asgi.py
+import asyncio
+import sys
+import threading
+import pytest
+from asgi import FlaskAsgi
+from benchmarks.scenarios import IDENTIFIANTS, preparer
+
+
+def requete(wsgi, methode, chemin, corps=b'', entetes=(), deconnexion_apres=None):
+    """
+    Joue une requête ASGI comme un serveur : le corps, puis receive attend le départ du client
+    (après deconnexion_apres messages envoyés, sinon jamais). Retourne (statut, en-têtes, corps, messages).
+    """
+    messages = []
+    recus = [{'type': 'http.request', 'body': corps, 'more_body': False}]
+
+    async def jouer():
+        parti = asyncio.Event()
+
+        async def recevoir():
+            if recus:
+                return recus.pop(0)
+            await parti.wait()
+            return {'type': 'http.disconnect'}
+
+        async def envoyer(message):
+            messages.append(message)
+            if deconnexion_apres and len(messages) >= deconnexion_apres:
+                parti.set()
+
+        scope = {'type': 'http', 'method': methode, 'path': chemin, 'query_string': b'', 'http_version': '1.1',
+                 'headers': [(b'host', b'localhost'), *entetes]}
+        await FlaskAsgi(wsgi)(scope, recevoir, envoyer)
+
+    asyncio.run(jouer())
+    debut = messages[0]
+    assert debut['type'] == 'http.response.start'
+    return debut['status'], dict(debut['headers']), b''.join(m.get('body', b'') for m in messages[1:]), messages
+
+
+def test_requete_flask_en_asgi(app):
+    preparer(app, ['DUPONT Jean'])
+    threads = set()
+
+    def suivre(environ, start_response):
+        threads.add(threading.get_ident())
+        return app.wsgi_app(environ, start_response)
+
+    statut, entetes, corps, messages = requete(suivre, 'GET', '/login')
+    assert statut == 200 and b'<form' in corps
+    assert messages[-1] == {'type': 'http.response.body', 'body': b''}
+    assert threading.get_ident() not in threads  # servie dans un thread du pool, pas dans la boucle
+    formulaire = '&'.join(f'{nom}={valeur}' for nom, valeur in IDENTIFIANTS.items()).encode()
+    statut, entetes, _, _ = requete(suivre, 'POST', '/login', formulaire, [
+        (b'content-type', b'application/x-www-form-urlencoded'), (b'content-length', str(len(formulaire)).encode())])
+    assert statut == 302 and b'set-cookie' in entetes
+
+
+def test_write_et_exc_info():
+    def ecrit(environ, start_response):
+        write = start_response('200 OK', [('Content-Type', 'text/plain')])
+        write(b'par write, ')
+        return [b'puis par l\'iterable']
+
+    assert requete(ecrit, 'GET', '/')[2] == b"par write, puis par l'iterable"
+
+    def erreur_avant_envoi(environ, start_response):
+        start_response('200 OK', [])
+        try:
+            raise ValueError('rendu')
+        except ValueError:
+            start_response('500 Internal Server Error', [], sys.exc_info())
+        return [b'erreur']
+
+    # Rien n'est parti : les en-têtes sont remplacés
+    assert requete(erreur_avant_envoi, 'GET', '/')[0] == 500
+
+    def erreur_apres_envoi(environ, start_response):
+        start_response('200 OK', [])
+        yield b'debut'
+        try:
+            raise ValueError('rendu')
+        except ValueError:
+            start_response('500 Internal Server Error', [], sys.exc_info())
+
+    # En-têtes déjà envoyés : l'exception est relancée vers le serveur
+    with pytest.raises(ValueError):
+        requete(erreur_apres_envoi, 'GET', '/')
+
+
+def test_client_parti():
+    produits, fermee = [], threading.Event()
+
+    class Reponse:
+        def __iter__(self):
+            for i in range(1000):
+                produits.append(i)
+                yield b'x' * 10
+
+        def close(self):
+            fermee.set()
+
+    def longue(environ, start_response):
+        start_response('200 OK', [])
+        return Reponse()
+
+    def lente(environ, start_response):
+        start_response('200 OK', [])
+        for i in range(1000):
+            produits.append(i)
+            threading.Event().wait(0.005)  # laisse à la boucle le temps de voir la déconnexion
+            yield b'x'
+
+    requete(lente, 'GET', '/', deconnexion_apres=3)
+    assert len(produits) < 1000
+    produits.clear()
+    requete(longue, 'GET', '/')
+    assert len(produits) == 1000 and fermee.is_set()
@@ -0,0 +1,40 @@
+# tests/test_budget_prompt.py
+import threading
+from types import SimpleNamespace
+from budget_prompt import COUPURE, compacter, raccourcir
+from ordonnanceur import estimer_tokens
+from pipeline import construire_prompt_utilisateur
+
+PROMPT = SimpleNamespace(system_message="Tu es un professeur principal.", user_message_template="{nom_eleve}\n{liste_appreciations}")
+PROVIDER = SimpleNamespace(name='Test', model_name='modele-inconnu')
+COMMENTAIRE = ("Travail sérieux et régulier tout au long du trimestre, les résultats sont satisfaisants "
+               "dans l'ensemble. Continuez ainsi. Ok!")
+
+
+def test_raccourcir_reduit_toujours_le_texte():
+    texte = COMMENTAIRE
+    while len(texte) > 1:
+        court = raccourcir(texte, len(texte) - 2)
+        assert len(court) <= len(texte) - 2
+        assert court.count(COUPURE) <= 1
+        texte = court
+
+
+def test_compacter_termine_juste_au_dessus_du_budget(app):
+    # Un commentaire qui finit par une phrase plus courte que la marque de coupure :
+    # le raccourcir d'un token le rallongeait, et la réduction ne s'arrêtait jamais
+    donnees = {'appreciations_matieres': [{'matiere': 'MATHS', 'moyenne': '12', 'commentaire': COMMENTAIRE}]}
+    tokens = estimer_tokens(construire_prompt_utilisateur(PROMPT, 'A', 1, donnees, ''))
+    app.config['PROMPT_BUDGET_TOKENS'] = tokens - 1
+    resultats = []
+
+    def executer():
+        with app.app_context():
+            resultats.append(compacter(PROMPT, PROVIDER, 'A', 1, donnees, {}))
+
+    thread = threading.Thread(target=executer, daemon=True)
+    thread.start()
+    thread.join(5)
+    assert resultats, "compacter ne s'est pas terminé"
+    assert resultats[0].tokens < tokens
+    assert donnees['appreciations_matieres'][0]['commentaire'] == COMMENTAIRE
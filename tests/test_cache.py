@@ -0,0 +1,22 @@
+# tests/test_cache.py
+import cache
+from extensions import db
+from models import AIProvider, Analyse
+from tests.test_jobs import job_flux
+
+REPONSE = "Bon trimestre.\n--- JUSTIFICATIONS ---\n- **Sérieux**"
+
+
+def test_reponse_en_cache_garde_son_fournisseur(client, monkeypatch):
+    # Réponse donnée par un fournisseur de secours (bascule) ou le gagnant d'une course
+    monkeypatch.setattr(cache, 'get_ai_response_ordonnance', lambda provider, *arguments: ('Secours', REPONSE))
+    provider = AIProvider.query.filter_by(is_active=True).one()
+    prompt_utilisateur = "Appréciation de DUPONT Jean."
+    assert cache.get_ai_response_cached(provider, "Tu es un professeur principal.", prompt_utilisateur) == (REPONSE, 'Secours')
+    assert cache.get_ai_response_cached(provider, "Tu es un professeur principal.", prompt_utilisateur) == (REPONSE, 'Secours')
+
+    # Le flux qui retrouve la réponse en cache crédite aussi le bon fournisseur
+    job_id = job_flux(client.classe_id, forcer=False, prompt_utilisateur=prompt_utilisateur)
+    assert 'event: fin' in client.get(f'/jobs/{job_id}/flux').get_data(as_text=True)
+    db.session.expire_all()
+    assert Analyse.query.one().provider_name == 'Secours'
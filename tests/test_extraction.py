@@ -0,0 +1,18 @@
+# tests/test_extraction.py
+import pytest
+from benchmarks.bulletins import MATIERES, pdf_eleve
+from extraction import BACKENDS, extraire_plage
+from parser import ParserBulletin
+
+
+@pytest.mark.parametrize('nom', ['DUPONT Jean', 'MARTIN Léa'])
+def test_moteurs_equivalents(nom):
+    """Le parser dépend du saut de ligne après « Appréciations » : les deux moteurs doivent donner le même texte."""
+    pdf = pdf_eleve(nom)
+    textes = {backend: "\n".join(extraire_plage(pdf, 0, 1, backend)) for backend in BACKENDS}
+    assert textes['pypdfium2'] == textes['pdfplumber']
+    assert "Appréciations\n" in textes['pypdfium2']
+    parser = ParserBulletin(MATIERES)
+    resultats = [parser.analyser(texte, nom) for texte in textes.values()]
+    assert resultats[0] == resultats[1]
+    assert len(resultats[0]['appreciations_matieres']) == len(MATIERES)
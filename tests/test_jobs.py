@@ -0,0 +1,123 @@
+# tests/test_jobs.py
+from datetime import datetime, timedelta
+from extensions import db
+from jobs import CHAMPS_LOURDS, boucle_worker, creer_job, reserver
+from models import AIProvider, Job
+
+
+def job_flux(classe_id, **payload):
+    provider = AIProvider.query.filter_by(is_active=True).one()
+    return creer_job('analyse_flux', dict({
+        'nom_eleve': 'DUPONT Jean', 'trimestre': 1, 'classe_id': classe_id,
+        'donnees_structurees': {'nom_eleve': 'DUPONT Jean', 'appreciations_matieres': []},
+        'prompt_systeme': "Tu es un professeur principal.", 'prompt_utilisateur': "Appréciation de DUPONT Jean.",
+        'prompt_name': 'Bench', 'provider_id': provider.id, 'forcer': True,
+    }, **payload)).id
+
+
+def statut(job_id):
+    db.session.expire_all()
+    return db.session.get(Job, job_id).statut
+
+
+def test_flux_complet(client):
+    job_id = job_flux(client.classe_id)
+    reponse = client.get(f'/jobs/{job_id}/flux')
+    assert 'event: fin' in reponse.get_data(as_text=True)
+    assert statut(job_id) == 'termine'
+
+
+def test_flux_interrompu_remet_la_tache_en_attente(client):
+    job_id = job_flux(client.classe_id)
+    reponse = client.get(f'/jobs/{job_id}/flux', buffered=False)
+    evenements = iter(reponse.response)
+    assert next(evenements).startswith(b'event: appreciation')
+    reponse.close()  # navigateur fermé : GeneratorExit dans le générateur du flux
+    assert statut(job_id) == 'en_attente'
+    # La page rouverte reprend la tâche
+    assert 'event: fin' in client.get(f'/jobs/{job_id}/flux').get_data(as_text=True)
+
+
+def test_flux_jamais_lu_ne_reserve_pas_la_tache(client):
+    job_id = job_flux(client.classe_id)
+    client.get(f'/jobs/{job_id}/flux', buffered=False).close()
+    assert statut(job_id) == 'en_attente'
+
+
+def test_tache_finie_allegee(client):
+    job_id = job_flux(client.classe_id)
+    client.get(f'/jobs/{job_id}/flux').get_data()
+    db.session.expire_all()
+    assert set(db.session.get(Job, job_id).payload).isdisjoint(CHAMPS_LOURDS)
+    assert db.session.get(Job, job_id).payload['nom_eleve'] == 'DUPONT Jean'
+
+
+def test_maintenance_du_worker(client, app):
+    bloquee, ancienne = job_flux(client.classe_id), job_flux(client.classe_id)
+    il_y_a_longtemps = datetime.utcnow() - timedelta(days=30)
+    Job.query.filter_by(id=bloquee).update({'statut': 'en_cours', 'started_at': il_y_a_longtemps})
+    Job.query.filter_by(id=ancienne).update({'statut': 'termine', 'finished_at': il_y_a_longtemps})
+    db.session.commit()
+    boucle_worker(une_fois=True)
+    db.session.expire_all()
+    assert db.session.get(Job, ancienne) is None
+    # Relancée ; récente, l'analyse en flux reste à la page qui l'affichera
+    assert statut(bloquee) == 'en_attente'
+
+
+def test_metriques_de_tous_les_processus(client, app):
+    from metriques import Metriques, metriques_globales
+    from models import MetriquesProcessus
+    for processus in ('worker:1', 'web:2'):
+        autre = Metriques()
+        autre.observer('fournisseur', 0.2, 'Distant', 'bench')
+        autre.tokens('Distant', 'bench', 10, 5)
+        MetriquesProcessus.enregistrer(processus, autre.etat())
+    exposition = client.get('/metrics').get_data(as_text=True)
+    assert 'appreciations_tokens_total{fournisseur="Distant",modele="bench",sens="entree"} 20' in exposition
+    etapes = {(e['etape'], e['fournisseur']): e for e in metriques_globales().resume()}
+    assert etapes[('fournisseur', 'Distant')]['nb'] == 2
+    # Le processus qui répond a publié les siennes : le total ne dépend pas de lui
+    assert MetriquesProcessus.query.count() == 3
+    assert exposition == client.get('/metrics').get_data(as_text=True)
+
+
+def test_worker_publie_ses_metriques(client, app):
+    from models import MetriquesProcessus
+    job_flux(client.classe_id)
+    boucle_worker(une_fois=True)
+    assert MetriquesProcessus.query.count() == 1
+
+
+def test_flux_refuse_les_autres_taches(client):
+    export = creer_job('export', {'classes': [client.classe_id], 'trimestres': [1]}).id
+    assert client.get(f'/jobs/{export}/flux').status_code == 404
+    assert statut(export) == 'en_attente'
+    assert reserver(export, 'analyse_flux') is None
+    assert statut(export) == 'en_attente'
+
+
+def test_flux_bascule_sur_erreur_du_fournisseur(client, app, fournisseur_en_panne):
+    from models import Analyse
+    panne = AIProvider(name='En panne', api_key='test', model_name='faux')
+    db.session.add(panne)
+    db.session.commit()
+    app.config.update(PROVIDER_MAX_TENTATIVES=2, PROVIDER_BASCULE=True)
+    job_id = job_flux(client.classe_id, provider_id=panne.id)
+    assert 'event: fin' in client.get(f'/jobs/{job_id}/flux').get_data(as_text=True)
+    assert fournisseur_en_panne.stats['erreurs_500'] == 2
+    assert Analyse.query.one().provider_name == 'Local'
+
+
+def test_tache_longue_qui_progresse_pas_relancee(client, app):
+    from jobs import relancer_jobs_bloques
+    export = creer_job('export', {'classes': [client.classe_id], 'trimestres': [1]}).id
+    il_y_a_longtemps = datetime.utcnow() - timedelta(hours=1)
+    Job.query.filter_by(id=export).update({'statut': 'en_cours', 'started_at': il_y_a_longtemps, 'signe_de_vie': datetime.utcnow()})
+    db.session.commit()
+    assert relancer_jobs_bloques() == 0
+    assert statut(export) == 'en_cours'
+    Job.query.filter_by(id=export).update({'signe_de_vie': il_y_a_longtemps})
+    db.session.commit()
+    assert relancer_jobs_bloques() == 1
+    assert statut(export) == 'en_attente'
@@ -0,0 +1,66 @@
+# tests/test_migrations.py
+import json
+import pytest
+from sqlalchemy import inspect, text
+import migrations
+from extensions import db
+from migrations import VERSION_SCHEMA, mettre_a_jour
+from models import Analyse, Classe, Compteur, TexteBulletin
+
+TEXTE = "Bulletin de DUPONT Jean\nAppréciations\nMATHS 12,00 bien\nMoyenne générale 12,00"
+
+
+def base_version_2(nb_analyses):
+    """Base telle qu'avant la migration 3 : données du parser et texte brut dans analyse.donnees_brutes."""
+    classe = Classe(annee_scolaire='2024-2025', nom_classe='Test')
+    db.session.add(classe)
+    db.session.commit()
+    with db.engine.begin() as connexion:
+        connexion.execute(text('ALTER TABLE analyse ADD COLUMN donnees_brutes JSON'))
+        for i in range(nb_analyses):
+            connexion.execute(text(
+                'INSERT INTO analyse (nom_eleve, trimestre, classe_id, donnees_brutes) VALUES (:nom, 1, :classe, :donnees)'
+            ), {'nom': f"Élève {i}", 'classe': classe.id, 'donnees': json.dumps({'moyenne_generale': '12.00', 'texte_brut': TEXTE})})
+    Compteur.query.filter_by(nom=VERSION_SCHEMA).update({'valeur': 2})
+    db.session.commit()
+
+
+def colonnes_analyse():
+    return {c['name'] for c in inspect(db.engine).get_columns('analyse')}
+
+
+def test_textes_bulletins(app):
+    base_version_2(3)
+    mettre_a_jour(journal=lambda message: None)
+    assert 'donnees_brutes' not in colonnes_analyse()
+    assert TexteBulletin.query.count() == 1
+    assert [a.donnees_brutes for a in Analyse.query.all()] == [{'moyenne_generale': '12.00', 'texte_brut': TEXTE}] * 3
+
+
+def test_textes_bulletins_copie_incomplete(app, monkeypatch):
+    base_version_2(2)
+    # Texte perdu pendant la copie : l'ancienne colonne ne doit pas être supprimée
+    monkeypatch.setattr(migrations.TexteBulletin, 'enregistrer', staticmethod(lambda texte: 'absente'))
+    with pytest.raises(RuntimeError):
+        mettre_a_jour(journal=lambda message: None)
+    db.session.rollback()
+    assert 'donnees_brutes' in colonnes_analyse()
+    assert Compteur.lire(VERSION_SCHEMA) == 2
+
+
+def test_textes_orphelins(app):
+    classe = Classe(annee_scolaire='2024-2025', nom_classe='Test')
+    db.session.add(classe)
+    db.session.flush()
+    gardee, supprimee = (Analyse(nom_eleve=nom, trimestre=1, classe_id=classe.id) for nom in ('A', 'B'))
+    gardee.donnees_brutes = {'texte_brut': TEXTE}
+    supprimee.donnees_brutes = {'texte_brut': TEXTE + " (autre)"}
+    db.session.add_all([gardee, supprimee])
+    db.session.commit()
+    db.session.delete(supprimee)
+    db.session.commit()
+    # Textes récents gardés (analyse peut-être en cours d'enregistrement)
+    assert TexteBulletin.purger_orphelins() == 0
+    assert TexteBulletin.purger_orphelins(marge=-60) == 1
+    db.session.commit()
+    assert [t.texte for t in TexteBulletin.query.all()] == [TEXTE]
@@ -0,0 +1,35 @@
+# tests/test_models.py
+import threading
+from extensions import db
+from models import Compteur
+
+
+def test_compteur_cree_en_concurrence(app):
+    depart = threading.Barrier(8)
+    erreurs = []
+
+    def incrementer():
+        with app.app_context():
+            try:
+                depart.wait()
+                Compteur.incrementer('test_concurrence')
+                db.session.commit()
+            except Exception as e:
+                erreurs.append(e)
+            finally:
+                db.session.remove()
+
+    threads = [threading.Thread(target=incrementer) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not erreurs
+    assert Compteur.lire('test_concurrence') == 8
+
+
+def test_compteur_incremente(app):
+    Compteur.incrementer('test', 2)
+    Compteur.incrementer('test', 3)
+    db.session.commit()
+    assert Compteur.lire('test') == 5
@@ -0,0 +1,149 @@
+# tests/test_ordonnanceur.py
+import asyncio
+import time
+import pytest
+from extensions import db
+from models import AIProvider, LimiteFournisseur
+from ordonnanceur import (Ordonnanceur, aouvrir_flux, config_reprises, delai_reprise, est_reessayable,
+                          get_ai_response_course, get_ai_response_ordonnance, ordonnanceur, ouvrir_flux,
+                          preparer_participants)
+from providers import get_ai_response
+
+SYSTEME, UTILISATEUR = "Tu es un professeur principal.", "Appréciation de DUPONT Jean."
+
+
+@pytest.fixture
+def court():
+    """Ordonnanceur à fenêtre de 0,3 s : les places se libèrent pendant le test."""
+    instance = Ordonnanceur()
+    instance.FENETRE = 0.3
+    return instance
+
+
+def test_budget_de_requetes(court):
+    debut = time.monotonic()
+    court.attendre(1, 10, rpm=2)
+    court.attendre(1, 10, rpm=2)
+    assert time.monotonic() - debut < 0.1
+    court.attendre(1, 10, rpm=2)
+    assert time.monotonic() - debut >= 0.25
+    assert court.usage()[1]['requetes'] == 1  # les deux premiers sont sortis de la fenêtre
+    # Chaque fournisseur a son propre budget
+    court.attendre(2, 10, rpm=2)
+    assert court.usage()[2]['requetes'] == 1
+
+
+def test_budget_de_tokens(court):
+    debut = time.monotonic()
+    court.attendre(1, 60, tpm=100)
+    court.attendre(1, 60, tpm=100)
+    assert time.monotonic() - debut >= 0.25
+    # Un appel plus gros que tout le budget passe seul
+    court.attendre(2, 500, tpm=100)
+    assert court.usage()[2]['tokens'] == 500
+
+
+def test_attente_maximale(court):
+    court.attendre(1, 10, rpm=1)
+    with pytest.raises(TimeoutError):
+        court.attendre(1, 10, rpm=1, attente_max=0.05)
+
+
+def test_attente_asynchrone(court):
+    async def scenario():
+        debut = time.monotonic()
+        await asyncio.gather(*(court.aattendre(1, 10, rpm=2) for _ in range(3)))
+        return time.monotonic() - debut
+
+    assert asyncio.run(scenario()) >= 0.25
+    assert court.usage()[1]['requetes'] == 1
+
+
+def erreur_de(app, fournisseur):
+    provider = AIProvider.query.filter_by(is_active=True).one()
+    try:
+        get_ai_response(provider, SYSTEME, UTILISATEUR)
+    except Exception as e:
+        return e
+    raise AssertionError("aucune erreur")
+
+
+def test_retry_after(client, app, fournisseur):
+    fournisseur.rpm = 1
+    provider = AIProvider.query.filter_by(is_active=True).one()
+    get_ai_response(provider, SYSTEME, UTILISATEUR)
+    erreur = erreur_de(app, fournisseur)
+    assert est_reessayable(erreur)
+    assert delai_reprise(erreur, 0) == 1.0  # en-tête Retry-After du faux fournisseur
+    app.config['PROVIDER_BACKOFF_MAX'] = 0.5
+    assert delai_reprise(erreur, 0) == 0.5
+
+
+def test_reprises_puis_bascule(client, app, fournisseur, fournisseur_en_panne):
+    panne = AIProvider(name='En panne', api_key='test', model_name='faux')
+    db.session.add(panne)
+    db.session.commit()
+    app.config['PROVIDER_MAX_TENTATIVES'] = 3
+
+    with pytest.raises(Exception) as erreur:
+        get_ai_response_ordonnance(panne, SYSTEME, UTILISATEUR)
+    assert est_reessayable(erreur.value)
+    assert fournisseur_en_panne.stats['erreurs_500'] == 3
+
+    app.config['PROVIDER_BASCULE'] = True
+    nom, reponse = get_ai_response_ordonnance(panne, SYSTEME, UTILISATEUR)
+    assert nom == 'Local' and reponse == fournisseur.reponse
+    assert fournisseur_en_panne.stats['erreurs_500'] == 6
+
+
+def test_course_par_l_ordonnanceur(client, app, fournisseur, fournisseur_en_panne):
+    local = AIProvider.query.filter_by(is_active=True).one()
+    panne = AIProvider(name='En panne', api_key='test', model_name='faux')
+    db.session.add_all([panne, LimiteFournisseur(provider_id=local.id, rpm=5)])
+    db.session.commit()
+    app.config['PROVIDER_MAX_TENTATIVES'] = 2
+
+    # Chaque participant réserve sa place dans le budget de son fournisseur
+    assert get_ai_response_course([local, panne], SYSTEME, UTILISATEUR)[0] == 'Local'
+    usage = ordonnanceur.usage()
+    assert usage[local.id]['requetes'] == 1 and usage[panne.id]['requetes'] >= 1
+
+    # Le fournisseur en panne est réessayé avant que la course soit perdue
+    with pytest.raises(ValueError):
+        get_ai_response_course([panne], SYSTEME, UTILISATEUR)
+    assert ordonnanceur.usage()[panne.id]['requetes'] >= 3
+
+
+def test_flux_reprises_puis_bascule(client, app, fournisseur, fournisseur_en_panne):
+    panne = AIProvider(name='En panne', api_key='test', model_name='faux')
+    db.session.add(panne)
+    db.session.commit()
+    app.config['PROVIDER_MAX_TENTATIVES'] = 3
+
+    with pytest.raises(Exception) as erreur:
+        ouvrir_flux(panne, SYSTEME, UTILISATEUR)
+    assert est_reessayable(erreur.value)
+    assert fournisseur_en_panne.stats['erreurs_500'] == 3
+
+    app.config['PROVIDER_BASCULE'] = True
+    nom, fragments = ouvrir_flux(panne, SYSTEME, UTILISATEUR)
+    assert nom == 'Local' and "".join(fragments) == fournisseur.reponse
+    assert fournisseur_en_panne.stats['erreurs_500'] == 6
+
+
+def test_flux_asynchrone_reprises_puis_bascule(client, app, fournisseur, fournisseur_en_panne):
+    local = AIProvider.query.filter_by(is_active=True).one()
+    panne = AIProvider(name='En panne', api_key='test', model_name='faux')
+    db.session.add(panne)
+    db.session.commit()
+    app.config['PROVIDER_MAX_TENTATIVES'] = 2
+
+    async def lire(ordre):
+        nom, fragments = await aouvrir_flux(ordre, SYSTEME, UTILISATEUR, config_reprises(), app.logger)
+        return nom, "".join([fragment async for fragment in fragments])
+
+    with pytest.raises(Exception):
+        asyncio.run(lire(preparer_participants([panne], SYSTEME, UTILISATEUR)))
+    assert fournisseur_en_panne.stats['erreurs_500'] == 2
+    assert asyncio.run(lire(preparer_participants([panne, local], SYSTEME, UTILISATEUR))) == ('Local', fournisseur.reponse)
+    assert fournisseur_en_panne.stats['erreurs_500'] == 4
@@ -0,0 +1,44 @@
+# tests/test_parser.py
+import random
+import re
+import pytest
+from parser import ParserBulletin, motif_trie
+
+TABLEAU = "ANGLAIS LV1 15,00 bien Mme DURAND ANGLAIS 12,00 assez bien MATHS EXPERTES 14,00 bon travail MATHS 9,50 fragile"
+
+
+def alternance(mots):
+    """Le motif d'origine : les matières dans l'ordre de la liste."""
+    return "|".join(re.escape(m) for m in mots)
+
+
+@pytest.mark.parametrize('matieres', [
+    ['ANGLAIS', 'ANGLAIS LV1', 'MATHS', 'MATHS EXPERTES'],
+    ['ANGLAIS LV1', 'ANGLAIS', 'MATHS EXPERTES', 'MATHS'],
+    ['MATHS', 'ANGLAIS LV1', 'MATHS EXPERTES', 'ANGLAIS', 'M'],
+])
+def test_matieres_prefixes_comme_l_alternance(matieres):
+    assert re.split(motif_trie(matieres), TABLEAU) == re.split(alternance(matieres), TABLEAU)
+
+
+def test_premiere_matiere_de_la_liste_l_emporte():
+    assert re.split(motif_trie(['ANGLAIS', 'ANGLAIS LV1']), "ANGLAIS LV1 bien ")[1:] == [' LV1 bien ']
+    assert re.split(motif_trie(['ANGLAIS LV1', 'ANGLAIS']), "ANGLAIS LV1 bien ")[1:] == [' bien ']
+
+
+def test_listes_aleatoires():
+    alea = random.Random(7)
+    for _ in range(300):
+        mots = ["".join(alea.choice("AB .") for _ in range(alea.randint(1, 4))) for _ in range(alea.randint(1, 6))]
+        texte = "".join(alea.choice("AB .x") for _ in range(40))
+        assert re.split(motif_trie(mots), texte) == re.split(alternance(mots), texte), mots
+
+
+def test_analyse_d_un_bulletin():
+    texte = f"Bulletin\nAppréciations\n{TABLEAU}\nMoyenne générale 12,50\nAppréciation globale : Bon trimestre.\nMentions"
+    donnees = ParserBulletin(['ANGLAIS LV1', 'ANGLAIS', 'MATHS EXPERTES', 'MATHS']).analyser(texte, 'DUPONT Jean')
+    assert donnees['moyenne_generale'] == '12.50'
+    assert [(m['matiere'], m['moyenne'], m['commentaire']) for m in donnees['appreciations_matieres']] == [
+        ('ANGLAIS LV1', '15.00', 'bien'), ('ANGLAIS', '12.00', 'assez bien'),
+        ('MATHS EXPERTES', '14.00', 'bon travail'), ('MATHS', '9.50', 'fragile'),
+    ]
@@ -0,0 +1,20 @@
+# tests/test_pipeline.py
+from pipeline import _trouver_eleve
+
+ELEVES = ['MARTIN Léa', 'MARTIN Léane', 'DUPONT Jean']
+
+
+def test_nom_en_mots_entiers():
+    assert _trouver_eleve("Bulletin du 1er trimestre\nÉlève : MARTIN Léane\nClasse : 2nde 3", ELEVES) == 'MARTIN Léane'
+    assert _trouver_eleve("Élève : MARTIN Léa\nClasse : 2nde 3", ELEVES) == 'MARTIN Léa'
+    assert _trouver_eleve("Élève : MARTIN Léanne", ELEVES) is None
+
+
+def test_nom_le_plus_long():
+    # L'ordre de la liste ne compte plus : le nom le plus long trouvé l'emporte
+    assert _trouver_eleve("MARTIN LEANE", ['MARTIN Léane', 'MARTIN Léa']) == 'MARTIN Léane'
+    assert _trouver_eleve("JEAN-PIERRE DUPONT", ['JEAN DUPONT', 'PIERRE DUPONT', 'JEAN-PIERRE DUPONT']) == 'JEAN-PIERRE DUPONT'
+
+
+def test_nom_de_fichier():
+    assert _trouver_eleve("bulletin MARTIN Leane T1 pdf", ELEVES) == 'MARTIN Léane'
@@ -0,0 +1,28 @@
+# tests/test_providers.py
+import httpx
+import mistralai.async_client
+import mistralai.client
+import pytest
+from extensions import db
+from models import AIProvider
+from providers import clients, provider_pour
+
+
+@pytest.mark.parametrize('asynchrone', [False, True])
+def test_client_mistral_sur_le_pool(app, monkeypatch, asynchrone):
+    crees = []
+    module, classe = (mistralai.async_client, httpx.AsyncClient) if asynchrone else (mistralai.client, httpx.Client)
+
+    class Suivi(classe):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            crees.append(self)
+
+    monkeypatch.setattr(module, 'AsyncClient' if asynchrone else 'Client', Suivi)
+    provider = AIProvider(name='Mistral', api_key='test', model_name='mistral-small')
+    db.session.add(provider)
+    db.session.commit()
+    client = clients.obtenir(provider_pour(provider), asynchrone=asynchrone)
+    # Le client httpx ouvert par le SDK est fermé, celui du pool le remplace
+    assert len(crees) == 1 and crees[0].is_closed
+    assert client._client is not crees[0] and isinstance(client._client, classe)
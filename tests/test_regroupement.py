@@ -0,0 +1,53 @@
+# tests/test_regroupement.py
+import json
+import cache
+from extensions import db
+from models import AIProvider, Prompt, ReponseCache
+from regroupement import generer_paquet
+
+PAQUET = [
+    (nom, {'appreciations_matieres': [{'matiere': 'MATHS', 'moyenne': '12', 'commentaire': "Bon travail."}]}, "")
+    for nom in ('DUPONT Jean', 'MARTIN Léa')
+]
+
+
+def actifs():
+    return AIProvider.query.filter_by(is_active=True).one(), Prompt.query.filter_by(is_active=True).one()
+
+
+def test_paquet_en_mode_course(client, app, fournisseur):
+    db.session.add(AIProvider(name='Local bis', api_key='test', model_name='faux'))
+    db.session.commit()
+    app.config['COURSE_FOURNISSEURS'] = ['*']
+    provider, prompt = actifs()
+    reponses = generer_paquet(provider, prompt, 1, PAQUET)
+    # La réponse groupée (tableau JSON, sans séparateur) gagne la course au premier appel
+    assert set(reponses) == {'DUPONT Jean', 'MARTIN Léa'}
+    assert fournisseur.stats['requetes'] <= 2
+    assert ReponseCache.query.count() == 1
+
+
+def test_paquet_incomplet_pas_mis_en_cache(client, monkeypatch):
+    partielle = json.dumps([{'numero': 1, 'appreciation': "Bon trimestre.", 'justifications': ""}])
+    monkeypatch.setattr(cache, 'get_ai_response_ordonnance', lambda provider, *arguments: (provider.name, partielle))
+    provider, prompt = actifs()
+    assert set(generer_paquet(provider, prompt, 1, PAQUET)) == {'DUPONT Jean'}
+    assert ReponseCache.query.count() == 0
+
+
+def test_classe_entiere_en_parallele(client, app, fournisseur):
+    import io
+    from benchmarks.bulletins import MATIERES, pdf_classe
+    from models import Analyse, LimiteFournisseur
+    provider, _ = actifs()
+    # Le budget du fournisseur est lu par chaque thread du pool, dans sa propre session
+    db.session.add(LimiteFournisseur(provider_id=provider.id, rpm=100))
+    db.session.commit()
+    app.config.update(BATCH_MAX_WORKERS=2, PACK_ELEVES_MAX=1)
+    client.post('/', data={'classe_id': str(client.classe_id)})
+    reponse = client.post('/analyser/classe', data={
+        'trimestre': '1', 'forcer': '1',
+        'bulletins_classe': (io.BytesIO(pdf_classe(['DUPONT Jean', 'MARTIN Léa'], MATIERES, 1)), 'classe.pdf'),
+    }, content_type='multipart/form-data')
+    assert reponse.status_code == 200
+    assert sorted(a.nom_eleve for a in Analyse.query.all()) == ['DUPONT Jean', 'MARTIN Léa']
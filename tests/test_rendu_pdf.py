@@ -0,0 +1,15 @@
+# tests/test_rendu_pdf.py
+import rendu_pdf
+from rendu_pdf import ecrire_cache, lire_cache
+
+
+def test_lecture_du_cache_pendant_une_eviction(app, monkeypatch):
+    ecrire_cache('cle', b'%PDF-1.4')
+
+    def evince(chemin):
+        raise FileNotFoundError(chemin)
+
+    # Fichier supprimé par un autre processus entre la lecture et la mise à jour de sa date
+    monkeypatch.setattr(rendu_pdf.os, 'utime', evince)
+    assert lire_cache('cle') == b'%PDF-1.4'
+    assert lire_cache('absente') is None
@@ -0,0 +1,30 @@
+# tests/test_requetes.py
+from datetime import datetime, timedelta
+from extensions import db
+from models import Analyse, Classe, Eleve
+from requetes import versions_precedentes
+
+
+def test_versions_precedentes_limitees_a_la_classe(app):
+    classe, autre = Classe(annee_scolaire='2024-2025', nom_classe='A'), Classe(annee_scolaire='2024-2025', nom_classe='B')
+    db.session.add_all([classe, autre])
+    db.session.flush()
+    eleve = Eleve(classe_id=classe.id, nom='DUPONT Jean', position=0)
+    db.session.add(eleve)
+    db.session.flush()
+    debut = datetime.utcnow()
+    db.session.add_all([
+        Analyse(nom_eleve=eleve.nom, eleve_id=eleve.id, trimestre=1, classe_id=classe.id, created_at=debut + timedelta(minutes=i))
+        for i in range(3)
+    ])
+    db.session.commit()
+    assert len(versions_precedentes(classe.id, eleve.id, 1)) == 2
+    assert versions_precedentes(autre.id, eleve.id, 1) == []
+
+
+def test_statistiques_des_classes_affichees(client):
+    db.session.add(Analyse(nom_eleve='DUPONT Jean', trimestre=1, classe_id=client.classe_id))
+    db.session.commit()
+    for page in ('/', '/historique'):
+        html = client.get(page).get_data(as_text=True)
+        assert '1 analyse(s)' in html and f'/historique/{client.classe_id}"' in html